@@ -0,0 +1,302 @@
+import calendar
+import json
+import logging
+import os
+import shutil
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config import (ARCHIVE_BLOCK_MESSAGES, ARCHIVE_COMPRESSION_LEVEL, ARCHIVE_DIR, ARCHIVE_RETENTION_DAYS,
+                    shard_path)
+from durability import durable_writer
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Segment dosyası: art arda sıkıştırılmış bloklar, gün kapanınca sonuna blok tablosu (footer) eklenir.
+#   blok:    BLOCK_HEADER (magic, sıkıştırılmış uzunluk, ilk/son zaman, mesaj sayısı) + zlib(JSONL)
+#   kapanış: JSON blok tablosu + TRAILER (magic, tablonun dosyadaki konumu)
+BLOCK_MAGIC = b"KBLK"
+BLOCK_HEADER = struct.Struct("<4sIddI")
+TRAILER_MAGIC = b"KIDX"
+TRAILER = struct.Struct("<4sQ")
+SEGMENT_SUFFIX = ".seg"
+
+BlockEntry = Tuple[int, float, float, int]  # (konum, ilk zaman, son zaman, mesaj sayısı)
+
+
+def segment_day(timestamp: float) -> str:
+    """Mesajın ait olduğu günlük segmentin adı (UTC tarih)."""
+    return time.strftime("%Y-%m-%d", time.gmtime(timestamp))
+
+
+def day_start(day: str) -> float:
+    return float(calendar.timegm(time.strptime(day, "%Y-%m-%d")))
+
+
+class MessageArchive:
+    """Sıcak hafızadan düşen mesajların sıkıştırılmış, günlere bölünmüş arşivi.
+
+    Her sohbetin klasöründe günlük segmentler bulunur. Mesajlar segmente
+    yalnızca sonuna blok eklenerek yazılır; gün geçince segment, blokların
+    konum ve zaman aralıklarını tutan küçük bir tabloyla kapatılır. Aralık
+    okumaları yalnızca kesişen segment ve blokları açar ve mesajları tek tek
+    üretir, arşiv belleğe yüklenmez.
+
+    Bir sohbetin yazmaları (ekleme, birleştirme, silme) o sohbetin kilidiyle
+    sıralanır; iş parçacığı havuzunda çalışan yeniden yazmalarla event
+    loop'taki eklemeler aynı segmente aynı anda yazmaz, başka sohbetlere
+    eklemeler ise beklemez. Eklemeler DURABILITY_MODE `none` değilse fsync'lenir.
+    """
+
+    def __init__(self, archive_dir: str = None):
+        self.archive_dir = archive_dir or shard_path(ARCHIVE_DIR)
+        self.sealed_through: Dict[str, str] = {}  # sohbet -> kapatılmış son gün kontrolü
+        self.locks: Dict[str, threading.Lock] = {}  # sohbet -> yazma kilidi
+        self.locks_guard = threading.Lock()
+
+    def _lock(self, chat_key: str) -> threading.Lock:
+        with self.locks_guard:
+            lock = self.locks.get(chat_key)
+            if lock is None:
+                lock = self.locks[chat_key] = threading.Lock()
+            return lock
+
+    def _chat_dir(self, chat_key: str) -> str:
+        return os.path.join(self.archive_dir, chat_key)
+
+    def _segments(self, chat_key: str) -> List[str]:
+        """Sohbetin segment günlerini eskiden yeniye döndürür."""
+        chat_dir = self._chat_dir(chat_key)
+        if not os.path.isdir(chat_dir):
+            return []
+        return sorted(name[:-len(SEGMENT_SUFFIX)] for name in os.listdir(chat_dir) if name.endswith(SEGMENT_SUFFIX))
+
+    def _segment_path(self, chat_key: str, day: str) -> str:
+        return os.path.join(self._chat_dir(chat_key), f"{day}{SEGMENT_SUFFIX}")
+
+    @staticmethod
+    def _footer_offset(f) -> Optional[int]:
+        """Segment kapatılmışsa blok tablosunun konumunu döndürür."""
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size < TRAILER.size:
+            return None
+        f.seek(size - TRAILER.size)
+        magic, offset = TRAILER.unpack(f.read(TRAILER.size))
+        return offset if magic == TRAILER_MAGIC else None
+
+    @staticmethod
+    def _scan_blocks(f, end: int = None) -> List[BlockEntry]:
+        """Blok başlıklarını sırayla okuyarak (açmadan) blok tablosunu çıkarır."""
+        blocks = []
+        size = f.seek(0, os.SEEK_END) if end is None else end
+        offset = 0
+        while offset + BLOCK_HEADER.size <= size:
+            f.seek(offset)
+            magic, length, first, last, count = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+            # Yarım yazılmış son blok tabloya alınmaz
+            if magic != BLOCK_MAGIC or offset + BLOCK_HEADER.size + length > size:
+                break
+            blocks.append((offset, first, last, count))
+            offset += BLOCK_HEADER.size + length
+        return blocks
+
+    @staticmethod
+    def _blocks_end(f, blocks: List[BlockEntry]) -> int:
+        """Son geçerli bloğun bittiği konum."""
+        if not blocks:
+            return 0
+        f.seek(blocks[-1][0])
+        _, length, _, _, _ = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+        return blocks[-1][0] + BLOCK_HEADER.size + length
+
+    def _read_index(self, f) -> List[BlockEntry]:
+        footer = self._footer_offset(f)
+        if footer is None:
+            return self._scan_blocks(f)
+        size = f.seek(0, os.SEEK_END) - TRAILER.size - footer
+        f.seek(footer)
+        return [tuple(entry) for entry in json.loads(f.read(size))]
+
+    @staticmethod
+    def _read_block(f, offset: int) -> List[Dict[str, Any]]:
+        f.seek(offset)
+        _, length, _, _, _ = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+        lines = zlib.decompress(f.read(length)).decode('utf-8').splitlines()
+        return [json.loads(line) for line in lines]
+
+    @staticmethod
+    def _write_blocks(f, messages: List[Dict[str, Any]]):
+        for start in range(0, len(messages), ARCHIVE_BLOCK_MESSAGES):
+            block = messages[start:start + ARCHIVE_BLOCK_MESSAGES]
+            payload = zlib.compress(
+                "\n".join(json.dumps(message, ensure_ascii=False) for message in block).encode('utf-8'),
+                ARCHIVE_COMPRESSION_LEVEL,
+            )
+            f.write(BLOCK_HEADER.pack(BLOCK_MAGIC, len(payload), block[0]["timestamp"], block[-1]["timestamp"], len(block)))
+            f.write(payload)
+
+    def _seal(self, path: str):
+        """Segmentin sonuna blok tablosunu ve kapanış kaydını ekler."""
+        with open(path, 'r+b') as f:
+            if self._footer_offset(f) is not None:
+                return
+            blocks = self._scan_blocks(f)
+            # Yarım yazılmış son blok varsa atılır
+            end = self._blocks_end(f, blocks)
+            f.truncate(end)
+            f.seek(end)
+            f.write(json.dumps(blocks).encode('utf-8'))
+            f.write(TRAILER.pack(TRAILER_MAGIC, end))
+
+    def _seal_older(self, chat_key: str, today: str):
+        """Bugünden eski açık segmentleri kapatır, saklama süresini aşanları siler."""
+        if self.sealed_through.get(chat_key) == today:
+            return
+        cutoff = segment_day(time.time() - ARCHIVE_RETENTION_DAYS * 86400) if ARCHIVE_RETENTION_DAYS else None
+        for day in self._segments(chat_key):
+            path = self._segment_path(chat_key, day)
+            if cutoff and day < cutoff:
+                os.remove(path)
+            elif day < today:
+                self._seal(path)
+        self.sealed_through[chat_key] = today
+
+    def _append_day(self, path: str, day: str, today: str, messages: List[Dict[str, Any]]):
+        """Mesajları segmentin sonuna sıkıştırılmış bloklar olarak ekler."""
+        with open(path, 'a+b') as f:
+            footer = self._footer_offset(f)
+            if footer is not None:
+                # Kapatılmış güne geç gelen mesaj: tablo atılır, aşağıda yeniden kapatılır
+                f.truncate(footer)
+            else:
+                # Önceki bir çökmeden kalan yarım blok varsa üzerine yazılır
+                end = self._blocks_end(f, self._scan_blocks(f))
+                if end != f.seek(0, os.SEEK_END):
+                    f.truncate(end)
+            self._write_blocks(f, messages)
+            if durable_writer.mode != "none":
+                f.flush()
+                os.fsync(f.fileno())
+        if day < today and footer is not None:
+            self._seal(path)
+
+    def _rewrite_day(self, path: str, day: str, today: str, messages: List[Dict[str, Any]]):
+        """Segmenti verilen mesajlarla baştan yazar (mesaj kalmadıysa siler)."""
+        if not messages:
+            os.remove(path)
+            return
+        temporary = f"{path}.tmp"
+        with open(temporary, 'wb') as f:
+            self._write_blocks(f, messages)
+        os.replace(temporary, path)
+        if day < today:
+            self._seal(path)
+
+    def _read_day(self, path: str) -> List[Dict[str, Any]]:
+        with open(path, 'rb') as f:
+            return [message for offset, _, _, _ in self._read_index(f) for message in self._read_block(f, offset)]
+
+    def _last_timestamp(self, path: str) -> Optional[float]:
+        """Segmentteki son mesajın zamanı (bloklar açılmadan); segment yoksa None."""
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            blocks = self._read_index(f)
+        return max(last for _, _, last, _ in blocks) if blocks else None
+
+    @staticmethod
+    def _by_day(messages: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        by_day: Dict[str, List[Dict[str, Any]]] = {}
+        for message in messages:
+            by_day.setdefault(segment_day(message["timestamp"]), []).append(message)
+        return by_day
+
+    def append(self, chat_key: str, messages: List[Dict[str, Any]]):
+        """Mesajları (zaman sıralı) günlük segmentlerin sonuna sıkıştırılmış bloklar olarak ekler."""
+        if not messages:
+            return
+        with self._lock(chat_key), metrics.timer("archive"):
+            os.makedirs(self._chat_dir(chat_key), exist_ok=True)
+            today = segment_day(time.time())
+            for day, day_messages in self._by_day(messages).items():
+                self._append_day(self._segment_path(chat_key, day), day, today, day_messages)
+            self._seal_older(chat_key, today)
+
+    def merge(self, chat_key: str, messages: List[Dict[str, Any]]):
+        """Mesajları (zaman sıralı) arşive zaman sırasını bozmadan ekler.
+
+        Segmentin son mesajından eski mesaj gelen günler mevcut mesajlarla
+        birleştirilip sıralı olarak yeniden yazılır; diğer günlere yalnızca
+        ekleme yapılır. İçe aktarımda kullanılır.
+        """
+        if not messages:
+            return
+        with self._lock(chat_key), metrics.timer("archive"):
+            os.makedirs(self._chat_dir(chat_key), exist_ok=True)
+            today = segment_day(time.time())
+            for day, day_messages in self._by_day(messages).items():
+                path = self._segment_path(chat_key, day)
+                last = self._last_timestamp(path)
+                if last is None or last <= day_messages[0]["timestamp"]:
+                    self._append_day(path, day, today, day_messages)
+                else:
+                    merged = sorted(self._read_day(path) + day_messages, key=lambda message: message["timestamp"])
+                    self._rewrite_day(path, day, today, merged)
+            self._seal_older(chat_key, today)
+
+    def iter_messages(self, chat_key: str, since: float = None, until: float = None) -> Iterator[Dict[str, Any]]:
+        """[since, until) aralığındaki arşiv mesajlarını eskiden yeniye üretir."""
+        for day in self._segments(chat_key):
+            start = day_start(day)
+            if (since is not None and start + 86400 <= since) or (until is not None and start >= until):
+                continue
+            try:
+                f = open(self._segment_path(chat_key, day), 'rb')
+            except FileNotFoundError:
+                continue  # Okuma sırasında silinmiş
+            with f:
+                for offset, first, last, _ in self._read_index(f):
+                    if (since is not None and last < since) or (until is not None and first >= until):
+                        continue
+                    for message in self._read_block(f, offset):
+                        if (since is None or message["timestamp"] >= since) and (until is None or message["timestamp"] < until):
+                            yield message
+
+    def remove_chat(self, chat_key: str):
+        """Sohbetin tüm arşivini siler."""
+        with self._lock(chat_key):
+            shutil.rmtree(self._chat_dir(chat_key), ignore_errors=True)
+            self.sealed_through.pop(chat_key, None)
+
+    def remove_user(self, chat_key: str, user_id: int):
+        """Kullanıcının mesajlarını sohbet arşivinden çıkarır (segmentler yeniden yazılır)."""
+        with self._lock(chat_key):
+            today = segment_day(time.time())
+            for day in self._segments(chat_key):
+                path = self._segment_path(chat_key, day)
+                messages = self._read_day(path)
+                kept = [message for message in messages if message["user_id"] != user_id]
+                if len(kept) != len(messages):
+                    self._rewrite_day(path, day, today, kept)
+
+    def get_stats(self) -> Dict[str, Any]:
+        segments, size = 0, 0
+        if os.path.isdir(self.archive_dir):
+            for chat_key in os.listdir(self.archive_dir):
+                chat_dir = self._chat_dir(chat_key)
+                for name in os.listdir(chat_dir):
+                    if name.endswith(SEGMENT_SUFFIX):
+                        segments += 1
+                        size += os.path.getsize(os.path.join(chat_dir, name))
+        return {"segments": segments, "bytes": size}
+
+
+# Global message archive instance
+message_archive = MessageArchive()
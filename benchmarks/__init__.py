@@ -0,0 +1 @@
+"""Depolama ve tercih algılama mikro benchmark'ları."""
@@ -0,0 +1,93 @@
+"""Arşiv segmentleri: yazma hızı, sıkıştırma oranı ve aralık okuma süresi/belleği.
+
+Bir sohbete günlere yayılmış sentetik mesajları ARCHIVE_BATCH_MESSAGES'lık
+partiler halinde arşivler, sonra 24 saat ve 7 günlük aralıkları akış halinde
+okur. Aralık okumasında tracemalloc tepe değeri, okunan verinin boyutuyla
+karşılaştırılır (arşiv belleğe yüklenmemeli).
+
+Kullanım:
+    python -m benchmarks.bench_archive --days 30 --messages-per-day 5000
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_storage import make_message
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Arşiv benchmark'ı")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--messages-per-day", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Sonuçların yazılacağı JSON dosyası")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output) if args.output else None
+    # Global örnek çalışma klasöründe arşiv açar; gerçek veriye dokunmamak için geçici klasöre geçilir
+    os.chdir(tempfile.mkdtemp(prefix="bench_archive_"))
+    from archive import MessageArchive
+    from config import ARCHIVE_BATCH_MESSAGES
+
+    rng = random.Random(args.seed)
+    archive = MessageArchive("archive")
+    chat_key = "-1001000000000"
+    now = time.time()
+    total = args.days * args.messages_per_day
+    step = args.days * 86400 / total
+    messages = [make_message(rng, rng.randint(1, 50), "user", now - args.days * 86400 + index * step) for index in range(total)]
+    raw_bytes = sum(len(json.dumps(message, ensure_ascii=False).encode('utf-8')) for message in messages)
+
+    started = time.perf_counter()
+    for start in range(0, total, ARCHIVE_BATCH_MESSAGES):
+        archive.append(chat_key, messages[start:start + ARCHIVE_BATCH_MESSAGES])
+    append_seconds = time.perf_counter() - started
+    del messages
+
+    stats = archive.get_stats()
+    results: Dict[str, object] = {
+        "messages": total,
+        "segments": stats["segments"],
+        "append_per_second": round(total / append_seconds),
+        "archive_mb": round(stats["bytes"] / 1e6, 2),
+        "compression_ratio": round(raw_bytes / stats["bytes"], 2),
+    }
+    for name, hours in (("24h", 24), ("7d", 168), ("all", None)):
+        since = now - hours * 3600 if hours else None
+        started = time.perf_counter()
+        count = sum(1 for _ in archive.iter_messages(chat_key, since=since))
+        seconds = time.perf_counter() - started
+        # Bellek ayrı geçişte ölçülür; tracemalloc süreyi şişirir
+        tracemalloc.start()
+        for _ in archive.iter_messages(chat_key, since=since):
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {"messages": count, "read_ms": round(seconds * 1000, 1), "peak_kb": round(peak / 1024)}
+
+    for name, value in results.items():
+        print(f"{name:18s}{value}")
+
+    if output:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        report = {
+            "benchmark": "archive",
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "results": results,
+        }
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
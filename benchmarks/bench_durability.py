@@ -0,0 +1,124 @@
+"""Dayanıklılık modları: eşzamanlı handler'larla kayıt throughput'u ve group commit.
+
+Her mod (none, interval, every-write) için sentetik geçmişi yükler ve
+`--concurrency` kadar eşzamanlı asyncio görevinde handle_message'ın kayıt
+yolunu taklit eder: kullanıcı mesajı + bot yanıtı kaydedilir, ardından
+`durable_writer.wait_durable()` beklenir. Saniyedeki mesaj, handler
+gecikmesi ve commit (fsync turu) sayısı raporlanır. Son olarak ana dosya
+bozulup yeniden yüklenerek son iyi anlık görüntüden kurtarma denenir.
+
+Kullanım:
+    python -m benchmarks.bench_durability --chats 100 --messages 2000 --concurrency 1,16,64
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_storage import generate_dataset
+from durability import DURABILITY_MODES, durable_commits, durable_writer
+
+
+async def run_handlers(memory, chat_ids: List[int], messages: int, concurrency: int, seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    latencies: List[float] = []
+    remaining = iter(range(messages))
+
+    async def handler():
+        for _ in remaining:
+            chat_id = rng.choice(chat_ids)
+            started = time.perf_counter()
+            memory.add_group_message(chat_id, 1, "user1", "dayanıklılık benchmark mesajı")
+            # Model çağrısı yerine kontrolü loop'a bırak; diğer handler'lar araya girer
+            await asyncio.sleep(0)
+            memory.add_bot_response(chat_id, "benchmark yanıtı")
+            await durable_writer.wait_durable()
+            latencies.append(time.perf_counter() - started)
+
+    commits_before = durable_commits.get()
+    started = time.perf_counter()
+    await asyncio.gather(*(handler() for _ in range(concurrency)))
+    await asyncio.get_running_loop().run_in_executor(None, durable_writer.sync)
+    seconds = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "messages_per_second": round(messages * 2 / seconds),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 3),
+        "commits": int(durable_commits.get() - commits_before),
+    }
+
+
+def check_recovery(directory: str, expected_chats: int) -> Dict[str, Any]:
+    """Ana dosyayı yarım yazılmış gibi keser; yüklemenin .bak'tan kurtardığını ölçer."""
+    from group_memory import GroupMemory
+
+    memory = GroupMemory(os.path.join(directory, "group_messages.json"), spill_dir=os.path.join(directory, "spill"))
+    path = memory.group_memory_file
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) // 2)
+    started = time.perf_counter()
+    recovered = GroupMemory(os.path.join(directory, "group_messages.json"), spill_dir=os.path.join(directory, "spill"))
+    return {
+        "recovered_chats": len(recovered.group_messages),
+        "expected_chats": expected_chats,
+        "recovery_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Dayanıklılık modları benchmark'ı")
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=2000, help="Mod ve eşzamanlılık başına handler sayısı")
+    parser.add_argument("--concurrency", default="1,16,64", help="Virgülle ayrılmış eşzamanlı handler sayıları")
+    parser.add_argument("--modes", default=",".join(DURABILITY_MODES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Sonuçların yazılacağı JSON dosyası")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output) if args.output else None
+    # Global depo örnekleri çalışma klasöründeki dosyaları kullanır; gerçek verilere dokunma
+    os.chdir(tempfile.mkdtemp(prefix="bench_durability_"))
+    from group_memory import GroupMemory
+
+    group_messages, _, _ = generate_dataset(args.chats, 20, 50, 0, 0, args.seed)
+    chat_ids = [int(key) for key in group_messages]
+    results: Dict[str, Any] = {}
+    for mode in args.modes.split(","):
+        durable_writer.mode = mode
+        for concurrency in [int(value) for value in args.concurrency.split(",")]:
+            directory = tempfile.mkdtemp(prefix=f"{mode}_", dir=".")
+            memory = GroupMemory(os.path.join(directory, "group_messages.json"), os.path.join(directory, "private_messages.json"),
+                                 os.path.join(directory, "spill"))
+            memory.group_messages.update(group_messages)
+            memory._save_group_memory()
+            durable_writer.sync()
+            result = asyncio.run(run_handlers(memory, chat_ids, args.messages, concurrency, args.seed))
+            results[f"{mode}/c{concurrency}"] = result
+            print(f"{mode:12s} c={concurrency:<4d} {result}", flush=True)
+        results[f"{mode}/recovery"] = check_recovery(directory, len(group_messages))
+        print(f"{mode:12s} recovery {results[f'{mode}/recovery']}", flush=True)
+
+    if output:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        report = {
+            "benchmark": "durability",
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "params": {key: value for key, value in vars(args).items() if key != "output"},
+            "results": results,
+        }
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Grup istatistikleri: sütunlu depo ile Python döngüsü karşılaştırması.
+
+Tek sohbete aylara yayılmış sentetik mesajlar (varsayılan 1M) yükler;
+`ColumnarStore.chat_statistics`'i 1, 30 ve tüm günlük aralıklarda ölçer ve
+aynı sayımın sözlük listesi üzerinde Python döngüsüyle (users_command'ın
+yaptığı gibi) süresiyle karşılaştırır.
+
+Kullanım:
+    python -m benchmarks.bench_group_stats --messages 1000000 --days 180
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def best_of(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def loop_statistics(messages: List[Dict], since: float) -> Dict[int, int]:
+    """users_command tarzı sayım: sözlükler üzerinde Python döngüsü."""
+    counts: Dict[int, int] = {}
+    for msg in messages:
+        if msg["timestamp"] > since and msg["message_type"] != "bot":
+            counts[msg["user_id"]] = counts.get(msg["user_id"], 0) + 1
+    return counts
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Grup istatistikleri benchmark'ı")
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=180, help="Mesajların yayıldığı gün sayısı")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Sonuçların yazılacağı JSON dosyası")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output) if args.output else None
+    # Global örnek çalışma klasöründeki dosyayı açar; gerçek veriye dokunmamak için geçici klasöre geçilir
+    os.chdir(tempfile.mkdtemp(prefix="bench_stats_"))
+    from columnar_store import RECORD_DTYPE, ColumnarStore
+
+    rng = np.random.default_rng(args.seed)
+    now = time.time()
+    chat_id = -1001000000000
+    records = np.zeros(args.messages, dtype=RECORD_DTYPE)
+    records["chat_id"] = chat_id
+    records["timestamp"] = np.sort(rng.uniform(now - args.days * 86400, now, args.messages))
+    records["user_id"] = rng.zipf(1.5, args.messages) % args.users + 1
+    records["length"] = rng.lognormal(3.2, 0.9, args.messages).astype(np.int32)
+    records["is_bot"] = rng.random(args.messages) < 0.3
+    records["user_id"][records["is_bot"].astype(bool)] = 0
+    local_hours = (records["timestamp"] + time.localtime().tm_gmtoff) // 3600
+    records["week_hour"] = (local_hours // 24 + 3) % 7 * 24 + local_hours % 24
+    with open("message_columns.bin", "wb") as f:
+        f.write(records.tobytes())
+
+    load_seconds = best_of(lambda: ColumnarStore("message_columns.bin", "users.json"), 1)
+    store = ColumnarStore("message_columns.bin", "users.json")
+
+    dicts = [
+        {"timestamp": float(ts), "user_id": int(user), "message_type": "bot" if bot else "user"}
+        for ts, user, bot in zip(records["timestamp"], records["user_id"], records["is_bot"])
+    ]
+
+    results: Dict[str, object] = {
+        "messages": args.messages,
+        "days": args.days,
+        "cold_load_ms": round(load_seconds * 1000, 1),
+        "file_mb": round(os.path.getsize("message_columns.bin") / 1e6, 1),
+    }
+    for window in (1, 30, args.days):
+        since = now - window * 86400
+        columnar = best_of(lambda: store.chat_statistics(chat_id, since=since), args.repeat)
+        loop = best_of(lambda: loop_statistics(dicts, since), max(1, args.repeat // 2))
+        results[f"{window}d"] = {
+            "columnar_ms": round(columnar * 1000, 2),
+            "python_loop_counts_only_ms": round(loop * 1000, 2),
+        }
+
+    for name, value in results.items():
+        print(f"{name:14s}{value}")
+
+    if output:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        report = {
+            "benchmark": "group_stats",
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "results": results,
+        }
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""HTTP bağlantı havuzları: sahte Bot API ve Gemini'ye karşı istek gecikmesi ve bağlantı yeniden kullanımı.
+
+Bot API tarafında PTB'nin varsayılan isteği (tek bağlantı), keep-alive'sız
+havuz ve `http_clients.telegram_request()` ile kurulan ayarlı havuz (h2
+kuruluysa HTTP/2 de) karşılaştırılır. Her yapılandırma, arka planda süren
+bir getUpdates uzun yoklaması varken `--concurrency` eşzamanlı sendMessage
+gönderir. Gemini tarafında SDK'nın REST oturumu, varsayılan requests
+adaptörüyle ve `tune_gemini_client()` sonrası iş parçacıklarından çağrılır.
+İstek başına p50/p95/p99 gecikme, hata sayısı, açılan bağlantı ve bağlantı
+başına istek raporlanır.
+
+Kullanım:
+    python -m benchmarks.bench_http_pools --requests 500 --concurrency 1,16,64
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loadtest.driver import FakeServers, percentile
+from loadtest.fake_gemini import FakeGeminiServer, LatencyModel
+from loadtest.fake_telegram import FakeTelegramServer
+
+TOKEN = "123456:FAKE-TOKEN"
+
+
+def summarize(latencies: List[float], errors: int, seconds: float, connections: int) -> Dict[str, Any]:
+    requests = len(latencies)
+    return {
+        "requests_per_second": round(requests / seconds, 1) if seconds else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "errors": errors,
+        "connections": connections,
+        "requests_per_connection": round(requests / connections, 1) if connections else 0.0,
+    }
+
+
+async def run_telegram(servers: FakeServers, make_request: Callable, requests: int, concurrency: int) -> Dict[str, Any]:
+    from telegram import Bot
+    from http_clients import updates_request
+
+    telegram = servers.telegram
+    bot = Bot(TOKEN, base_url=f"{telegram.base_url}/bot", request=make_request(), get_updates_request=updates_request())
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def sender():
+        nonlocal errors
+        for index in remaining:
+            started = time.perf_counter()
+            try:
+                await bot.send_message(chat_id=-1001000000000 - index % 10, text=f"benchmark {index}")
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                errors += 1
+
+    async def long_poll():
+        # Üretimdeki gibi getUpdates bağlantısı sürekli meşgul
+        while True:
+            await bot.get_updates(timeout=5)
+
+    async with bot:
+        poller = asyncio.create_task(long_poll())
+        connections_before = set(telegram.connections)
+        started = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(concurrency)))
+        seconds = time.perf_counter() - started
+        connections = len(telegram.connections - connections_before)
+        poller.cancel()
+        try:
+            await poller
+        except asyncio.CancelledError:
+            pass
+    return summarize(latencies, errors, seconds, connections)
+
+
+def run_gemini(servers: FakeServers, model, requests: int, concurrency: int) -> Dict[str, Any]:
+    gemini = servers.gemini
+    latencies: List[float] = []
+    errors = 0
+
+    def call(index: int):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            model.generate_content(f"benchmark {index}").text
+            latencies.append(time.perf_counter() - started)
+        except Exception:
+            errors += 1
+
+    connections_before = set(gemini.connections)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, range(requests)))
+    seconds = time.perf_counter() - started
+    return summarize(latencies, errors, seconds, len(gemini.connections - connections_before))
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="HTTP bağlantı havuzu benchmark'ı")
+    parser.add_argument("--requests", type=int, default=500, help="Yapılandırma ve eşzamanlılık başına istek")
+    parser.add_argument("--concurrency", default="1,16,64", help="Virgülle ayrılmış eşzamanlı istek sayıları")
+    parser.add_argument("--gemini-latency", type=float, default=0.02, help="Sahte Gemini yanıt süresi (sn)")
+    parser.add_argument("--skip-gemini", action="store_true")
+    parser.add_argument("--output", help="Sonuçların yazılacağı JSON dosyası")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output) if args.output else None
+    os.chdir(tempfile.mkdtemp(prefix="bench_http_pools_"))
+    # Havuz dolunca urllib3 her atılan bağlantı için uyarı yazar
+    logging.getLogger("urllib3.connectionpool").setLevel(logging.ERROR)
+
+    servers = FakeServers(FakeTelegramServer(), FakeGeminiServer(LatencyModel("fixed", args.gemini_latency)))
+    servers.start()
+    os.environ.update({"TELEGRAM_BOT_TOKEN": TOKEN, "GEMINI_API_KEY": "fake-key"})
+    from telegram.request import HTTPXRequest
+    import http_clients
+
+    configurations = {
+        "ptb-default": lambda: HTTPXRequest(),
+        "no-keepalive": lambda: http_clients.PooledHTTPXRequest(http_clients.TELEGRAM_POOL_SIZE, keepalive_seconds=0.0),
+        "tuned": lambda: http_clients.telegram_request(http2=False),
+    }
+    if http_clients.http2_available():
+        configurations["tuned-http2"] = lambda: http_clients.telegram_request(http2=True)
+
+    concurrencies = [int(value) for value in args.concurrency.split(",")]
+    results: Dict[str, Any] = {}
+    try:
+        for name, make_request in configurations.items():
+            for concurrency in concurrencies:
+                result = asyncio.run(run_telegram(servers, make_request, args.requests, concurrency))
+                results[f"telegram/{name}/c{concurrency}"] = result
+                print(f"telegram {name:12s} c={concurrency:<4d} {result}", flush=True)
+
+        if not args.skip_gemini:
+            import google.generativeai as genai
+            from google.generativeai import client as genai_client
+            from requests.adapters import HTTPAdapter
+
+            genai.configure(api_key="fake-key", transport="rest", client_options={"api_endpoint": servers.gemini.endpoint})
+            session = genai_client.get_default_generative_client()._transport._session
+            model = genai.GenerativeModel("models/gemini-2.0-flash")
+            for name in ("sdk-default", "tuned"):
+                for concurrency in concurrencies:
+                    if name == "tuned":
+                        http_clients.tune_gemini_client(pool_size=max(concurrencies))
+                    else:
+                        session.mount("http://", HTTPAdapter())
+                    result = run_gemini(servers, model, args.requests, concurrency)
+                    results[f"gemini/{name}/c{concurrency}"] = result
+                    print(f"gemini   {name:12s} c={concurrency:<4d} {result}", flush=True)
+    finally:
+        servers.stop()
+
+    if output:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        report = {
+            "benchmark": "http_pools",
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "params": {key: value for key, value in vars(args).items() if key != "output"},
+            "results": results,
+        }
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
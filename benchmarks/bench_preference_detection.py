@@ -0,0 +1,183 @@
+"""Otomatik tercih algılama: eski alt dize taramaları ile derlenmiş otomatın karşılaştırması.
+
+Gerçek mesaj geçmişi (varsa) ve tetikleyici ifadeler içeren sentetik mesajlar
+üzerinde algılama + doğrulama süresini ölçer, iki uygulamanın sonuçlarının
+farklı olduğu mesajları örnekler.
+
+Kullanım:
+    python -m benchmarks.bench_preference_detection --messages 20000
+    python -m benchmarks.bench_preference_detection --history group_messages.json --output benchmarks/results/preferences.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_storage import WORDS
+from preference_detector import PREFERENCE_RULES, PreferenceDetector
+from user_preferences import user_preferences
+from serializers import MESSAGES, read_store, serializer_for_path
+
+TRIGGERS = ["bana sen de", "siz diye", "efendim", "kanka", "eski türkçe", "osmanlıca", "modern türkçe",
+            "şakacı", "ciddi ol", "romantik", "nazım hikmet", "yahya kemal", "seviyorum", "şiir",
+            "gururlu", "saygılı", "ben", "müzik", "İtaatkar", "ŞAKACI", "sakaci"]
+
+
+def legacy_detect(message: str) -> List[Tuple[str, str]]:
+    """auto_detect_preferences'ın önceki alt dize tabanlı algılaması (karşılaştırma için)."""
+    message_lower = message.lower()
+    detected_preferences = []
+
+    if any(word in message_lower for word in ['bana', 'sen', 'siz', 'hitap', 'çağır', 'seslen']):
+        if 'sen' in message_lower and ('de' in message_lower or 'diye' in message_lower or 'şekilde' in message_lower):
+            detected_preferences.append(('hitap', 'sen'))
+        elif 'siz' in message_lower and ('de' in message_lower or 'diye' in message_lower or 'şekilde' in message_lower):
+            detected_preferences.append(('hitap', 'siz'))
+        elif 'efendim' in message_lower:
+            detected_preferences.append(('hitap', 'efendim'))
+        elif 'kanka' in message_lower or 'dost' in message_lower:
+            detected_preferences.append(('hitap', 'kanka'))
+
+    if any(word in message_lower for word in ['eski türkçe', 'osmanlıca', 'arapça', 'farsça']):
+        if 'eski türkçe' in message_lower or 'osmanlıca' in message_lower:
+            detected_preferences.append(('dil', 'eski türkçe'))
+        elif 'arapça' in message_lower:
+            detected_preferences.append(('dil', 'arapça'))
+        elif 'farsça' in message_lower:
+            detected_preferences.append(('dil', 'farsça'))
+    elif 'modern' in message_lower and 'türkçe' in message_lower:
+        detected_preferences.append(('dil', 'modern türkçe'))
+
+    if any(word in message_lower for word in ['şakacı', 'esprili', 'komik', 'eğlenceli']):
+        detected_preferences.append(('ton', 'şakacı'))
+    elif any(word in message_lower for word in ['ciddi', 'resmi', 'formal']):
+        detected_preferences.append(('ton', 'ciddi'))
+    elif any(word in message_lower for word in ['romantik', 'aşık', 'şiirsel']):
+        detected_preferences.append(('ton', 'romantik'))
+
+    poets = ['nazım hikmet', 'yahya kemal', 'orhan veli', 'cemal süreya', 'attila ilhan', 'turgut uyar', 'edip cansever', 'shelley', 'keats', 'byron']
+    for poet in poets:
+        if poet in message_lower and any(word in message_lower for word in ['seviyorum', 'beğeniyorum', 'okuyor', 'şiir']):
+            detected_preferences.append(('şair', poet))
+
+    if any(word in message_lower for word in ['gururlu', 'dik başlı', 'kendine güvenen']):
+        detected_preferences.append(('kişilik', 'gururlu'))
+    elif any(word in message_lower for word in ['itaatkar', 'saygılı', 'hizmetkar']):
+        detected_preferences.append(('kişilik', 'itaatkar'))
+    elif any(word in message_lower for word in ['şakacı', 'esprili', 'komik']):
+        detected_preferences.append(('kişilik', 'şakacı'))
+
+    if 'ben' in message_lower and any(word in message_lower for word in ['seviyorum', 'beğeniyorum', 'hoşlanıyorum']):
+        if 'şiir' in message_lower:
+            detected_preferences.append(('ilgi', 'şiir'))
+        elif 'müzik' in message_lower:
+            detected_preferences.append(('ilgi', 'müzik'))
+        elif 'kitap' in message_lower:
+            detected_preferences.append(('ilgi', 'kitap'))
+        elif 'sanat' in message_lower:
+            detected_preferences.append(('ilgi', 'sanat'))
+    return detected_preferences
+
+
+def legacy_validate(preference_type: str, preference_value: str) -> Tuple[bool, str]:
+    """validate_preference'ın tabloları her çağrıda kuran önceki hali."""
+    safe_types = ["hitap", "dil", "ton", "kişilik", "ilgi", "şair"]
+    if preference_type not in safe_types:
+        return False, f"'{preference_type}' güvenli bir tercih türü değil."
+    safe_values = {
+        "hitap": ["sen", "siz", "efendim", "kanka", "dost"],
+        "dil": ["eski türkçe", "modern türkçe", "arapça", "farsça"],
+        "ton": ["şakacı", "ciddi", "romantik", "nazik"],
+        "kişilik": ["gururlu", "itaatkar", "şakacı", "saygılı"],
+        "ilgi": ["şiir", "müzik", "kitap", "sanat", "edebiyat"],
+        "şair": ["nazım hikmet", "yahya kemal", "orhan veli", "cemal süreya", "attila ilhan"]
+    }
+    if preference_type in safe_values:
+        if preference_value.lower() not in safe_values[preference_type]:
+            return False, f"'{preference_value}' geçerli bir {preference_type} değeri değil."
+    return True, "Geçerli tercih değeri."
+
+
+def load_corpus(history: str, messages: int, seed: int) -> List[str]:
+    """Gerçek geçmişteki mesajlar + tetikleyici karışımlı sentetik mesajlar."""
+    corpus = []
+    if history:
+        chats = read_store(history, serializer_for_path(history), MESSAGES)
+        corpus = [msg["message"] for chat in chats.values() for msg in chat if msg.get("message")]
+    rng = random.Random(seed)
+    while len(corpus) < messages:
+        words = [rng.choice(WORDS) for _ in range(rng.randint(3, 30))]
+        for _ in range(rng.randint(0, 3)):
+            words.insert(rng.randrange(len(words) + 1), rng.choice(TRIGGERS))
+        corpus.append(" ".join(words))
+    return corpus[:messages]
+
+
+def measure(corpus: List[str], detect, validate, repeat: int) -> Dict[str, float]:
+    """Tüm korpusu `repeat` kez algılayıp doğrular; mesaj başına süreyi döndürür."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for message in corpus:
+            for preference_type, value in detect(message):
+                validate(preference_type, value)
+        best = min(best, time.perf_counter() - started)
+    return {"per_message_us": round(best / len(corpus) * 1e6, 3), "total_ms": round(best * 1000, 2)}
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Tercih algılama benchmark'ı")
+    parser.add_argument("--history", default="group_messages.json", help="Gerçek mesajların okunacağı hafıza dosyası")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--examples", type=int, default=10, help="Gösterilecek farklı sonuç örneği")
+    parser.add_argument("--output", help="Sonuçların yazılacağı JSON dosyası")
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.history, args.messages, args.seed)
+    compile_started = time.perf_counter()
+    detector = PreferenceDetector(PREFERENCE_RULES)
+    compile_ms = (time.perf_counter() - compile_started) * 1000
+
+    results: Dict[str, Any] = {
+        "legacy": measure(corpus, legacy_detect, legacy_validate, args.repeat),
+        "automaton": measure(corpus, detector.detect, user_preferences.validate_preference, args.repeat),
+        "compile_ms": round(compile_ms, 3),
+        "automaton_states": len(detector.automaton.children),
+    }
+    results["speedup"] = round(results["legacy"]["per_message_us"] / results["automaton"]["per_message_us"], 2)
+
+    differing = [(message, legacy_detect(message), detector.detect(message)) for message in corpus]
+    differing = [entry for entry in differing if sorted(entry[1]) != sorted(entry[2])]
+    results["differing_messages"] = len(differing)
+    results["messages"] = len(corpus)
+
+    print(f"messages            {len(corpus)}")
+    print(f"legacy              {results['legacy']['per_message_us']:8.2f} µs/mesaj")
+    print(f"automaton           {results['automaton']['per_message_us']:8.2f} µs/mesaj  (x{results['speedup']})")
+    print(f"compile             {results['compile_ms']:8.2f} ms, {results['automaton_states']} durum")
+    print(f"farklı sonuç        {len(differing)} mesaj (kelime sınırı ve Türkçe normalleştirme nedeniyle)")
+    for message, legacy, current in differing[:args.examples]:
+        print(f"  {message[:60]!r}\n    eski: {legacy}\n    yeni: {current}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        report = {
+            "benchmark": "preference_detection",
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "results": results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
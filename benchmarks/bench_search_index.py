@@ -0,0 +1,114 @@
+"""Tam metin arama dizini: dizinleme hızı, sorgu gecikmesi, yükleme süresi ve boyut.
+
+Tek bir sohbete (varsayılan 100k mesaj, SEARCH_MAX_MESSAGES) sentetik
+mesajlar ve aralarına konu cümleleri yerleştirir. Sık kelime, çok kelimeli
+ve nadir terim sorgularının gecikmesi ile konu cümlelerinin ilk sonuçlarda
+bulunma oranı raporlanır.
+
+Kullanım:
+    python -m benchmarks.bench_search_index --messages 100000
+    python -m benchmarks.bench_search_index --output benchmarks/results/search.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_semantic_memory import TOPICS, synthetic_vocabulary
+from benchmarks.bench_storage import WORDS
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    return {
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+    }
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Arama dizini benchmark'ı")
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=300, help="Her sorgu türünden çalıştırılacak sayı")
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Sonuçların yazılacağı JSON dosyası")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output) if args.output else None
+    # Global örnek çalışma klasöründeki dosyayı açar; gerçek veriye dokunmamak için geçici klasöre geçilir
+    os.chdir(tempfile.mkdtemp(prefix="bench_search_"))
+    import search_index as search_module
+    search_module.SEARCH_MAX_MESSAGES = max(search_module.SEARCH_MAX_MESSAGES, args.messages)
+    from search_index import SearchIndex
+
+    rng = random.Random(args.seed)
+    vocabulary = synthetic_vocabulary(rng, args.vocabulary)
+    chat_id = -1001000000000
+    index = SearchIndex("search_index.jsonl")
+
+    started_at = time.time() - args.messages
+    started = time.perf_counter()
+    for number in range(args.messages):
+        if rng.random() < 0.002:
+            message = rng.choice(TOPICS)[0]
+        else:
+            message = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(3, 25)))
+        index.on_message_added(chat_id, {
+            "user_id": rng.randint(1, 50), "username": "user", "message": message,
+            "message_type": "user", "timestamp": started_at + number,
+        })
+    add_seconds = time.perf_counter() - started
+
+    query_sets = {
+        "common_word": [rng.choice(WORDS) for _ in range(args.queries)],
+        "three_words": [" ".join(rng.choice(vocabulary) for _ in range(3)) for _ in range(args.queries)],
+        "topic": [rng.choice(TOPICS)[1] for _ in range(args.queries)],
+    }
+    results: Dict[str, object] = {"messages": args.messages, "add_per_second": round(args.messages / add_seconds)}
+    for name, queries in query_sets.items():
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(chat_id, query)
+            latencies.append(time.perf_counter() - started)
+        results[name] = latency_summary(latencies)
+
+    hits = 0
+    for sentence, query in TOPICS:
+        hits += any(result["message"] == sentence for result in index.search(chat_id, query))
+    results["topic_hit_rate"] = round(hits / len(TOPICS), 3)
+
+    chat = index.chats[chat_id]
+    results["terms"] = len(chat.postings)
+    results["postings_mb"] = round(sum(ids.itemsize * len(ids) + tfs.itemsize * len(tfs) for ids, tfs in chat.postings.values()) / 1e6, 2)
+    results["file_mb"] = round(os.path.getsize("search_index.jsonl") / 1e6, 2)
+    started = time.perf_counter()
+    SearchIndex("search_index.jsonl")
+    results["cold_load_seconds"] = round(time.perf_counter() - started, 2)
+
+    for name, value in results.items():
+        print(f"{name:20s}{value}")
+
+    if output:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        report = {
+            "benchmark": "search_index",
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "results": results,
+        }
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
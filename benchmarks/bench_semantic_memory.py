@@ -0,0 +1,130 @@
+"""Anlamsal hafıza: ekleme hızı, arama gecikmesi, bellek ve isabet ölçümü.
+
+Sentetik sohbetlere (varsayılan 10 sohbette toplam 100k mesaj) rastgele
+kelimelerden mesajlar ve aralarına konu cümleleri yerleştirir. Konu
+cümlelerinin ekli/çekimli başka bir biçimiyle sorgulanıp ilk k sonuçta
+bulunma oranı (recall@k) raporlanır.
+
+Kullanım:
+    python -m benchmarks.bench_semantic_memory --messages 100000 --chats 10
+    python -m benchmarks.bench_semantic_memory --output benchmarks/results/semantic.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_storage import WORDS
+
+# (yerleştirilen cümle, aynı konuyu farklı çekimle soran sorgu)
+TOPICS = [
+    ("Nazım Hikmet'in Memleketimden İnsan Manzaraları kitabını okudum", "nazım hikmetin manzaralar kitabı"),
+    ("yarın akşam Kadıköy'de konsere gidiyoruz", "kadıköydeki konser ne zaman"),
+    ("kedim dün gece veterinere gitti, aşısı yapıldı", "kedinin aşıları"),
+    ("Osmanlıca dersleri salı günleri başlıyor", "osmanlıca dersi hangi gün"),
+    ("bilgisayarımın ekran kartı yandı, yenisini sipariş ettim", "ekran kartını sipariş etmiş miydin"),
+    ("Yahya Kemal'in Sessiz Gemi şiirini ezberledim", "sessiz gemi şiiri"),
+    ("Ankara'daki toplantı perşembeye ertelendi", "ankara toplantısı ertelendi mi"),
+    ("Kapadokya'da balon turuna katıldık", "kapadokya balon turu"),
+]
+
+
+def synthetic_vocabulary(rng: random.Random, size: int) -> List[str]:
+    syllables = ["ka", "le", "mi", "su", "ra", "tö", "ğı", "şe", "ça", "nu", "po", "di", "ye", "zü", "bo", "hı"]
+    return WORDS + ["".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(size)]
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Anlamsal hafıza benchmark'ı")
+    parser.add_argument("--messages", type=int, default=100_000, help="Tüm sohbetlerdeki toplam mesaj")
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Sonuçların yazılacağı JSON dosyası")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output) if args.output else None
+    # Global örnek çalışma klasöründeki dosyayı açar; gerçek veriye dokunmamak için geçici klasöre geçilir
+    os.chdir(tempfile.mkdtemp(prefix="bench_semantic_"))
+    from semantic_memory import SemanticMemory
+
+    rng = random.Random(args.seed)
+    vocabulary = synthetic_vocabulary(rng, args.vocabulary)
+    per_chat = args.messages // args.chats
+    memory = SemanticMemory("semantic_memory.jsonl")
+
+    planted: List[Dict[str, Any]] = []
+    started_at = time.time() - args.messages
+    started = time.perf_counter()
+    for chat_index in range(args.chats):
+        chat_id = -1001000000000 - chat_index
+        for index in range(per_chat):
+            timestamp = started_at + chat_index * per_chat + index
+            if rng.random() < 0.002:
+                sentence, query = rng.choice(TOPICS)
+                message = sentence
+                planted.append({"chat_id": chat_id, "sentence": sentence, "query": query})
+            else:
+                message = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(3, 25)))
+            memory.on_message_added(chat_id, {
+                "user_id": rng.randint(1, 50), "username": "user", "message": message,
+                "message_type": "user", "timestamp": timestamp,
+            })
+    add_seconds = time.perf_counter() - started
+
+    latencies, hits = [], 0
+    for entry in rng.sample(planted, min(args.queries, len(planted))):
+        started = time.perf_counter()
+        results = memory.search(entry["chat_id"], entry["query"], min_score=0.0)
+        latencies.append(time.perf_counter() - started)
+        # Aynı cümlenin sohbetteki herhangi bir kopyası isabet sayılır
+        hits += any(result["message"] == entry["sentence"] for result in results)
+    latencies.sort()
+
+    memory.flush()
+    load_started = time.perf_counter()
+    SemanticMemory("semantic_memory.jsonl")
+    load_seconds = time.perf_counter() - load_started
+
+    stats = memory.get_stats()
+    results = {
+        "messages": stats["messages"],
+        "chats": stats["chats"],
+        "add_per_second": round(args.messages / add_seconds),
+        "search_p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "search_p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 3),
+        "search_mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "recall_at_k": round(hits / len(latencies), 3),
+        "queries": len(latencies),
+        "matrix_mb": round(stats["matrix_bytes"] / 1e6, 2),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "cold_load_seconds": round(load_seconds, 2),
+        "file_mb": round(os.path.getsize("semantic_memory.jsonl") / 1e6, 2),
+    }
+    for name, value in results.items():
+        print(f"{name:20s}{value}")
+
+    if output:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        report = {
+            "benchmark": "semantic_memory",
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "results": results,
+        }
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""GroupMemory ve UserPreferences için ölçekli mikro benchmark.
+
+Sentetik geçmiş (çok sayıda grup, kullanıcı ve uzun özel geçmişler) üretir,
+soğuk yükleme süresini ve her işlemin çağrı başına süresini ölçer. Birden
+fazla depolama backend'i karşılaştırılabilir; sonuçlar regresyon takibi için
+JSON olarak yazılır.
+
+Kullanım:
+    python -m benchmarks.bench_storage --chats 1,100,1000 --output benchmarks/results/storage.json
+    python -m benchmarks.bench_storage --chats 1000 --compare benchmarks/results/storage.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from durability import durable_writer
+
+WORDS = ["merhaba", "şiir", "bugün", "akşam", "mahzen", "kitap", "yarın", "efendimiz", "neden", "güzel", "hava", "müzik"]
+
+
+def make_message(rng: random.Random, user_id: int, username: str, timestamp: float, message_type: str = "user") -> Dict[str, Any]:
+    return {
+        "user_id": user_id,
+        "username": username,
+        "message": " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 25))),
+        "message_type": message_type,
+        "timestamp": timestamp,
+        "datetime": datetime.fromtimestamp(timestamp).isoformat(),
+    }
+
+
+def generate_dataset(chats: int, users_per_chat: int, messages_per_chat: int, private_users: int, private_messages: int, seed: int = 0):
+    """Sentetik grup geçmişi, özel geçmişler ve tercihler üretir."""
+    rng = random.Random(seed)
+    now = time.time()
+    group_messages, preferences = {}, {}
+    for chat_index in range(chats):
+        chat_id = -1001000000000 - chat_index
+        user_ids = [100_000 + chat_index * users_per_chat + index for index in range(users_per_chat)]
+        history = []
+        for index in range(messages_per_chat):
+            timestamp = now - 48 * 3600 + index * (48 * 3600 / messages_per_chat)
+            if index % 3 == 2:
+                history.append(make_message(rng, 0, "Bot", timestamp, "bot"))
+            else:
+                user_id = rng.choice(user_ids)
+                history.append(make_message(rng, user_id, f"user{user_id}", timestamp))
+        group_messages[str(chat_id)] = history
+
+        for user_id in user_ids:
+            preferences[f"{chat_id}_{user_id}"] = {
+                "chat_id": chat_id,
+                "user_id": user_id,
+                "username": f"user{user_id}",
+                "preferences": {"hitap": "sen", "ton": "şakacı"},
+                "consent_given": True,
+                "last_updated": now,
+                "created_by": user_id,
+            }
+
+    private = {}
+    for user_index in range(private_users):
+        user_id = 900_000 + user_index
+        private[str(user_id)] = [
+            make_message(rng, 0 if index % 2 else user_id, "Bot" if index % 2 else f"user{user_id}",
+                         now - private_messages + index, "bot" if index % 2 else "user")
+            for index in range(private_messages)
+        ]
+    return group_messages, private, preferences
+
+
+def file_backend(directory: str, storage_format: str):
+    """Verilen serileştiriciyle dosyaya yazan depolar."""
+    from group_memory import GroupMemory
+    from user_preferences import UserPreferences
+
+    memory = GroupMemory(
+        os.path.join(directory, "group_messages.json"),
+        os.path.join(directory, "private_messages.json"),
+        os.path.join(directory, "resident_spill"),
+        storage_format,
+    )
+    preferences = UserPreferences(os.path.join(directory, "user_preferences.json"), storage_format)
+    return memory, preferences
+
+
+def json_backend(directory: str):
+    """Okunabilir JSON dosyaları (indent=4)."""
+    return file_backend(directory, "json")
+
+
+def binary_backend(directory: str):
+    """Sürümlü ikili anlık görüntüler (.snap)."""
+    return file_backend(directory, "binary")
+
+
+# Karşılaştırılabilir depolama backend'leri: klasör -> (GroupMemory, UserPreferences)
+BACKENDS: Dict[str, Callable[[str], Tuple[Any, Any]]] = {
+    "json": json_backend,
+    "binary": binary_backend,
+}
+
+
+def time_calls(function: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Fonksiyonu `repeat` kez çağırıp çağrı başına süre istatistiklerini döndürür."""
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started)
+    durations.sort()
+    return {
+        "mean_ms": round(statistics.fmean(durations) * 1000, 4),
+        "p50_ms": round(durations[len(durations) // 2] * 1000, 4),
+        "p95_ms": round(durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000, 4),
+        "calls": repeat,
+    }
+
+
+def run_scale(backend_name: str, chats: int, args: argparse.Namespace) -> Dict[str, Any]:
+    directory = tempfile.mkdtemp(prefix=f"bench_{backend_name}_")
+    try:
+        backend = BACKENDS[backend_name]
+        group_messages, private, preferences = generate_dataset(
+            chats, args.users_per_chat, args.messages_per_chat, args.private_users, args.private_messages, args.seed
+        )
+
+        # Veriyi backend'in kendi kayıt yoluyla diske yaz
+        memory, prefs = backend(directory)
+        memory.group_messages.update(group_messages)
+        memory.private_messages.update(private)
+        memory._save_group_memory()
+        memory._save_private_memory()
+        prefs.user_preferences.update(preferences)
+        prefs._save_preferences()
+        durable_writer.sync()
+        disk_bytes = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names)
+        del memory, prefs
+
+        results: Dict[str, Any] = {"disk_bytes": disk_bytes}
+        results["cold_load"] = time_calls(lambda: backend(directory), args.load_repeat)
+        memory, prefs = backend(directory)
+
+        rng = random.Random(args.seed)
+        chat_ids = [int(key) for key in group_messages]
+        private_ids = [int(key) for key in private] or [1]
+
+        def random_chat_user():
+            chat_id = rng.choice(chat_ids)
+            return chat_id, 100_000 + (-1001000000000 - chat_id) * args.users_per_chat + rng.randrange(args.users_per_chat)
+
+        def add_group_message():
+            chat_id, user_id = random_chat_user()
+            memory.add_group_message(chat_id, user_id, f"user{user_id}", "benchmark mesajı")
+
+        def add_private_message():
+            user_id = rng.choice(private_ids)
+            memory.add_private_message(user_id, f"user{user_id}", "benchmark mesajı")
+
+        def add_preference():
+            chat_id, user_id = random_chat_user()
+            prefs.add_preference(chat_id, user_id, f"user{user_id}", "ton", rng.choice(["ciddi", "şakacı"]), requesting_user_id=user_id)
+
+        def apply_preference_batch():
+            chat_id, user_id = random_chat_user()
+            prefs.apply_batch(chat_id, user_id, f"user{user_id}", [("set", "ton", "ciddi"), ("set", "hitap", "siz"), ("set", "ilgi", "şiir")], requesting_user_id=user_id)
+
+        def clear_user_messages():
+            chat_id, user_id = random_chat_user()
+            memory.clear_user_messages(chat_id, user_id)
+
+        operations = {
+            "get_recent_messages": lambda: memory.get_recent_messages(rng.choice(chat_ids), 24),
+            "get_conversation_history": lambda: memory.get_conversation_history(*random_chat_user()),
+            "get_group_stats": memory.get_group_stats,
+            "get_chat_users_preferences": lambda: prefs.get_chat_users_preferences(rng.choice(chat_ids)),
+            "get_prompt_fragment": lambda: prefs.get_prompt_fragment(*random_chat_user()),
+            "get_chat_prompt_block": lambda: prefs.get_chat_prompt_block(rng.choice(chat_ids)),
+            "add_group_message": add_group_message,
+            "add_private_message": add_private_message,
+            "add_preference": add_preference,
+            "apply_preference_batch": apply_preference_batch,
+            "clear_user_messages": clear_user_messages,
+        }
+        for name, operation in operations.items():
+            results[name] = time_calls(operation, args.repeat)
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    """İki sonuç dosyasındaki ortalama süreleri karşılaştırır."""
+    for backend, scales in current["results"].items():
+        for scale, operations in scales.items():
+            base_operations = baseline.get("results", {}).get(backend, {}).get(scale)
+            if not base_operations:
+                continue
+            print(f"\n[{backend}] chats={scale}")
+            for name, stats in operations.items():
+                if not isinstance(stats, dict) or name not in base_operations:
+                    continue
+                before, after = base_operations[name]["mean_ms"], stats["mean_ms"]
+                change = (after - before) / before * 100 if before else 0.0
+                print(f"  {name:28s} {before:10.3f} ms -> {after:10.3f} ms ({change:+.1f}%)")
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="GroupMemory/UserPreferences mikro benchmark")
+    parser.add_argument("--chats", default="1,100,1000", help="Virgülle ayrılmış grup sayıları")
+    parser.add_argument("--backends", default="json,binary", help=f"Virgülle ayrılmış backend'ler ({', '.join(BACKENDS)})")
+    parser.add_argument("--users-per-chat", type=int, default=20)
+    parser.add_argument("--messages-per-chat", type=int, default=50)
+    parser.add_argument("--private-users", type=int, default=100)
+    parser.add_argument("--private-messages", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20, help="İşlem başına ölçüm sayısı")
+    parser.add_argument("--load-repeat", type=int, default=3, help="Soğuk yükleme ölçüm sayısı")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--durability", default="none", help="Dayanıklılık modu (modların karşılaştırması için bench_durability)")
+    parser.add_argument("--output", help="Sonuçların yazılacağı JSON dosyası")
+    parser.add_argument("--compare", help="Karşılaştırılacak önceki sonuç dosyası")
+    args = parser.parse_args(argv)
+
+    # Global depo örnekleri çalışma klasöründeki dosyaları kullanır; gerçek verilere dokunma
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    os.chdir(tempfile.mkdtemp(prefix="bench_storage_"))
+    durable_writer.mode = args.durability
+
+    report = {
+        "benchmark": "storage",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": {},
+    }
+    for backend_name in args.backends.split(","):
+        report["results"][backend_name] = {}
+        for chats in [int(value) for value in args.chats.split(",")]:
+            print(f"[{backend_name}] chats={chats} ...", flush=True)
+            results = run_scale(backend_name, chats, args)
+            report["results"][backend_name][str(chats)] = results
+            for name, stats in results.items():
+                if isinstance(stats, dict):
+                    print(f"  {name:28s} mean {stats['mean_ms']:10.3f} ms  p95 {stats['p95_ms']:10.3f} ms")
+            print(f"  {'disk':28s} {results['disk_bytes'] / 1024:10.1f} KiB")
+
+    if output:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if baseline_path:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import CHAT_SESSION_IDLE_SECONDS, CHAT_SESSION_MEMORY_BUDGET_MB, RECENT_HISTORY_TURNS
+from ingest_filter import display_text
+from metrics import cache_requests, metrics
+
+logger = logging.getLogger(__name__)
+
+# Persona, oturum geçmişinin başına sabitlenen kullanıcı/model çifti olarak verilir
+PERSONA_ACK = "Anlaşıldı."
+# Bütçe hesabında tur başına eklenen yaklaşık Content nesnesi yükü (bayt)
+TURN_OVERHEAD_BYTES = 400
+
+session_events = metrics.counter("bot_chat_session_events_total", "Sohbet oturumu kapatma olayları")
+
+
+def _turn(role: str, text: str) -> Dict[str, Any]:
+    return {"role": role, "parts": [text]}
+
+
+class SessionEntry:
+    """Bir (sohbet, kullanıcı) konuşmasının ChatSession'ı ve geçmişin düz kopyası.
+
+    Geçmiş SDK nesnelerinden okunmaz; `turns` her yanıttan sonra kırpılıp
+    oturuma geri yazılır. `synced_until` oturuma giren son kullanıcı
+    mesajının zamanıdır.
+    """
+
+    def __init__(self, session, persona: List[Dict[str, Any]], turns: List[Dict[str, Any]], synced_until: float):
+        self.session = session
+        self.persona = persona
+        self.turns = turns
+        self.synced_until = synced_until
+        self.last_access = time.time()
+        self.size = 0
+        self._resize()
+
+    def _resize(self):
+        self.size = sum(len(turn["parts"][0]) + TURN_OVERHEAD_BYTES for turn in self.persona + self.turns)
+
+    def record(self, user_text: str, reply: str, synced_until: float):
+        """Yanıtlanan turu (bağlam blokları olmadan) geçmişe ekler ve bütçeye kırpar."""
+        self.turns += [_turn("user", user_text), _turn("model", reply)]
+        # Çift sayıda mesaj tutulur ki geçmiş her zaman kullanıcı turuyla başlasın
+        keep = RECENT_HISTORY_TURNS - RECENT_HISTORY_TURNS % 2
+        if len(self.turns) > keep:
+            self.turns = self.turns[-keep:] if keep else []
+        self.session.history = self.persona + self.turns
+        self.synced_until = synced_until
+        self._resize()
+
+
+class ChatSessionManager:
+    """Etkin konuşmalar için Gemini ChatSession önbelleği.
+
+    Her yanıtta persona ve son turlar yeniden düz metne çevrilmez; oturuma
+    yalnızca yeni tur (o anki grup/tercih bağlamıyla) gönderilir. Geçmiş
+    RECENT_HISTORY_TURNS mesaja kırpılır, bağlam blokları geçmişte
+    tutulmaz. CHAT_SESSION_IDLE_SECONDS boyunca kullanılmayan oturumlar ve
+    CHAT_SESSION_MEMORY_BUDGET_MB aşılınca en uzun süredir kullanılmayanlar
+    kapatılır. Önbellekte olmayan oturum GroupMemory'deki geçmişten yeniden
+    kurulur.
+    """
+
+    def __init__(self):
+        self.sessions: "OrderedDict[Tuple[int, int], SessionEntry]" = OrderedDict()
+        self.size = 0
+
+    def attach(self, memory):
+        """GroupMemory'ye dinleyici olarak bağlanır (silinen geçmişin oturumu da kapanır)."""
+        if self not in memory.listeners:
+            memory.add_listener(self)
+
+    def on_message_added(self, chat_id: int, record: Dict[str, Any]):
+        """Oturum dışı mesajlar bir sonraki turda `pending_messages` ile eklenir."""
+
+    def on_messages_cleared(self, chat_id: int, user_id: Optional[int] = None):
+        """GroupMemory dinleyicisi: sohbetin veya kullanıcının oturumunu kapatır."""
+        for key in [key for key in self.sessions if key[0] == chat_id and user_id in (None, key[1])]:
+            self.drop(key, event="clear")
+
+    @staticmethod
+    def _build_turns(history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """GroupMemory mesajlarından, rolleri dönüşümlü kullanıcı/model turları kurar.
+
+        Art arda aynı roldeki mesajlar birleştirilir; geçmiş kullanıcıyla
+        başlayıp modelle biter (yeni tur kullanıcı turu olarak eklenecek).
+        """
+        turns: List[Dict[str, Any]] = []
+        for msg in history:
+            role = "model" if msg['message_type'] == 'bot' else "user"
+            text = display_text(msg) if role == "model" else f"{msg['username']}: {display_text(msg)}"
+            if turns and turns[-1]["role"] == role:
+                turns[-1]["parts"][0] += f"\n{text}"
+            else:
+                turns.append(_turn(role, text))
+        while turns and turns[0]["role"] != "user":
+            turns.pop(0)
+        while turns and turns[-1]["role"] != "model":
+            turns.pop()
+        keep = RECENT_HISTORY_TURNS - RECENT_HISTORY_TURNS % 2
+        return turns[-keep:] if keep else []
+
+    def get(self, chat_id: int, user_id: int, history: List[Dict[str, Any]], persona: str,
+            create_model: Callable[[], Any]) -> SessionEntry:
+        """Konuşmanın oturumunu döndürür; yoksa `history`den (son mesaj hariç) kurar.
+
+        `history` GroupMemory'deki konuşma geçmişidir; son mesajı yanıtlanacak
+        olan mesajdır.
+        """
+        key = (chat_id, user_id)
+        self.expire(keep=key)
+        entry = self.sessions.get(key)
+        if entry is not None:
+            cache_requests.inc(cache="session", result="hit")
+            self.sessions.move_to_end(key)
+            entry.last_access = time.time()
+            return entry
+
+        cache_requests.inc(cache="session", result="miss")
+        persona_turns = [_turn("user", persona), _turn("model", PERSONA_ACK)]
+        turns = self._build_turns(history[:-1])
+        # Son bot yanıtından sonraki (geçmişe girmeyen) kullanıcı mesajları yeni turla gönderilir
+        synced_until = next((msg['timestamp'] for msg in reversed(history[:-1]) if msg['message_type'] == 'bot'), 0)
+        session = create_model().start_chat(history=persona_turns + turns)
+        entry = self.sessions[key] = SessionEntry(session, persona_turns, turns, synced_until)
+        self.size += entry.size
+        return entry
+
+    @staticmethod
+    def pending_messages(entry: SessionEntry, history: List[Dict[str, Any]]) -> List[str]:
+        """Oturuma girmemiş, yanıtlanmamış kullanıcı mesajları (son mesaj hariç).
+
+        Grupta bota yönelmeyen mesajlar da kaydedilir; bir sonraki turda
+        yeni mesajın önüne eklenirler (en fazla RECENT_HISTORY_TURNS).
+        """
+        pending = []
+        for msg in reversed(history[:-1]):
+            if msg['timestamp'] <= entry.synced_until or len(pending) >= RECENT_HISTORY_TURNS:
+                break
+            if msg['message_type'] != 'bot':
+                pending.append(f"{msg['username']}: {display_text(msg)}")
+        pending.reverse()
+        return pending
+
+    def record(self, chat_id: int, user_id: int, user_text: str, reply: str, synced_until: float):
+        """Yanıtlanan turu oturum geçmişine yazar ve bellek bütçesini günceller."""
+        entry = self.sessions.get((chat_id, user_id))
+        if entry is None:
+            return
+        self.size -= entry.size
+        entry.record(user_text, reply, synced_until)
+        self.size += entry.size
+
+    def drop(self, key: Tuple[int, int], event: str = "drop"):
+        """Oturumu kapatır; bir sonraki yanıtta geçmişten yeniden kurulur."""
+        entry = self.sessions.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+            session_events.inc(event=event)
+
+    def expire(self, keep: Tuple[int, int] = None):
+        """Boşta kalan oturumları ve bütçeyi aşınca en eski kullanılanları kapatır."""
+        now = time.time()
+        budget = CHAT_SESSION_MEMORY_BUDGET_MB * 1024 * 1024
+        # OrderedDict en eski kullanılandan en yeniye sıralıdır
+        for key in list(self.sessions):
+            if key == keep:
+                continue
+            entry = self.sessions[key]
+            if now - entry.last_access > CHAT_SESSION_IDLE_SECONDS:
+                self.drop(key, event="idle")
+            elif self.size > budget:
+                self.drop(key, event="evict")
+            else:
+                break
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self.sessions),
+            "bytes": self.size,
+        }
+
+
+# Global chat session manager instance
+chat_sessions = ChatSessionManager()
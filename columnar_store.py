@@ -0,0 +1,323 @@
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import COLUMN_CHUNK_SIZE, shard_path
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+COLUMNS_FILE = "message_columns.bin"
+COLUMN_USERS_FILE = "message_columns_users.json"
+
+# Diskteki satır biçimi
+RECORD_DTYPE = np.dtype([("chat_id", "<i8"), ("timestamp", "<f8"), ("user_id", "<i8"), ("length", "<i4"), ("is_bot", "u1"), ("week_hour", "u1")])
+
+# Bellekteki sütunlar; kullanıcılar sohbet içi küçük kodlarla tutulur (sözlük kodlaması)
+# week_hour: mesajın yerel saatle haftanın kaçıncı saati olduğu (Pazartesi 00:00 = 0), yazılırken hesaplanır
+COLUMN_TYPES = {"timestamp": np.float64, "user": np.int32, "length": np.int32, "is_bot": np.bool_, "week_hour": np.uint8}
+
+# Mesaj uzunluğu dağılımının sınırları (karakter)
+LENGTH_BINS = [0, 10, 25, 50, 100, 200, 500, np.inf]
+
+WEEKDAYS = ["Pzt", "Sal", "Çar", "Per", "Cum", "Cmt", "Paz"]
+HEAT_LEVELS = " ░▒▓█"
+
+
+class ChatColumns:
+    """Bir sohbetin mesaj sütunları, sabit boyutlu parçalar halinde.
+
+    Her parça sütun başına ayrı, bitişik bir dizidir. Dolan parçalar
+    değişmez; zaman sıralı oldukları için aralık sorguları yalnızca kesişen
+    parçaları birleştirir. user_id'ler sohbet içinde 0'dan başlayan kodlara
+    çevrilir, böylece kullanıcı sayımları `np.bincount` ile yapılır.
+    """
+
+    def __init__(self, chunk_size: int = COLUMN_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.chunks: List[Dict[str, np.ndarray]] = []
+        self.tail = self._new_chunk()
+        self.tail_count = 0
+        self.user_ids: List[int] = []  # kod -> user_id
+        self.user_codes: Dict[int, int] = {}  # user_id -> kod
+
+    def __len__(self) -> int:
+        return len(self.chunks) * self.chunk_size + self.tail_count
+
+    def _new_chunk(self) -> Dict[str, np.ndarray]:
+        return {name: np.zeros(self.chunk_size, dtype=dtype) for name, dtype in COLUMN_TYPES.items()}
+
+    def code(self, user_id: int) -> int:
+        code = self.user_codes.get(user_id)
+        if code is None:
+            code = self.user_codes[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+        return code
+
+    def _seal_tail(self):
+        if self.tail_count == self.chunk_size:
+            self.chunks.append(self.tail)
+            self.tail = self._new_chunk()
+            self.tail_count = 0
+
+    def append(self, timestamp: float, user_id: int, length: int, is_bot: bool, week_hour: int):
+        tail, index = self.tail, self.tail_count
+        tail["timestamp"][index] = timestamp
+        tail["user"][index] = self.code(user_id)
+        tail["length"][index] = length
+        tail["is_bot"][index] = is_bot
+        tail["week_hour"][index] = week_hour
+        self.tail_count += 1
+        self._seal_tail()
+
+    def extend(self, timestamps: np.ndarray, user_ids: np.ndarray, lengths: np.ndarray, is_bot: np.ndarray, week_hours: np.ndarray):
+        """Zaman sıralı satırları toplu ekler (yükleme için)."""
+        known, inverse = np.unique(user_ids, return_inverse=True)
+        users = np.array([self.code(int(user_id)) for user_id in known], dtype=np.int32)[inverse]
+        columns = {"timestamp": timestamps, "user": users, "length": lengths, "is_bot": is_bot, "week_hour": week_hours}
+        start = 0
+        while start < len(timestamps):
+            take = min(self.chunk_size - self.tail_count, len(timestamps) - start)
+            for name, values in columns.items():
+                self.tail[name][self.tail_count:self.tail_count + take] = values[start:start + take]
+            self.tail_count += take
+            start += take
+            self._seal_tail()
+
+    def rows(self, since: float = None, until: float = None) -> Dict[str, np.ndarray]:
+        """[since, until) aralığındaki satırları sütun sözlüğü olarak döndürür."""
+        parts = self.chunks + ([{name: column[:self.tail_count] for name, column in self.tail.items()}] if self.tail_count else [])
+        if since is not None:
+            parts = [part for part in parts if part["timestamp"][-1] >= since]
+        if until is not None:
+            parts = [part for part in parts if part["timestamp"][0] < until]
+        if not parts:
+            return {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMN_TYPES.items()}
+        # Uçtaki parçalar aralığı taşabilir; sıralı oldukları için ikili aramayla kesilir
+        start = int(np.searchsorted(parts[0]["timestamp"], since, side="left")) if since is not None else 0
+        end = int(np.searchsorted(parts[-1]["timestamp"], until, side="left")) if until is not None else len(parts[-1]["timestamp"])
+        if len(parts) == 1:
+            return {name: column[start:end] for name, column in parts[0].items()}
+        return {
+            name: np.concatenate([parts[0][name][start:]] + [part[name] for part in parts[1:-1]] + [parts[-1][name][:end]])
+            for name in COLUMN_TYPES
+        }
+
+    def keep(self, mask: np.ndarray):
+        """Maskede True olan satırları tutar."""
+        rows = self.rows()
+        user_ids = np.array(self.user_ids, dtype=np.int64)[rows["user"]] if self.user_ids else np.zeros(0, dtype=np.int64)
+        self.__init__(self.chunk_size)
+        self.extend(rows["timestamp"][mask], user_ids[mask], rows["length"][mask], rows["is_bot"][mask], rows["week_hour"][mask])
+
+
+class ColumnarStore:
+    """Sohbet başına sütunlu mesaj deposu ve vektörel grup istatistikleri.
+
+    GroupMemory'ye dinleyici olarak bağlanır; her mesaj için yalnızca zaman,
+    user_id, uzunluk ve bot bayrağı saklanır. Satırlar diske sabit genişlikli
+    ikili kayıtlar olarak eklenir ve tek `np.frombuffer` ile geri okunur.
+    Silmelerde dosya yeniden yazılır.
+    """
+
+    def __init__(self, columns_file: str = None, users_file: str = None):
+        self.columns_file = columns_file or shard_path(COLUMNS_FILE)
+        self.users_file = users_file or shard_path(COLUMN_USERS_FILE)
+        self.chats: Dict[int, ChatColumns] = {}
+        self.usernames: Dict[str, str] = {}  # "chat_user" -> son kullanıcı adı
+        self._load()
+
+    def _chat(self, chat_id: int) -> ChatColumns:
+        columns = self.chats.get(chat_id)
+        if columns is None:
+            columns = self.chats[chat_id] = ChatColumns()
+        return columns
+
+    def _load(self):
+        """İkili kayıt dosyasını okuyup sohbetlere dağıtır."""
+        if os.path.exists(self.users_file):
+            try:
+                with open(self.users_file, 'r', encoding='utf-8') as f:
+                    self.usernames = json.load(f)
+            except (json.JSONDecodeError, FileNotFoundError):
+                self.usernames = {}
+        if not os.path.exists(self.columns_file):
+            return
+        started = time.perf_counter()
+        with open(self.columns_file, 'rb') as f:
+            data = f.read()
+        # Yarım yazılmış son kayıt atlanır
+        records = np.frombuffer(data[:len(data) - len(data) % RECORD_DTYPE.itemsize], dtype=RECORD_DTYPE)
+        order = np.lexsort((records["timestamp"], records["chat_id"]))
+        records = records[order]
+        chat_ids, starts = np.unique(records["chat_id"], return_index=True)
+        bounds = list(starts[1:]) + [len(records)]
+        for chat_id, start, end in zip(chat_ids, starts, bounds):
+            chat = records[start:end]
+            self._chat(int(chat_id)).extend(
+                np.ascontiguousarray(chat["timestamp"]), chat["user_id"], chat["length"].astype(np.int32),
+                chat["is_bot"].astype(bool), chat["week_hour"],
+            )
+        logger.info(f"Columnar store loaded: {len(records)} messages in {len(self.chats)} chats ({time.perf_counter() - started:.2f}s)")
+
+    def _save_usernames(self):
+        with open(self.users_file, 'w', encoding='utf-8') as f:
+            json.dump(self.usernames, f, ensure_ascii=False)
+
+    def _rewrite(self):
+        """Dosyayı bellekteki satırlarla yeniden yazar."""
+        temporary = f"{self.columns_file}.tmp"
+        with open(temporary, 'wb') as f:
+            for chat_id, columns in self.chats.items():
+                rows = columns.rows()
+                records = np.zeros(len(rows["timestamp"]), dtype=RECORD_DTYPE)
+                records["chat_id"] = chat_id
+                records["timestamp"] = rows["timestamp"]
+                records["user_id"] = np.array(columns.user_ids, dtype=np.int64)[rows["user"]]
+                records["length"] = rows["length"]
+                records["is_bot"] = rows["is_bot"]
+                records["week_hour"] = rows["week_hour"]
+                f.write(records.tobytes())
+        os.replace(temporary, self.columns_file)
+
+    @staticmethod
+    def _row(chat_id: int, record: Dict[str, Any]) -> Tuple:
+        local = time.localtime(record["timestamp"])
+        return (chat_id, record["timestamp"], record["user_id"], len(record["message"] or ""),
+                record.get("message_type") == "bot", local.tm_wday * 24 + local.tm_hour)
+
+    def _add(self, row: Tuple, username: str) -> bool:
+        """Satırı ekler; kullanıcı adı değiştiyse True döndürür."""
+        chat_id, timestamp, user_id, length, is_bot, week_hour = row
+        self._chat(chat_id).append(timestamp, user_id, length, is_bot, week_hour)
+        key = f"{chat_id}_{user_id}"
+        if not is_bot and self.usernames.get(key) != username:
+            self.usernames[key] = username
+            return True
+        return False
+
+    def attach(self, memory):
+        """GroupMemory'ye dinleyici olarak bağlanır; depo boşsa sıcak hafızadaki mesajları bir kez ekler."""
+        if self in memory.listeners:
+            return
+        memory.add_listener(self)
+        if self.chats:
+            return
+        for messages_by_chat in (memory.group_messages, memory.private_messages):
+            for chat_key, messages in messages_by_chat.items():
+                for message in messages:
+                    self._add(self._row(int(chat_key), message), message["username"])
+        if self.chats:
+            self._rewrite()
+            self._save_usernames()
+            logger.info(f"Columnar store backfilled from group memory: {self.get_stats()['messages']} messages")
+
+    def on_message_added(self, chat_id: int, record: Dict[str, Any]):
+        """GroupMemory dinleyicisi: mesajın sütun satırını ekler ve diske yazar."""
+        row = self._row(chat_id, record)
+        renamed = self._add(row, record["username"])
+        with metrics.timer("persistence"):
+            with open(self.columns_file, 'ab') as f:
+                f.write(np.array([row], dtype=RECORD_DTYPE).tobytes())
+            if renamed:
+                self._save_usernames()
+
+    def on_messages_cleared(self, chat_id: int, user_id: Optional[int] = None):
+        """GroupMemory dinleyicisi: sohbetin veya kullanıcının satırlarını siler."""
+        columns = self.chats.get(chat_id)
+        if columns is None:
+            return
+        if user_id is None:
+            del self.chats[chat_id]
+        elif user_id in columns.user_codes:
+            columns.keep(columns.rows()["user"] != columns.user_codes[user_id])
+        else:
+            return  # Kullanıcının satırı yok, dosya değişmez
+        self._rewrite()
+
+    def on_messages_replaced(self, chat_id: int, records: List[Dict[str, Any]]):
+        """GroupMemory dinleyicisi: sohbetin satırlarını verilen (kronolojik) mesajlarla toplu yeniden kurar."""
+        self.chats.pop(chat_id, None)
+        if records:
+            rows = np.array([self._row(chat_id, record) for record in records], dtype=RECORD_DTYPE)
+            self._chat(chat_id).extend(
+                rows["timestamp"], rows["user_id"], rows["length"].astype(np.int32), rows["is_bot"].astype(bool), rows["week_hour"],
+            )
+            for record in records:
+                if record.get("message_type") != "bot":
+                    self.usernames[f"{chat_id}_{record['user_id']}"] = record["username"]
+        self._rewrite()
+        self._save_usernames()
+
+    def username(self, chat_id: int, user_id: int) -> str:
+        return self.usernames.get(f"{chat_id}_{user_id}") or f"User_{user_id}"
+
+    def chat_statistics(self, chat_id: int, since: float = None, until: float = None, top: int = 5) -> Optional[Dict[str, Any]]:
+        """Aralıktaki mesajların vektörel istatistikleri; mesaj yoksa None."""
+        columns = self.chats.get(chat_id)
+        if columns is None:
+            return None
+        rows = columns.rows(since, until)
+        timestamps, users, lengths, is_bot = rows["timestamp"], rows["user"], rows["length"], rows["is_bot"]
+        if not len(timestamps):
+            return None
+        is_user = ~is_bot
+
+        heatmap = np.bincount(rows["week_hour"][is_user], minlength=7 * 24).reshape(7, 24)
+
+        counts = np.bincount(users[is_user], minlength=len(columns.user_ids))
+        order = np.argsort(-counts, kind="stable")[:top]
+
+        # Bot yanıt süresi: bir kullanıcı mesajının hemen ardından gelen bot mesajına kadar geçen süre
+        answered = is_bot[1:] & is_user[:-1]
+        response_times = (timestamps[1:] - timestamps[:-1])[answered]
+
+        user_lengths = lengths[is_user]
+        length_histogram, _ = np.histogram(user_lengths, bins=LENGTH_BINS)
+
+        return {
+            "messages": int(len(timestamps)),
+            "user_messages": int(is_user.sum()),
+            "bot_messages": int(len(timestamps) - is_user.sum()),
+            "active_users": int(np.count_nonzero(counts)),
+            "first_timestamp": float(timestamps[0]),
+            "last_timestamp": float(timestamps[-1]),
+            "heatmap": heatmap,
+            "hourly": heatmap.sum(axis=0),
+            "top_talkers": [(columns.user_ids[index], int(counts[index])) for index in order if counts[index]],
+            "response_times": {
+                "count": int(len(response_times)),
+                "median": float(np.median(response_times)) if len(response_times) else None,
+                "p90": float(np.percentile(response_times, 90)) if len(response_times) else None,
+            },
+            "length_histogram": length_histogram,
+            "length_mean": float(user_lengths.mean()) if len(user_lengths) else 0.0,
+            "length_median": float(np.median(user_lengths)) if len(user_lengths) else 0.0,
+        }
+
+    @staticmethod
+    def render_heatmap(heatmap: np.ndarray) -> str:
+        """7x24 etkinlik matrisini gün satırları ve saat sütunlarıyla metne çevirir."""
+        peak = heatmap.max()
+        if not peak:
+            return ""
+        levels = np.ceil(heatmap / peak * (len(HEAT_LEVELS) - 1)).astype(np.int64)
+        lines = ["    " + "".join(str(hour // 10) if hour % 6 == 0 else " " for hour in range(24)),
+                 "    " + "".join(str(hour % 10) if hour % 6 == 0 else " " for hour in range(24))]
+        for day, row in zip(WEEKDAYS, levels):
+            lines.append(f"{day} " + "".join(HEAT_LEVELS[level] for level in row))
+        return "\n".join(lines)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "chats": len(self.chats),
+            "messages": sum(len(columns) for columns in self.chats.values()),
+        }
+
+
+# Global columnar store instance
+columnar_store = ColumnarStore()
@@ -6,9 +6,11 @@ load_dotenv()
 
 # Telegram Bot Token
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', 'https://api.telegram.org')  # Yük testinde sahte sunucu
 
 # Google Gemini API Key
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT')  # Verilirse REST ile bu adrese bağlanılır (örn. sahte sunucu)
 
 # Bot ayarları
 BOT_USERNAME = os.getenv('BOT_USERNAME', '')
@@ -16,14 +18,157 @@ MAX_MESSAGE_LENGTH = 4000
 AI_MODEL = "models/gemini-2.0-flash"
 
 # Grup ayarları
-ALLOWED_GROUPS = [-1002792186251]  # Sadece mahzen grubu
-ADMIN_USER_IDS = []  # Bot yöneticilerinin user ID'leri
+_allowed_groups = os.getenv('ALLOWED_GROUPS')  # Ortamda boş verilirse tüm gruplar kabul edilir
+ALLOWED_GROUPS = [int(x) for x in _allowed_groups.split(',') if x.strip()] if _allowed_groups is not None else [-1002792186251]  # Sadece mahzen grubu
+ADMIN_USER_IDS = [int(x) for x in os.getenv('ADMIN_USER_IDS', '').split(',') if x.strip()]  # Bot yöneticilerinin user ID'leri
 
 # Hafıza ayarları
 MEMORY_ENABLED = True
 MAX_MEMORY_MESSAGES = 10  # Her kullanıcı için saklanacak maksimum mesaj sayısı
 MEMORY_FILE = "conversation_memory.json"
 
+# Arşiv (sıcak hafızadan düşen mesajlar)
+ARCHIVE_DIR = "archive"  # Günlük sıkıştırılmış segmentlerin klasörü
+ARCHIVE_BATCH_MESSAGES = 50  # Sıcak pencere bu kadar aşılınca en eskiler toplu arşivlenir
+ARCHIVE_BLOCK_MESSAGES = 256  # Segmentte sıkıştırılmış blok başına en fazla mesaj
+ARCHIVE_COMPRESSION_LEVEL = 6  # zlib seviyesi
+ARCHIVE_RETENTION_DAYS = 365  # Bundan eski segmentler silinir (0: sınırsız)
+SUMMARY_MAX_HOURS = 168  # /ozet için en uzun aralık (7 gün)
+SUMMARY_MAX_MESSAGES = 400  # Özet prompt'una girecek en fazla (en yeni) mesaj
+
 # Loglama
 LOG_LEVEL = "INFO"
 LOG_FILE = "bot.log"
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_MAX_BYTES = 5 * 1024 * 1024  # Dosya bu boyuta ulaşınca döndürülür
+LOG_ROTATE_WHEN = None  # Zamana göre döndürmek için örn. "midnight" (boyut sınırı yerine)
+LOG_BACKUP_COUNT = 5  # Saklanacak eski log dosyası sayısı
+LOG_LEVELS = {  # Logger bazında seviye ayarları
+    "httpx": "WARNING",  # Her getUpdates isteği için INFO yazmasın
+    "telegram.ext": "INFO",
+}
+LOG_SAMPLED_LOGGERS = ["messages"]  # Yoğun mesaj logları örneklenir
+LOG_SAMPLE_RATE = 0.1  # Örneklenen logger'lardan geçirilecek INFO kayıt oranı
+LOG_MESSAGE_PREVIEW = 50  # Mesaj loglarında gösterilecek karakter sayısı
+
+# Gönderim hız sınırları (Telegram flood limitleri)
+SEND_GLOBAL_RATE = 30  # Bot genelinde saniyede gönderilebilecek mesaj
+SEND_PRIVATE_CHAT_RATE = 1  # Özel sohbette saniyede mesaj
+SEND_GROUP_CHAT_RATE = 20 / 60  # Grupta saniyede mesaj (dakikada 20)
+SEND_CHAT_BURST = 3  # Sohbet başına art arda gönderilebilecek mesaj
+SEND_MERGE_MAX_LENGTH = 500  # Kuyrukta birleştirilecek mesajların maksimum uzunluğu
+
+# HTTP bağlantı havuzları (Bot API ve Gemini)
+TELEGRAM_POOL_SIZE = 16  # Giden Bot API çağrıları için en fazla eşzamanlı bağlantı
+TELEGRAM_UPDATES_POOL_SIZE = 1  # getUpdates uzun yoklaması için ayrı havuz
+TELEGRAM_HTTP2 = os.getenv('TELEGRAM_HTTP2') == '1'  # Giden çağrılarda HTTP/2 (h2 paketi gerekir)
+HTTP_KEEPALIVE_SECONDS = 30.0  # Boştaki bağlantının yeniden kullanılmak üzere açık tutulduğu süre
+HTTP_CONNECT_TIMEOUT = 5.0
+HTTP_READ_TIMEOUT = 10.0  # getUpdates'te yoklama süresi buna eklenir
+HTTP_WRITE_TIMEOUT = 10.0
+HTTP_POOL_TIMEOUT = 3.0  # Havuzda boş bağlantı bekleme süresi
+GEMINI_POOL_SIZE = 10  # Gemini REST oturumunda tutulan bağlantı sayısı
+GEMINI_TIMEOUT = 60.0  # Gemini REST isteği zaman aşımı (sn)
+UVLOOP_ENABLED = os.getenv('UVLOOP') == '1'  # uvloop kuruluysa event loop olarak kullanılır
+
+# Ölçekleme (çok süreçli mod)
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', '1'))  # 1'den büyükse sohbetler süreçlere dağıtılır
+SHARD_ID = os.getenv('SHARD_ID')  # Worker süreçlerinde ana süreç tarafından ayarlanır
+
+
+def shard_path(path: str) -> str:
+    """Worker süreçlerinde veri dosyası adına shard numarasını ekler."""
+    if SHARD_ID is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard{SHARD_ID}{ext}"
+
+# Kullanıcı tercihleri
+GROUP_PREFERENCES_PROMPT_USERS = 20  # Grup prompt'undaki tercih bloğunda gösterilecek en fazla kullanıcı
+
+# Anlamsal hafıza (eski mesajlarda yerel vektör araması)
+SEMANTIC_DIM = 256  # Özetlenmiş n-gram vektör boyutu
+SEMANTIC_NGRAM_RANGE = (3, 5)  # Karakter n-gram uzunlukları
+SEMANTIC_MAX_MESSAGES = 10000  # Sohbet başına aranabilir en fazla mesaj
+SEMANTIC_TOP_K = 5  # Prompt'a eklenecek en fazla ilgili mesaj
+SEMANTIC_MIN_SCORE = 0.25  # Bu benzerliğin altındaki mesajlar eklenmez
+SEMANTIC_PROMPT_CHARS = 1500  # İlgili mesajlar bloğunun karakter bütçesi
+SEMANTIC_FLUSH_MESSAGES = 64  # Kayıt ve vektörler bu kadar mesaj birikince diske eklenir
+SEMANTIC_FLUSH_SECONDS = 5.0  # ...ya da son yazmadan bu kadar süre geçince
+
+# Prompt'a (veya Gemini oturum geçmişine) aynen giren son mesaj sayısı; bunlar özete girmez
+RECENT_HISTORY_TURNS = 6
+
+# Konuşma özeti (sohbet + kullanıcı başına, son mesajlardan eski turların arka planda yoğunlaştırılması)
+SYNOPSIS_TRIGGER_TURNS = 8  # Özetlenmemiş bu kadar eski tur birikince özet yenilenir
+SYNOPSIS_MAX_BATCH = 40  # Tek yenilemede özete katılacak en fazla tur (en eskilerden başlanır)
+SYNOPSIS_MAX_CHARS = 800  # Özetin (ve prompt bloğunun) karakter bütçesi
+
+# Gemini sohbet oturumları (sohbet + kullanıcı başına ChatSession; geçmiş her yanıtta yeniden yazılmaz)
+CHAT_SESSIONS_ENABLED = True  # False: her yanıtta düz metin prompt oluşturulur
+CHAT_SESSION_IDLE_SECONDS = 30 * 60  # Bu süre kullanılmayan oturum kapatılır
+CHAT_SESSION_MEMORY_BUDGET_MB = 16  # Tüm oturum geçmişleri için yaklaşık üst sınır
+
+# Grup sohbeti alım filtresi (bota yönelmeyen mesajlar hafızaya yazılmadan önce)
+INGEST_FILTER_ENABLED = True
+INGEST_WINDOW_MESSAGES = 50  # Yakın tekrarların arandığı son mesaj sayısı (sohbet başına)
+INGEST_SIMHASH_DISTANCE = 10  # 64 bitlik SimHash'ler arasında en fazla bu kadar bit farkı yakın tekrar sayılır (ilgisiz mesajlarda tipik olarak 20+)
+INGEST_MIN_CHARS = 40  # Daha kısa mesajlar yakın tekrar sayılmaz, yalnızca birebir art arda tekrarlar birleşir
+INGEST_MAX_CHARS = 600  # Daha uzun mesajlar kırpılarak saklanır
+INGEST_PREVIEW_CHARS = 80  # Yakın tekrarlar yerine saklanan önizleme uzunluğu
+INGEST_ORIGINALS_DIR = "ingest_originals"  # Kırpılan ve tekrar sayılan mesajların tam metinleri
+
+# Tam metin arama (/ara)
+SEARCH_MAX_MESSAGES = 100000  # Sohbet başına dizinde tutulacak en fazla mesaj
+SEARCH_RESULTS = 5  # /ara yanıtında gösterilecek sonuç sayısı
+
+# Grup istatistikleri (/istatistik)
+COLUMN_CHUNK_SIZE = 4096  # Sütunlu depoda parça başına satır
+STATS_DEFAULT_DAYS = 7  # Gün verilmezse kullanılacak aralık
+STATS_MAX_DAYS = 3650  # Kabul edilen en uzun aralık
+STATS_TOP_USERS = 5  # Gösterilecek en çok yazan kullanıcı sayısı
+
+# Depo dosya biçimi: "binary" (sürümlü ikili anlık görüntü, .snap) veya "json" (.json)
+# Diğer biçimdeki dosya daha yeniyse ilk açılışta ondan okunur; dönüştürmek için: python serializers.py KAYNAK HEDEF
+STORAGE_FORMAT = os.getenv('STORAGE_FORMAT', 'binary')
+
+# Dayanıklılık: "none" (fsync yok), "interval" (DURABILITY_INTERVAL_SECONDS'ta bir toplu fsync)
+# veya "every-write" (yanıt, kayıtlar fsync'lenmeden gönderilmez). Dosyalar her modda atomik değiştirilir.
+DURABILITY_MODE = os.getenv('DURABILITY_MODE', 'interval')
+DURABILITY_INTERVAL_SECONDS = 1.0
+
+# Bellekte tutulan sohbetler (grup ve özel mesaj depoları)
+RESIDENCY_SPILL_DIR = "resident_spill"  # Bellekten çıkarılan sohbetlerin yazıldığı klasör
+RESIDENCY_IDLE_SECONDS = 6 * 3600  # Bu süre erişilmeyen sohbet bellekten çıkarılır
+RESIDENCY_MEMORY_BUDGET_MB = 64  # Depo başına bellekteki mesajlar için yaklaşık üst sınır
+RESIDENCY_SWEEP_SECONDS = 60  # Çıkarma taraması en fazla bu sıklıkla çalışır
+
+# Dışa/içe aktarma (/export, /import, python history_export.py)
+EXPORT_DIR = "exports"  # Gönderilmeden önce dışa aktarım dosyalarının yazıldığı klasör
+EXPORT_CHUNK_BYTES = 64 * 1024  # Sıkıştırıcıya tek seferde verilen JSONL parça boyutu
+EXPORT_COMPRESSION_LEVEL = 6  # gzip seviyesi
+EXPORT_MAX_UPLOAD_MB = 50  # Telegram'ın bot belge gönderme sınırı
+IMPORT_MAX_DOWNLOAD_MB = 20  # Telegram'ın bot dosya indirme sınırı
+
+# Tekrarlanan güncellemeler
+UPDATE_CACHE_SIZE = 2000  # Hatırlanacak işlenmiş güncelleme sayısı
+UPDATE_LOG_FILE = os.getenv('UPDATE_LOG_FILE')  # Verilirse gelen güncellemeler replay için JSONL olarak kaydedilir
+
+# Metrikler (Prometheus formatında yerel HTTP endpoint)
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108  # Shard worker'ları bu portun üstündeki portları kullanır
+
+# Profil (yönetici komutları)
+PROFILE_DIR = "profiles"  # Profil çıktılarının yazılacağı klasör
+PROFILE_TOP_N = 10  # Yanıtta gösterilecek satır sayısı
+PROFILE_MAX_SECONDS = 300  # /profil ve /gorevler için üst süre sınırı
+SLOW_CALLBACK_SECONDS = 0.1  # Bu süreden uzun callback'ler yavaş sayılır
+TRACEMALLOC_FRAMES = 5  # tracemalloc'un sakladığı çağrı derinliği
+TRACEMALLOC_AT_STARTUP = os.getenv('TRACEMALLOC_AT_STARTUP') == '1'  # Yüklemedeki ayırmaları da görmek için
+
+# Event loop gecikme bekçisi
+LOOP_WATCHDOG_ENABLED = True
+LOOP_LAG_INTERVAL = 0.1  # Gecikme ölçümü aralığı (sn)
+LOOP_BLOCK_THRESHOLD = 0.5  # Loop bu süre yanıt vermezse bloklayan kodun yığını loglanır (sn)
+LOOP_BLOCK_STACK_DEPTH = 12  # Logda gösterilecek en içteki çerçeve sayısı
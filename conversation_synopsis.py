@@ -0,0 +1,180 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from config import RECENT_HISTORY_TURNS, SYNOPSIS_MAX_BATCH, SYNOPSIS_MAX_CHARS, SYNOPSIS_TRIGGER_TURNS, shard_path
+from durability import durable_writer, read_with_recovery
+from metrics import metrics, stage_duration
+
+logger = logging.getLogger(__name__)
+
+SYNOPSIS_FILE = "conversation_synopses.json"
+
+synopsis_updates = metrics.counter("bot_synopsis_updates_total", "Konuşma özeti yenilemeleri")
+
+
+def _speaker(msg: Dict[str, Any]) -> str:
+    return "Bot" if msg.get('message_type') == 'bot' else (msg.get('username') or f"User_{msg.get('user_id')}")
+
+
+class ConversationSynopsis:
+    """Sohbet + kullanıcı başına, eski konuşma turlarının kısa ve sürekli güncellenen özeti.
+
+    Prompt'a yalnızca son RECENT_HISTORY_TURNS mesaj aynen girer. Bundan
+    eski ve henüz özete katılmamış turlar SYNOPSIS_TRIGGER_TURNS'e ulaşınca,
+    önceki özetle birlikte arka plandaki bir görevde modele yoğunlaştırılır;
+    yanıt bu işi beklemez. Özet SYNOPSIS_MAX_CHARS ile sınırlı olduğundan
+    prompt boyu geçmiş uzadıkça büyümez. Model yanıt veremezse özet, eski
+    turlardan kırpılmış satırlarla yerelde güncellenir.
+    """
+
+    def __init__(self, synopsis_file: str = None):
+        self.synopsis_file = synopsis_file or shard_path(SYNOPSIS_FILE)
+        # "chat_id:user_id" -> {"text", "until" (özete giren son turun zamanı), "turns", "updated"}
+        self.synopses: Dict[str, Dict[str, Any]] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self._load()
+
+    @staticmethod
+    def _key(chat_id: int, user_id: int) -> str:
+        return f"{chat_id}:{user_id}"
+
+    def _load(self):
+        self.synopses = read_with_recovery(self.synopsis_file, json.loads) or {}
+
+    def _save(self):
+        with metrics.timer("persistence"):
+            durable_writer.write(
+                self.synopsis_file,
+                lambda: json.dumps(self.synopses, ensure_ascii=False).encode('utf-8'),
+            )
+
+    def attach(self, memory):
+        """GroupMemory'ye dinleyici olarak bağlanır (silinen mesajların özeti de silinir)."""
+        if self not in memory.listeners:
+            memory.add_listener(self)
+
+    def on_message_added(self, chat_id: int, record: Dict[str, Any]):
+        """Özetler yanıt sırasında, geçmiş okunurken yenilenir."""
+
+    def on_messages_cleared(self, chat_id: int, user_id: Optional[int] = None):
+        """GroupMemory dinleyicisi: sohbetin veya kullanıcının özetini siler."""
+        if user_id is None:
+            keys = [key for key in set(self.synopses) | set(self.tasks) if key.split(":", 1)[0] == str(chat_id)]
+        else:
+            keys = [self._key(chat_id, user_id)]
+        removed = False
+        for key in keys:
+            task = self.tasks.pop(key, None)
+            if task is not None:
+                task.cancel()
+            removed = self.synopses.pop(key, None) is not None or removed
+        if removed:
+            self._save()
+
+    def _pending_turns(self, key: str, history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Son turlardan eski olup henüz özete girmemiş turlar (kronolojik)."""
+        until = self.synopses.get(key, {}).get("until", 0)
+        older = history[:-RECENT_HISTORY_TURNS] if len(history) > RECENT_HISTORY_TURNS else []
+        return [msg for msg in older if msg['timestamp'] > until]
+
+    def schedule(self, chat_id: int, user_id: int, history: List[Dict[str, Any]], generate: Callable[[str], str]):
+        """Yeterince özetlenmemiş tur biriktiyse özeti arka planda yeniler.
+
+        `generate` prompt alıp metin döndüren bloklayan fonksiyondur; iş
+        parçacığı havuzunda çalıştırılır. Aynı anahtar için aynı anda tek
+        yenileme çalışır.
+        """
+        key = self._key(chat_id, user_id)
+        if key in self.tasks:
+            return
+        pending = self._pending_turns(key, history)
+        if len(pending) < SYNOPSIS_TRIGGER_TURNS:
+            return
+        # Görev çalışırken liste değişebilir; gereken alanlar şimdi kopyalanır
+        turns = [(_speaker(msg), msg['message'] or "", msg['timestamp']) for msg in pending[:SYNOPSIS_MAX_BATCH]]
+        task = asyncio.create_task(self._refresh(key, turns, generate))
+        self.tasks[key] = task
+        task.add_done_callback(lambda _: self.tasks.pop(key, None) if self.tasks.get(key) is task else None)
+
+    async def _refresh(self, key: str, turns: List[tuple], generate: Callable[[str], str]):
+        previous = self.synopses.get(key, {})
+        prompt = self._build_prompt(previous.get("text", ""), turns)
+        started = time.perf_counter()
+        try:
+            text = await asyncio.get_running_loop().run_in_executor(None, generate, prompt)
+            result = "model"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Synopsis generation failed for {key}, using extractive fallback: {e}")
+            text = None
+        if not text or not text.strip():
+            text = self._extractive(previous.get("text", ""), turns)
+            result = "fallback"
+        stage_duration.observe(time.perf_counter() - started, stage="synopsis")
+        self.synopses[key] = {
+            "text": self._clip(text.strip()),
+            "until": turns[-1][2],
+            "turns": previous.get("turns", 0) + len(turns),
+            "updated": time.time(),
+        }
+        self._save()
+        synopsis_updates.inc(result=result)
+
+    @staticmethod
+    def _build_prompt(previous: str, turns: List[tuple]) -> str:
+        lines = "\n".join(f"{speaker}: {message}" for speaker, message, _ in turns)
+        previous_block = f"Şimdiye kadarki özet:\n{previous}\n\n" if previous else ""
+        return f"""Aşağıdaki konuşmanın uzun süreli hafızası için kısa bir özet yaz.
+
+Kurallar:
+- Önceki özeti yeni turlarla birleştir; eski bilgiyi koru, tekrar etme
+- Kullanıcının kendisi hakkında söyledikleri, istekleri, kararlar ve açık kalan konular öncelikli
+- Düz metin, Türkçe, en fazla {SYNOPSIS_MAX_CHARS} karakter
+
+{previous_block}Yeni turlar:
+{lines}
+
+Özet:"""
+
+    @staticmethod
+    def _clip(text: str) -> str:
+        if len(text) <= SYNOPSIS_MAX_CHARS:
+            return text
+        return text[:SYNOPSIS_MAX_CHARS - 3] + "..."
+
+    @staticmethod
+    def _extractive(previous: str, turns: List[tuple]) -> str:
+        """Model olmadan özet: yeni turlar kısaltılarak eklenir, bütçe aşılırsa en eskiler düşer."""
+        lines = previous.splitlines() if previous else []
+        lines += [f"{speaker}: {message[:120]}" for speaker, message, _ in turns if message]
+        while lines and len("\n".join(lines)) > SYNOPSIS_MAX_CHARS:
+            lines.pop(0)
+        return "\n".join(lines)
+
+    def prompt_context(self, chat_id: int, user_id: int) -> str:
+        """Özeti prompt bloğu olarak döndürür; yoksa boş metin."""
+        entry = self.synopses.get(self._key(chat_id, user_id))
+        if not entry or not entry["text"]:
+            return ""
+        return f"\n\nÖnceki konuşmaların özeti:\n{entry['text']}\n"
+
+    def cancel_all(self):
+        """Süren yenilemeleri iptal eder (kapanışta)."""
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "synopses": len(self.synopses),
+            "in_flight": len(self.tasks),
+            "turns": sum(entry.get("turns", 0) for entry in self.synopses.values()),
+        }
+
+
+# Global conversation synopsis instance
+conversation_synopsis = ConversationSynopsis()
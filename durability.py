@@ -0,0 +1,257 @@
+import asyncio
+import atexit
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from config import DURABILITY_INTERVAL_SECONDS, DURABILITY_MODE
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_MODES = ("none", "interval", "every-write")
+BACKUP_SUFFIX = ".bak"  # Son başarılı anlık görüntünün bir önceki sürümü
+CORRUPT_SUFFIX = ".corrupt"
+
+durable_commits = metrics.counter("bot_durable_commits_total", "Diske yazılan toplu commit sayısı")
+durable_files = metrics.counter("bot_durable_files_total", "Commit'lerde yazılan dosya sayısı")
+
+
+def _fsync_directory(directory: str):
+    """Yeniden adlandırmanın kalıcı olması için klasör girdisini diske yazar."""
+    fd = os.open(directory or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_temporary(path: str, data: bytes, sync: bool) -> str:
+    temporary = f"{path}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(data)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+    return temporary
+
+
+def _install(path: str, temporary: str, backup: bool = True):
+    """Eski dosyayı yedek olarak saklayıp geçici dosyayı yerine koyar.
+
+    Yedek, eski dosyaya sabit bağlantı olarak oluşturulur; böylece `path`
+    hiçbir an eksik kalmaz.
+    """
+    if backup and os.path.exists(path):
+        backup_path = f"{path}{BACKUP_SUFFIX}"
+        try:
+            os.link(path, f"{backup_path}.tmp")
+        except FileExistsError:
+            os.remove(f"{backup_path}.tmp")
+            os.link(path, f"{backup_path}.tmp")
+        except OSError:
+            shutil.copy2(path, f"{backup_path}.tmp")
+        os.replace(f"{backup_path}.tmp", backup_path)
+    os.replace(temporary, path)
+
+
+def atomic_replace(path: str, data: bytes, sync: bool = True, backup: bool = True):
+    """Dosyayı geçici dosya + yeniden adlandırma ile yazar; çökmede yarım dosya kalmaz."""
+    _install(path, _write_temporary(path, data, sync), backup)
+    if sync:
+        _fsync_directory(os.path.dirname(path))
+
+
+def read_with_recovery(path: str, parse: Callable[[bytes], Any]) -> Optional[Any]:
+    """Dosyayı okur; yoksa veya bozuksa son iyi anlık görüntüye (.bak) döner.
+
+    Çözülemeyen dosya `.corrupt` uzantısıyla kenara alınır ki sonraki kayıt
+    onun üzerine yazmasın. Hiçbiri okunamazsa None döner.
+    """
+    for candidate in (path, f"{path}{BACKUP_SUFFIX}"):
+        if not os.path.exists(candidate):
+            continue
+        try:
+            with open(candidate, 'rb') as f:
+                data = parse(f.read())
+        except ValueError as e:
+            quarantined = f"{candidate}{CORRUPT_SUFFIX}"
+            os.replace(candidate, quarantined)
+            logger.error(f"Could not decode {candidate} ({e}); moved to {quarantined}")
+            continue
+        if candidate != path:
+            logger.warning(f"Recovered {path} from last good snapshot {candidate}")
+        return data
+    return None
+
+
+class DurableWriter:
+    """Depo dosyalarını seçilen dayanıklılık moduna göre atomik olarak yazar.
+
+    Modlar:
+      none        — her kayıtta atomik değiştirme, fsync yok (işletim sistemine güvenilir)
+      interval    — kayıtlar kirli işaretlenir; DURABILITY_INTERVAL_SECONDS'ta bir
+                    serileştirilip tek commit'te fsync'lenir
+      every-write — diskte commit yoksa kayıt hemen yazılmaya başlar;
+                    `wait_durable` kayıt fsync'lenmeden dönmez
+
+    fsync arka plandaki tek bir commit iş parçacığında yapılır. Bir commit
+    sürerken gelen kayıtlar kirli kalır ve commit bitince bekleyenlerden
+    biri hepsini birlikte serileştirip tek commit'e verir: eşzamanlı
+    yazanlar hem serileştirmeyi hem fsync turunu paylaşır (group commit).
+    """
+
+    def __init__(self, mode: str = None, interval: float = None):
+        self.mode = mode or DURABILITY_MODE
+        if self.mode not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {self.mode} (expected one of {', '.join(DURABILITY_MODES)})")
+        self.interval = DURABILITY_INTERVAL_SECONDS if interval is None else interval
+        self.condition = threading.Condition()
+        self.dirty: Dict[str, Callable[[], bytes]] = {}  # interval: henüz serileştirilmemiş dosyalar
+        self.pending: Dict[str, bytes] = {}  # Commit bekleyen dosya içerikleri
+        self.failed: Dict[str, bytes] = {}  # Commit'i başarısız olan, sonraki flush'ta yeniden denenecek içerikler
+        self.waiters: List[Future] = []  # Bir sonraki commit'i bekleyenler
+        self.committing: List[Future] = []  # Süren commit'i bekleyenler
+        self.in_commit = False
+        self.last_flush = time.monotonic()
+        self.thread: Optional[threading.Thread] = None
+        atexit.register(self.close)
+
+    def write(self, path: str, produce: Callable[[], bytes]):
+        """Dosyanın yeni içeriğini kaydeder; `produce` içeriği üreten fonksiyondur.
+
+        `produce` çağıran iş parçacığında çalışır (depo sözlükleri commit
+        iş parçacığıyla paylaşılmaz).
+        """
+        if self.mode == "none":
+            atomic_replace(path, produce(), sync=False)
+            return
+        self.dirty[path] = produce
+        if self.mode == "interval":
+            if time.monotonic() - self.last_flush >= self.interval:
+                self.flush()
+        elif not self.busy():
+            self.flush()
+
+    def busy(self) -> bool:
+        """Süren veya sırada bekleyen commit var mı."""
+        return self.in_commit or bool(self.pending)
+
+    def flush(self) -> Future:
+        """Kirli dosyaları serileştirip commit'e verir; commit bitince tamamlanan Future döner."""
+        with self.condition:
+            failed, self.failed = self.failed, {}
+        # Kirli dosyanın yeni içeriği başarısız commit'teki eskisinin yerini alır
+        batch = {**failed, **{path: produce() for path, produce in self.dirty.items()}}
+        self.dirty.clear()
+        self.last_flush = time.monotonic()
+        if not batch:
+            return self.barrier()
+        return self._submit(batch)
+
+    def barrier(self) -> Future:
+        """Şimdiye kadar commit'e verilen her şey diske yazılınca tamamlanan Future."""
+        future: Future = Future()
+        with self.condition:
+            if self.pending:
+                self.waiters.append(future)
+            elif self.in_commit:
+                self.committing.append(future)
+            else:
+                future.set_result(None)
+        return future
+
+    async def wait_durable(self):
+        """every-write modunda, bu ana kadarki kayıtlar fsync'lenene kadar bekler.
+
+        Aynı anda bekleyen handler'lar aynı commit'i paylaşır.
+        """
+        if self.mode != "every-write":
+            return
+        while self.dirty:
+            if not self.busy():
+                await asyncio.wrap_future(self.flush())
+                return
+            # Süren commit bitince kirli kalanlar (bizimki dahil) tek seferde yazılır
+            await asyncio.wrap_future(self.barrier())
+        await asyncio.wrap_future(self.barrier())
+
+    async def flush_periodically(self):
+        """Yeni yazma veya bekleyen gelmese de kirli dosyaları zamanında yazar.
+
+        every-write modunda commit sürerken yapılıp kimsenin beklemediği
+        kayıtlar için güvenlik ağıdır.
+        """
+        while self.mode != "none":
+            await asyncio.sleep(self.interval)
+            if (self.dirty or self.failed) and time.monotonic() - self.last_flush >= self.interval:
+                self.flush()
+
+    def sync(self):
+        """Kirli ve bekleyen her şeyi yazıp commit bitene kadar bloklar."""
+        if self.mode != "none":
+            self.flush().result()
+
+    def close(self):
+        try:
+            self.sync()
+        except Exception as e:
+            logger.error(f"Final durable flush failed: {e}")
+
+    def _submit(self, batch: Dict[str, bytes]) -> Future:
+        future: Future = Future()
+        with self.condition:
+            self.pending.update(batch)
+            self.waiters.append(future)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="durable-writer", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                batch, self.pending = self.pending, {}
+                self.committing, self.waiters = self.waiters, []
+                self.in_commit = True
+            error = None
+            try:
+                self._commit(batch)
+            except Exception as e:
+                logger.error(f"Durable commit of {len(batch)} files failed: {e}")
+                error = e
+            with self.condition:
+                if error is not None:
+                    # Sonraki flush yeniden dener; o arada daha yeni içerik sıraya girdiyse o kullanılır
+                    for path, data in batch.items():
+                        if path not in self.pending:
+                            self.failed[path] = data
+                waiters, self.committing = self.committing, []
+                self.in_commit = False
+            for future in waiters:
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+    def _commit(self, batch: Dict[str, bytes]):
+        """Tüm dosyaları geçici dosyalara yazıp fsync'ler, sonra yerlerine koyar."""
+        with metrics.timer("commit"):
+            temporaries = {path: _write_temporary(path, data, sync=True) for path, data in batch.items()}
+            for path, temporary in temporaries.items():
+                _install(path, temporary)
+            for directory in {os.path.dirname(path) for path in batch}:
+                _fsync_directory(directory)
+        durable_commits.inc()
+        durable_files.inc(len(batch))
+
+
+# Global durable writer instance
+durable_writer = DurableWriter()
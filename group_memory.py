@@ -1,54 +1,97 @@
-import json
-import os
 import time
-from typing import Dict, List, Any
+from typing import Dict, Iterator, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
+from config import ARCHIVE_BATCH_MESSAGES, STORAGE_FORMAT, shard_path
+from archive import message_archive
+from residency import ResidentStore
+from serializers import MESSAGES, get_serializer, read_store, store_path, write_store
+from metrics import metrics
 
 # Grup hafıza ayarları
 MAX_GROUP_MESSAGES = 50  # Her grup için saklanacak maksimum mesaj sayısı
 
+GROUP_MEMORY_FILE = "group_messages.json"
+PRIVATE_MEMORY_FILE = "private_messages.json"
+
 class GroupMemory:
-    def __init__(self):
-        self.group_memory_file = "group_messages.json"
-        self.private_memory_file = "private_messages.json"
-        self.group_messages: Dict[str, List[Dict[str, Any]]] = {}
-        self.private_messages: Dict[str, List[Dict[str, Any]]] = {}
+    def __init__(self, group_memory_file: str = None, private_memory_file: str = None, spill_dir: str = None, storage_format: str = None):
+        self.serializer = get_serializer(storage_format or STORAGE_FORMAT)
+        # Dosya uzantısı biçime göre belirlenir (.json / .snap)
+        self.group_memory_file = store_path(group_memory_file or shard_path(GROUP_MEMORY_FILE), self.serializer)
+        self.private_memory_file = store_path(private_memory_file or shard_path(PRIVATE_MEMORY_FILE), self.serializer)
+        # Ana dosyalarda yalnızca bellekteki sohbetler bulunur, çıkarılanlar spill_dir altında
+        self.group_messages: Dict[str, List[Dict[str, Any]]] = ResidentStore("groups", spill_dir)
+        self.private_messages: Dict[str, List[Dict[str, Any]]] = ResidentStore("private", spill_dir)
+        self.listeners: List[Any] = []
         self._load_group_memory()
         self._load_private_memory()
 
+    def add_listener(self, listener):
+        """Mesaj eklendiğinde ve silindiğinde haber alacak nesneyi kaydeder.
+
+        Dinleyici `on_message_added(chat_id, record)` ve
+        `on_messages_cleared(chat_id, user_id)` metotlarını sağlamalıdır;
+        toplu yeniden kurma için `on_messages_replaced(chat_id, records)`
+        isteğe bağlıdır.
+        Özel sohbetlerde chat_id kullanıcının ID'sidir; user_id None ise
+        sohbetin tüm mesajları silinmiştir.
+        """
+        self.listeners.append(listener)
+
+    def _notify_added(self, chat_id: int, record: Dict[str, Any]):
+        for listener in self.listeners:
+            listener.on_message_added(chat_id, record)
+
+    def _notify_cleared(self, chat_id: int, user_id: Optional[int] = None):
+        for listener in self.listeners:
+            listener.on_messages_cleared(chat_id, user_id)
+
+    def _notify_replaced(self, chat_id: int, records: List[Dict[str, Any]]):
+        """Sohbetin tüm mesajlarını (kronolojik) dinleyicilere yeniden verir.
+
+        `on_messages_replaced(chat_id, records)` sağlayan dinleyiciler sohbeti
+        toplu olarak yeniden kurar; diğerlerine silme ve tek tek ekleme gider.
+        """
+        for listener in self.listeners:
+            replace = getattr(listener, "on_messages_replaced", None)
+            if replace is not None:
+                replace(chat_id, records)
+                continue
+            listener.on_messages_cleared(chat_id, None)
+            for record in records:
+                listener.on_message_added(chat_id, record)
+
+    @staticmethod
+    def _archive_key(chat_id: int, private: bool = False) -> str:
+        return f"private_{chat_id}" if private else str(chat_id)
+
+    def _archive_overflow(self, messages: List[Dict[str, Any]], archive_key: str):
+        """Sıcak pencereyi MAX_GROUP_MESSAGES'a indirir, düşen mesajları arşive yazar.
+
+        Pencere her mesajda değil ARCHIVE_BATCH_MESSAGES kadar taşınca
+        kırpılır; böylece arşive tek tek değil bloklar halinde yazılır.
+        """
+        overflow = len(messages) - MAX_GROUP_MESSAGES
+        message_archive.append(archive_key, messages[:overflow])
+        del messages[:overflow]
+
     def _load_group_memory(self):
-        """Grup mesajlarını dosyadan yükler."""
-        if os.path.exists(self.group_memory_file):
-            try:
-                with open(self.group_memory_file, 'r', encoding='utf-8') as f:
-                    self.group_messages = json.load(f)
-            except json.JSONDecodeError:
-                self.group_messages = {}
-                print(f"Warning: Could not decode {self.group_memory_file}. Starting with empty group memory.")
-        else:
-            self.group_messages = {}
+        """Grup mesajlarını dosyadan yükler (bozuksa son iyi anlık görüntüden)."""
+        self.group_messages.load(read_store(self.group_memory_file, self.serializer, MESSAGES))
 
     def _load_private_memory(self):
-        """Özel mesajları dosyadan yükler."""
-        if os.path.exists(self.private_memory_file):
-            try:
-                with open(self.private_memory_file, 'r', encoding='utf-8') as f:
-                    self.private_messages = json.load(f)
-            except json.JSONDecodeError:
-                self.private_messages = {}
-                print(f"Warning: Could not decode {self.private_memory_file}. Starting with empty private memory.")
-        else:
-            self.private_messages = {}
+        """Özel mesajları dosyadan yükler (bozuksa son iyi anlık görüntüden)."""
+        self.private_messages.load(read_store(self.private_memory_file, self.serializer, MESSAGES))
 
     def _save_private_memory(self):
         """Özel mesajları dosyaya kaydeder."""
-        with open(self.private_memory_file, 'w', encoding='utf-8') as f:
-            json.dump(self.private_messages, f, ensure_ascii=False, indent=4)
+        with metrics.timer("persistence"):
+            write_store(self.private_memory_file, self.serializer, MESSAGES, self.private_messages)
 
     def _save_group_memory(self):
         """Grup mesajlarını dosyaya kaydeder."""
-        with open(self.group_memory_file, 'w', encoding='utf-8') as f:
-            json.dump(self.group_messages, f, ensure_ascii=False, indent=4)
+        with metrics.timer("persistence"):
+            write_store(self.group_memory_file, self.serializer, MESSAGES, self.group_messages)
 
     def add_private_message(self, user_id: int, username: str, message: str, message_type: str = "user"):
         """Özel mesajı kaydeder."""
@@ -57,19 +100,23 @@ class GroupMemory:
             self.private_messages[user_key] = []
 
         # Yeni mesajı ekle
-        self.private_messages[user_key].append({
+        record = {
             "user_id": user_id,
             "username": username,
             "message": message,
             "message_type": message_type,  # "user" veya "bot"
             "timestamp": time.time(),
             "datetime": datetime.now().isoformat()
-        })
+        }
+        self.private_messages[user_key].append(record)
+        self._notify_added(user_id, record)
 
-        # Maksimum mesaj sayısını kontrol et
-        if len(self.private_messages[user_key]) > MAX_GROUP_MESSAGES:
-            self.private_messages[user_key] = self.private_messages[user_key][-MAX_GROUP_MESSAGES:]
+        # Sıcak pencere taşınca en eski mesajları arşive aktar
+        if len(self.private_messages[user_key]) > MAX_GROUP_MESSAGES + ARCHIVE_BATCH_MESSAGES:
+            self._archive_overflow(self.private_messages[user_key], self._archive_key(user_id, private=True))
 
+        # Boşta kalan sohbetler dosyalarına yazılıp bellekten çıkarılır
+        self.private_messages.sweep(keep=user_key)
         self._save_private_memory()
 
     def add_private_bot_response(self, user_id: int, message: str):
@@ -81,26 +128,39 @@ class GroupMemory:
             message_type="bot"
         )
 
-    def add_group_message(self, chat_id: int, user_id: int, username: str, message: str, message_type: str = "user"):
-        """Grup mesajını kaydeder."""
+    def add_group_message(self, chat_id: int, user_id: int, username: str, message: str, message_type: str = "user",
+                          extra: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Grup mesajını kaydeder ve kaydı döndürür (`extra`: kayda eklenecek ek alanlar)."""
         chat_key = str(chat_id)
         if chat_key not in self.group_messages:
             self.group_messages[chat_key] = []
 
         # Yeni mesajı ekle
-        self.group_messages[chat_key].append({
+        record = {
             "user_id": user_id,
             "username": username,
             "message": message,
             "message_type": message_type,  # "user" veya "bot"
             "timestamp": time.time(),
             "datetime": datetime.now().isoformat()
-        })
+        }
+        if extra:
+            record.update(extra)
+        self.group_messages[chat_key].append(record)
+        self._notify_added(chat_id, record)
 
-        # Maksimum mesaj sayısını kontrol et
-        if len(self.group_messages[chat_key]) > MAX_GROUP_MESSAGES:
-            self.group_messages[chat_key] = self.group_messages[chat_key][-MAX_GROUP_MESSAGES:]
+        # Sıcak pencere taşınca en eski mesajları arşive aktar
+        if len(self.group_messages[chat_key]) > MAX_GROUP_MESSAGES + ARCHIVE_BATCH_MESSAGES:
+            self._archive_overflow(self.group_messages[chat_key], self._archive_key(chat_id))
 
+        # Boşta kalan sohbetler dosyalarına yazılıp bellekten çıkarılır
+        self.group_messages.sweep(keep=chat_key)
+        self._save_group_memory()
+        return record
+
+    def count_repeat(self, chat_id: int, record: Dict[str, Any]):
+        """Art arda tekrarlanan mesajı yeni kayıt yerine mevcut kaydın `repeat` sayacına ekler."""
+        record['repeat'] = record.get('repeat', 1) + 1
         self._save_group_memory()
 
     def add_bot_response(self, chat_id: int, message: str, responding_to_user_id: int = None, responding_to_username: str = None):
@@ -127,6 +187,8 @@ class GroupMemory:
         if user_key in self.private_messages:
             del self.private_messages[user_key]
             self._save_private_memory()
+        message_archive.remove_chat(self._archive_key(user_id, private=True))
+        self._notify_cleared(user_id)
 
     def get_conversation_history(self, chat_id: int, user_id: int = None) -> List[Dict[str, Any]]:
         """Belirli bir kullanıcıyla bot arasındaki konuşma geçmişini alır."""
@@ -160,9 +222,33 @@ class GroupMemory:
 
         return recent_messages
 
+    def hot_window(self, chat_id: int, private: bool = False) -> List[Dict[str, Any]]:
+        """Sohbetin sıcak penceresinin kopyası (event loop'ta alınır)."""
+        store = self.private_messages if private else self.group_messages
+        return list(store.get(str(chat_id), []))
+
+    def iter_messages(self, chat_id: int, since: float = None, until: float = None, private: bool = False,
+                      hot: List[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """[since, until) aralığındaki mesajları arşiv + sıcak pencereden eskiden yeniye üretir.
+
+        Arşiv segmentleri parça parça okunur; uzun aralıklar belleğe yüklenmez.
+        İş parçacığında kullanılacaksa `hot` ile `hot_window` kopyası verilir;
+        depolar okunmaz ve arşiv kopyadaki ilk mesajdan öncesiyle sınırlanır
+        (arada arşive taşınan mesajlar iki kez üretilmez).
+        """
+        archive_until = until
+        if hot is None:
+            hot = self.hot_window(chat_id, private)
+        elif hot:
+            archive_until = hot[0]['timestamp'] if until is None else min(until, hot[0]['timestamp'])
+        yield from message_archive.iter_messages(self._archive_key(chat_id, private), since, archive_until)
+        for msg in hot:
+            if (since is None or msg['timestamp'] >= since) and (until is None or msg['timestamp'] < until):
+                yield msg
+
     def get_message_summary(self, chat_id: int, hours: int = 24) -> str:
         """Mesajları özetler."""
-        recent_messages = self.get_recent_messages(chat_id, hours)
+        recent_messages = list(self.iter_messages(chat_id, since=time.time() - hours * 3600))
         
         if not recent_messages:
             return f"Son {hours} saatte hiç mesaj bulunamadı."
@@ -191,9 +277,15 @@ class GroupMemory:
         if chat_key in self.group_messages:
             del self.group_messages[chat_key]
             self._save_group_memory()
+        message_archive.remove_chat(self._archive_key(chat_id))
+        self._notify_cleared(chat_id)
 
-    def clear_user_messages(self, chat_id: int, user_id: int):
-        """Belirli bir kullanıcının mesajlarını temizler."""
+    def clear_user_messages(self, chat_id: int, user_id: int, include_archive: bool = True):
+        """Belirli bir kullanıcının mesajlarını temizler.
+
+        `include_archive=False` ile arşiv dokunulmadan kalır; arşiv segmentleri
+        ayrıca `clear_archived_user_messages` ile (ör. iş parçacığında) temizlenir.
+        """
         chat_key = str(chat_id)
         if chat_key in self.group_messages:
             # Kullanıcının mesajlarını filtrele (bot yanıtları kalır)
@@ -202,17 +294,117 @@ class GroupMemory:
                 if msg['user_id'] != user_id
             ]
             self._save_group_memory()
+        if include_archive:
+            self.clear_archived_user_messages(chat_id, user_id)
+        self._notify_cleared(chat_id, user_id)
+
+    def clear_archived_user_messages(self, chat_id: int, user_id: int):
+        """Kullanıcının mesajlarını sohbet arşivinden siler (segmentler yeniden yazılır).
+
+        Yalnızca arşiv dosyalarına dokunur; iş parçacığı havuzunda çalıştırılabilir.
+        """
+        message_archive.remove_user(self._archive_key(chat_id), user_id)
+
+    def hot_windows(self, chat_keys) -> Dict[Tuple[int, bool], List[Dict[str, Any]]]:
+        """Verilen (chat_id, özel_mi) sohbetlerinin sıcak pencere kopyaları (event loop'ta alınır)."""
+        return {(chat_id, private): self.hot_window(chat_id, private) for chat_id, private in chat_keys}
+
+    def plan_import(self, chats: Dict[Tuple[int, bool], List[Dict[str, Any]]],
+                    hot: Dict[Tuple[int, bool], List[Dict[str, Any]]]) -> Dict[Tuple[int, bool], List[Dict[str, Any]]]:
+        """Sohbette (arşiv + `hot` kopyası) bulunmayan mesajların kayıtlarını zaman sıralı döndürür.
+
+        Depolara dokunmaz, yalnızca arşivi okur; iş parçacığı havuzunda çalıştırılabilir.
+        """
+        planned: Dict[Tuple[int, bool], List[Dict[str, Any]]] = {}
+        for (chat_id, private), messages in chats.items():
+            # Metin kimliğe girmez: dışa aktarım alım filtresinin kırptığı mesajları tam metinle yazar
+            seen = {(msg['timestamp'], msg['user_id']) for msg in message_archive.iter_messages(self._archive_key(chat_id, private))}
+            seen.update((msg['timestamp'], msg['user_id']) for msg in hot.get((chat_id, private), []))
+            new = []
+            for msg in messages:
+                identity = (msg['timestamp'], msg['user_id'])
+                if identity in seen:
+                    continue
+                seen.add(identity)
+                record = {
+                    "user_id": msg['user_id'],
+                    "username": msg.get('username'),
+                    "message": msg['message'],
+                    "message_type": msg.get('message_type', "user"),
+                    "timestamp": msg['timestamp'],
+                    "datetime": datetime.fromtimestamp(msg['timestamp']).isoformat()
+                }
+                if msg.get('repeat'):
+                    record['repeat'] = msg['repeat']
+                new.append(record)
+            planned[(chat_id, private)] = sorted(new, key=lambda msg: msg['timestamp'])
+        return planned
+
+    def merge_hot_windows(self, planned: Dict[Tuple[int, bool], List[Dict[str, Any]]]) -> Dict[Tuple[int, bool], List[Dict[str, Any]]]:
+        """Yeni kayıtları sıcak pencerelere katar; pencereden taşan (arşive yazılacak) en eskileri döndürür."""
+        overflow: Dict[Tuple[int, bool], List[Dict[str, Any]]] = {}
+        for (chat_id, private), new in planned.items():
+            if not new:
+                continue
+            store = self.private_messages if private else self.group_messages
+            merged = sorted(store.get(str(chat_id), []) + new, key=lambda msg: msg['timestamp'])
+            excess = max(0, len(merged) - MAX_GROUP_MESSAGES)
+            overflow[(chat_id, private)] = merged[:excess]
+            store[str(chat_id)] = merged[excess:]
+        return overflow
+
+    def archive_import(self, overflow: Dict[Tuple[int, bool], List[Dict[str, Any]]]) -> Dict[Tuple[int, bool], List[Dict[str, Any]]]:
+        """Taşan mesajları arşive sıralı olarak birleştirir; sohbetlerin arşivdeki tüm mesajlarını döndürür.
+
+        Yalnızca arşiv dosyalarına dokunur; iş parçacığı havuzunda çalıştırılabilir.
+        """
+        archived: Dict[Tuple[int, bool], List[Dict[str, Any]]] = {}
+        for (chat_id, private), messages in overflow.items():
+            archive_key = self._archive_key(chat_id, private)
+            # Mevcut arşivden eski mesajlar sona eklenmez, ilgili günler sıralı yeniden yazılır
+            message_archive.merge(archive_key, messages)
+            archived[(chat_id, private)] = list(message_archive.iter_messages(archive_key))
+        return archived
+
+    def finish_import(self, archived: Dict[Tuple[int, bool], List[Dict[str, Any]]]):
+        """Dinleyicileri içe aktarılan sohbetlerin tüm mesajlarıyla toplu olarak yeniden kurar ve depoları kaydeder."""
+        for (chat_id, private), messages in archived.items():
+            store = self.private_messages if private else self.group_messages
+            self._notify_replaced(chat_id, messages + list(store.get(str(chat_id), [])))
+        if any(not private for _, private in archived):
+            self.group_messages.sweep(force=True)
+            self._save_group_memory()
+        if any(private for _, private in archived):
+            self.private_messages.sweep(force=True)
+            self._save_private_memory()
+
+    def import_messages(self, chats: Dict[Tuple[int, bool], List[Dict[str, Any]]]) -> Dict[Tuple[int, bool], int]:
+        """Dışa aktarılmış mesajları toplu olarak yükler; sohbet başına eklenen sayıyı döndürür.
+
+        `chats` anahtarları (chat_id, özel_mi) çiftleridir. Sohbette (arşiv
+        dahil) zaten bulunan mesajlar atlanır. Birleşen mesajlar zamana göre
+        sıralanır, sıcak pencereyi aşan en eskiler arşive sıralı birleştirilir
+        ve her depo mesaj başına değil sonda bir kez kaydedilir. Bot içinden
+        aşamalar ayrı çağrılır (bkz. history_export.apply_import_async).
+        """
+        planned = self.plan_import(chats, self.hot_windows(chats))
+        self.finish_import(self.archive_import(self.merge_hot_windows(planned)))
+        return {key: len(new) for key, new in planned.items()}
 
     def get_group_stats(self) -> Dict[str, Any]:
-        """Grup istatistiklerini döndürür."""
-        total_groups = len(self.group_messages)
+        """Grup istatistiklerini döndürür.
+
+        Mesaj sayısı yalnızca bellekteki grupları kapsar; çıkarılmış
+        gruplar bunun için diskten yüklenmez.
+        """
+        residency = self.group_messages.get_stats()
         total_messages = sum(len(msgs) for msgs in self.group_messages.values())
         
         return {
-            "total_groups": total_groups,
+            "total_groups": residency["total"],
+            "resident_groups": residency["resident"],
             "total_messages": total_messages,
             "max_messages_per_group": MAX_GROUP_MESSAGES,
-            "groups": list(self.group_messages.keys())
         }
 
 # Global grup hafıza instance'ı
@@ -0,0 +1,256 @@
+"""Sohbet geçmişi ve tercihlerinin sıkıştırılmış JSONL olarak dışa/içe aktarımı.
+
+Dosya biçimi (gzip, satır başına bir JSON nesnesi):
+    {"type": "header", "version": 1, "chat_id": ..., "private": ..., "exported_at": ...}
+    {"type": "message", "user_id": ..., "username": ..., "message": ..., "message_type": ..., "timestamp": ...[, "repeat": N]}
+    {"type": "preference", ...tercih kaydı...}
+    {"type": "footer", "messages": N, "preferences": M}
+
+Dışa aktarım bir üreteç zinciridir: kayıtlar (arşiv segmentleri parça parça
+okunur) -> JSONL satırları -> EXPORT_CHUNK_BYTES'lık parçalar -> gzip. Dosya
+parça parça yazılır; tüm içerik hiçbir an bellekte birikmez.
+
+Kullanım (bot durdurulmuşken; çalışan bot içe aktarılanın üzerine yazar):
+    python history_export.py export CHAT_ID [--private] [--output DOSYA]
+    python history_export.py import DOSYA [--chat CHAT_ID]
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import tempfile
+import time
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import EXPORT_CHUNK_BYTES, EXPORT_COMPRESSION_LEVEL, EXPORT_DIR, shard_path
+from ingest_filter import ingest_filter
+
+logger = logging.getLogger(__name__)
+
+EXPORT_VERSION = 1
+EXPORT_SUFFIX = ".jsonl.gz"
+MESSAGE_FIELDS = ("user_id", "username", "message", "message_type", "timestamp")
+
+
+class ExportFormatError(ValueError):
+    """Dosya beklenen dışa aktarım biçiminde değil."""
+
+
+def snapshot(memory, preferences, chat_id: int, private: bool) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Sıcak penceredeki mesajların ve tercihlerin kopyası (depoların sahibi olan iş parçacığında alınır)."""
+    store = memory.private_messages if private else memory.group_messages
+    return list(store.get(str(chat_id), [])), preferences.export_records(chat_id)
+
+
+def iter_records(archive, chat_id: int, private: bool, hot: List[Dict[str, Any]], preferences: List[Dict[str, Any]],
+                 counts: Dict[str, int]) -> Iterator[Dict[str, Any]]:
+    """Başlık, arşiv + sıcak pencere mesajları, tercihler ve kapanış kaydını üretir.
+
+    Arşiv, anlık görüntüdeki ilk sıcak mesajdan öncesiyle sınırlanır; arada
+    arşive taşınan mesajlar iki kez yazılmaz. Alım filtresinin kırptığı veya
+    tekrar olarak kısalttığı mesajlar tam metinleriyle yazılır. `counts`
+    yazılan kayıtları sayar.
+    """
+    yield {"type": "header", "version": EXPORT_VERSION, "chat_id": chat_id, "private": private, "exported_at": time.time()}
+    archive_key = f"private_{chat_id}" if private else str(chat_id)
+    until = hot[0]['timestamp'] if hot else None
+    for source in (archive.iter_messages(archive_key, until=until), hot):
+        for msg in source:
+            counts["messages"] += 1
+            record = {"type": "message", **{field: msg.get(field) for field in MESSAGE_FIELDS}}
+            record["message"] = ingest_filter.original(chat_id, msg)
+            if msg.get("repeat"):
+                record["repeat"] = msg["repeat"]
+            yield record
+    for user_data in preferences:
+        counts["preferences"] += 1
+        yield {"type": "preference", **user_data}
+    yield {"type": "footer", "messages": counts["messages"], "preferences": counts["preferences"]}
+
+
+def iter_lines(records: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    for record in records:
+        yield (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+
+
+def iter_chunks(lines: Iterable[bytes], chunk_bytes: int = EXPORT_CHUNK_BYTES) -> Iterator[bytes]:
+    """Satırları sıkıştırıcıya verilecek yaklaşık `chunk_bytes`lık parçalarda toplar."""
+    buffer: List[bytes] = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def iter_gzip(chunks: Iterable[bytes], level: int = EXPORT_COMPRESSION_LEVEL) -> Iterator[bytes]:
+    """Parçaları tek bir gzip akışı olarak sıkıştırır."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def write_export(path: str, archive, chat_id: int, private: bool, hot: List[Dict[str, Any]],
+                 preferences: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Dışa aktarım dosyasını parça parça yazar; mesaj/tercih sayısını ve boyutu döndürür.
+
+    Yalnızca arşiv dosyalarını okur; iş parçacığı havuzunda çalıştırılabilir.
+    """
+    counts = {"messages": 0, "preferences": 0}
+    temporary = f"{path}.tmp"
+    with open(temporary, 'wb') as f:
+        for data in iter_gzip(iter_chunks(iter_lines(iter_records(archive, chat_id, private, hot, preferences, counts)))):
+            f.write(data)
+    os.replace(temporary, path)
+    counts["bytes"] = os.path.getsize(path)
+    return counts
+
+
+def export_path(chat_id: int, private: bool) -> str:
+    directory = shard_path(EXPORT_DIR)
+    os.makedirs(directory, exist_ok=True)
+    prefix = f"{'private' if private else 'chat'}_{chat_id}_{time.strftime('%Y%m%d_%H%M%S')}_"
+    fd, path = tempfile.mkstemp(suffix=EXPORT_SUFFIX, prefix=prefix, dir=directory)
+    os.close(fd)
+    return path
+
+
+def iter_file_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Dışa aktarım dosyasını (gzip'li veya düz JSONL) satır satır okur ve doğrular."""
+    with open(path, 'rb') as raw:
+        compressed = raw.read(2) == b"\x1f\x8b"
+    opener = gzip.open if compressed else open
+    try:
+        with opener(path, 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline() or "null")
+            if not isinstance(header, dict) or header.get("type") != "header":
+                raise ExportFormatError("missing export header")
+            if header.get("version") != EXPORT_VERSION:
+                raise ExportFormatError(f"unsupported export version {header.get('version')}")
+            yield header
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    except (OSError, EOFError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ExportFormatError(f"unreadable export file: {e}") from e
+
+
+def read_import(path: str, chat_id: int = None) -> Tuple[Dict[Tuple[int, bool], List[Dict[str, Any]]], List[Dict[str, Any]]]:
+    """Dosyadaki mesajları (chat_id, özel_mi) başına, tercihleri liste olarak döndürür.
+
+    `chat_id` verilirse kayıtlar bu sohbete aktarılır. Kapanış kaydı yoksa
+    veya sayılar tutmuyorsa dosya eksik sayılır ve hiçbir şey döndürülmez.
+    """
+    chats: Dict[Tuple[int, bool], List[Dict[str, Any]]] = {}
+    preferences: List[Dict[str, Any]] = []
+    target: Optional[Tuple[int, bool]] = None
+    footer = None
+    for record in iter_file_records(path):
+        kind = record.pop("type", None)
+        if kind == "header":
+            private = bool(record.get("private"))
+            target = (chat_id if chat_id is not None else record["chat_id"], private)
+            chats[target] = []
+        elif kind == "message":
+            chats[target].append(record)
+        elif kind == "preference":
+            if chat_id is not None:
+                record["chat_id"] = chat_id
+            preferences.append(record)
+        elif kind == "footer":
+            footer = record
+        else:
+            raise ExportFormatError(f"unknown record type {kind!r}")
+    messages = sum(len(msgs) for msgs in chats.values())
+    if footer is None or footer.get("messages") != messages or footer.get("preferences") != len(preferences):
+        raise ExportFormatError("export file is truncated (footer missing or counts differ)")
+    return chats, preferences
+
+
+def _import_counts(chats: Dict[Tuple[int, bool], List[Dict[str, Any]]], added: int, preferences: int) -> Dict[str, int]:
+    return {
+        "messages": added,
+        "skipped": sum(len(msgs) for msgs in chats.values()) - added,
+        "preferences": preferences,
+    }
+
+
+def apply_import(memory, user_prefs, chats: Dict[Tuple[int, bool], List[Dict[str, Any]]],
+                 preferences: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Okunan kayıtları depolara toplu olarak yükler (depo başına tek kayıt)."""
+    added = memory.import_messages(chats)
+    return _import_counts(chats, sum(added.values()), user_prefs.import_records(preferences))
+
+
+async def apply_import_async(memory, user_prefs, chats: Dict[Tuple[int, bool], List[Dict[str, Any]]],
+                             preferences: List[Dict[str, Any]]) -> Dict[str, int]:
+    """`apply_import`'un çalışan bot içindeki karşılığı.
+
+    Arşiv taraması (tekrar ayıklama) ve arşiv yazımı iş parçacığı
+    havuzunda yapılır; depolar ve dinleyiciler yalnızca event loop'ta
+    değiştirilir, dinleyiciler mesaj başına değil sohbet başına bir kez
+    yeniden kurulur.
+    """
+    loop = asyncio.get_running_loop()
+    hot = memory.hot_windows(chats)
+    planned = await loop.run_in_executor(None, memory.plan_import, chats, hot)
+    overflow = memory.merge_hot_windows(planned)
+    archived = await loop.run_in_executor(None, memory.archive_import, overflow)
+    memory.finish_import(archived)
+    added = sum(len(new) for new in planned.values())
+    return _import_counts(chats, added, user_prefs.import_records(preferences))
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Sohbet geçmişini dışa/içe aktar")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Sohbeti .jsonl.gz olarak dışa aktar")
+    export_parser.add_argument("chat_id", type=int)
+    export_parser.add_argument("--private", action="store_true", help="Özel sohbet (chat_id kullanıcı ID'sidir)")
+    export_parser.add_argument("--output", help="Çıktı dosyası (varsayılan: exports/ altında)")
+    import_parser = commands.add_parser("import", help="Dışa aktarım dosyasını yükle")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--chat", type=int, help="Kayıtları bu sohbete aktar")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # Depolar burada yüklenir; yalnızca --help için dosyalar açılmasın
+    from archive import message_archive
+    from durability import durable_writer
+    from group_memory import group_memory
+    from user_preferences import user_preferences
+
+    if args.command == "export":
+        path = args.output or export_path(args.chat_id, args.private)
+        hot, preferences = snapshot(group_memory, user_preferences, args.chat_id, args.private)
+        counts = write_export(path, message_archive, args.chat_id, args.private, hot, preferences)
+        print(f"{path}: {counts['messages']} messages, {counts['preferences']} preferences, {counts['bytes']} bytes")
+    else:
+        # Kalıcı dizinler de içe aktarılan mesajlarla güncellensin (bot bunları başlarken bağlar)
+        from columnar_store import columnar_store
+        from conversation_synopsis import conversation_synopsis
+        from search_index import search_index
+        from semantic_memory import semantic_memory
+        for listener in (semantic_memory, search_index, columnar_store, conversation_synopsis):
+            listener.attach(group_memory)
+        try:
+            chats, preferences = read_import(args.path, args.chat)
+        except ExportFormatError as e:
+            raise SystemExit(f"Import failed: {e}")
+        counts = apply_import(group_memory, user_preferences, chats, preferences)
+        durable_writer.sync()
+        print(f"Imported {counts['messages']} messages ({counts['skipped']} already present), {counts['preferences']} preferences")
+
+
+if __name__ == "__main__":
+    main()
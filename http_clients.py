@@ -0,0 +1,132 @@
+import asyncio
+import importlib.util
+import logging
+
+import httpx
+from requests.adapters import HTTPAdapter
+from telegram.request import HTTPXRequest
+
+from config import (
+    GEMINI_POOL_SIZE, GEMINI_TIMEOUT, HTTP_CONNECT_TIMEOUT, HTTP_KEEPALIVE_SECONDS, HTTP_POOL_TIMEOUT,
+    HTTP_READ_TIMEOUT, HTTP_WRITE_TIMEOUT, TELEGRAM_HTTP2, TELEGRAM_POOL_SIZE, TELEGRAM_UPDATES_POOL_SIZE,
+    UVLOOP_ENABLED,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PooledHTTPXRequest(HTTPXRequest):
+    """Bağlantı havuzu ayarları açık verilen HTTPXRequest.
+
+    PTB havuz boyutunu kabul eder ama boşta bağlantıların ne kadar açık
+    tutulacağını (keep-alive süresi) ayarlatmaz; httpx limitleri istemci
+    her kurulduğunda (ilk kurulumda ve kapatılıp yeniden başlatılınca)
+    buradan verilir.
+    """
+
+    def __init__(self, pool_size: int, keepalive_seconds: float = HTTP_KEEPALIVE_SECONDS, **kwargs):
+        # super().__init__ istemciyi hemen kurar; limitler ondan önce hazır olmalı
+        self._limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=keepalive_seconds,
+        )
+        super().__init__(connection_pool_size=pool_size, **kwargs)
+
+    def _build_client(self) -> httpx.AsyncClient:
+        # python-telegram-bot 20.7 iç yapısına bağlı: HTTPXRequest istemciyi
+        # `_build_client()` ile `self._client_kwargs`'tan kurar. Sürüm
+        # yükseltilirse bu iki özel ad yeniden kontrol edilmeli.
+        self._client_kwargs["limits"] = self._limits
+        return super()._build_client()
+
+
+def http2_available() -> bool:
+    """httpx'in HTTP/2 desteği için `h2` paketi kurulu mu."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def telegram_request(pool_size: int = TELEGRAM_POOL_SIZE, http2: bool = TELEGRAM_HTTP2,
+                     keepalive_seconds: float = HTTP_KEEPALIVE_SECONDS) -> HTTPXRequest:
+    """Giden Bot API çağrıları (sendMessage, editMessageText...) için havuz.
+
+    Gönderim kuyruğu aynı anda birden çok sohbete yazar; havuz bu eşzamanlılığı
+    taşıyacak kadar büyük tutulur. HTTP/2 istenip `h2` kurulu değilse HTTP/1.1
+    kullanılır.
+    """
+    if http2 and not http2_available():
+        logger.warning("TELEGRAM_HTTP2 is set but the h2 package is missing; using HTTP/1.1")
+        http2 = False
+    return PooledHTTPXRequest(
+        pool_size,
+        keepalive_seconds=keepalive_seconds,
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+        read_timeout=HTTP_READ_TIMEOUT,
+        write_timeout=HTTP_WRITE_TIMEOUT,
+        pool_timeout=HTTP_POOL_TIMEOUT,
+        http_version="2" if http2 else "1.1",
+    )
+
+
+def updates_request(pool_size: int = TELEGRAM_UPDATES_POOL_SIZE) -> HTTPXRequest:
+    """getUpdates uzun yoklaması için ayrı havuz.
+
+    Uzun yoklama bağlantıyı dakikalarca meşgul eder; giden çağrılarla aynı
+    havuzda olsaydı yanıtlar boş bağlantı beklerdi. PTB okuma zaman aşımına
+    yoklama süresini kendisi ekler. HTTP/1.1 kullanılır.
+    """
+    return PooledHTTPXRequest(
+        pool_size,
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+        read_timeout=HTTP_READ_TIMEOUT,
+        write_timeout=HTTP_WRITE_TIMEOUT,
+        pool_timeout=HTTP_POOL_TIMEOUT,
+    )
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """Zaman aşımı verilmeyen isteklere varsayılan zaman aşımı uygulayan requests adaptörü."""
+
+    def __init__(self, timeout: float, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        return super().send(request, timeout=timeout if timeout is not None else self.timeout, **kwargs)
+
+
+def tune_gemini_client(pool_size: int = GEMINI_POOL_SIZE, timeout: float = GEMINI_TIMEOUT) -> bool:
+    """Gemini SDK'nın paylaşılan REST oturumuna ayarlı bağlantı havuzu takar.
+
+    SDK tüm GenerativeModel'ler için tek bir varsayılan istemci kullanır;
+    REST taşımasında bu istemcinin requests oturumu burada ayarlanır. gRPC
+    taşıması zaten tek, çoğullanan bir HTTP/2 kanalı kullanır; ona
+    dokunulmaz. Havuz takıldıysa True döner.
+    """
+    from google.generativeai import client as genai_client
+
+    client = genai_client.get_default_generative_client()
+    session = getattr(getattr(client, "_transport", None), "_session", None)
+    if session is None:
+        return False
+    adapter = TimeoutHTTPAdapter(timeout, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return True
+
+
+def install_event_loop_policy(enabled: bool = UVLOOP_ENABLED) -> bool:
+    """UVLOOP etkinse ve uvloop kuruluysa asyncio loop politikasını değiştirir.
+
+    `asyncio.run`dan önce çağrılmalıdır. Kullanılabilirse True döner.
+    """
+    if not enabled:
+        return False
+    try:
+        import uvloop
+    except ImportError:
+        logger.warning("UVLOOP is set but uvloop is not installed; using the default event loop")
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import logging
+import os
+from collections import deque
+from typing import Any, Deque, Dict, NamedTuple, Optional
+
+import numpy as np
+
+from config import (INGEST_MAX_CHARS, INGEST_MIN_CHARS, INGEST_ORIGINALS_DIR, INGEST_PREVIEW_CHARS,
+                    INGEST_SIMHASH_DISTANCE, INGEST_WINDOW_MESSAGES, shard_path)
+from metrics import metrics
+from turkish_text import tokenize
+
+logger = logging.getLogger(__name__)
+
+SIMHASH_BITS = 64
+SIMHASH_MAX_CHARS = 2000  # Parmak izi metnin bu kadarından hesaplanır
+DUPLICATE_PREFIX = "[tekrar]"
+
+ingest_results = metrics.counter("bot_ingest_messages_total", "Alım filtresinden geçen bota yönelmeyen grup mesajları")
+ingest_saved_chars = metrics.counter("bot_ingest_saved_chars_total", "Alım filtresinin sıcak pencereye yazmadığı karakterler")
+
+
+def _normalize(text: str) -> str:
+    """Karşılaştırma metni: Türkçe küçük harf, aksansız kelimeler; kelime yoksa (emoji vb.) boşlukları sadeleşmiş metin."""
+    return " ".join(tokenize(text)) or " ".join(text.split())
+
+
+def simhash(text: str) -> int:
+    """Karakter 3-gram'larının 64 bitlik SimHash parmak izi.
+
+    Python'un str hash'i süreç başına rastgele olduğundan n-gram'lar
+    blake2b ile özetlenir; aynı metin her süreçte aynı parmak izini verir.
+    """
+    padded = f" {text[:SIMHASH_MAX_CHARS]} "
+    shingles = {padded[start:start + 3] for start in range(len(padded) - 2)}
+    hashes = np.frombuffer(
+        b"".join(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest() for shingle in shingles),
+        dtype=np.uint64,
+    )
+    bits = (hashes[:, None] >> np.arange(SIMHASH_BITS, dtype=np.uint64)) & np.uint64(1)
+    votes = bits.sum(axis=0) * 2 > len(shingles)
+    return sum(1 << int(bit) for bit in np.flatnonzero(votes))
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def display_text(msg: Dict[str, Any]) -> str:
+    """Prompt ve özetler için mesaj metni; art arda tekrarlar sayıyla gösterilir."""
+    repeat = msg.get('repeat', 1)
+    return f"{msg['message']} (×{repeat})" if repeat > 1 else msg['message']
+
+
+class _Seen(NamedTuple):
+    fingerprint: Optional[int]  # Kısa mesajlarda None
+    normalized: str
+    record: Dict[str, Any]
+
+
+class IngestFilter:
+    """Bota yönelmeyen grup mesajlarını GroupMemory'ye yazmadan önce sadeleştirir.
+
+    - Aynı kullanıcının art arda tekrarladığı mesaj yeni kayıt açmaz, önceki
+      kaydın `repeat` sayacını artırır.
+    - Sohbetin son INGEST_WINDOW_MESSAGES mesajından birine SimHash ile yakın
+      olan mesaj (kopyala-yapıştır, zincir mesaj) kısa bir önizleme olarak
+      saklanır.
+    - INGEST_MAX_CHARS'tan uzun mesajlar kırpılarak saklanır.
+
+    Yakın tekrarların ve kırpılan mesajların tam metni sohbet başına ayrı bir
+    JSONL dosyasına eklenir; kayıttaki `original_ref` bu dosyadaki bayt
+    konumudur ve `original()` ile okunur. INGEST_MIN_CHARS'tan kısa mesajlar
+    yalnızca birebir art arda tekrarlarda birleştirilir.
+    """
+
+    def __init__(self, originals_dir: str = None):
+        self.originals_dir = originals_dir or shard_path(INGEST_ORIGINALS_DIR)
+        self.memory = None
+        self.windows: Dict[int, Deque[_Seen]] = {}
+
+    def attach(self, memory):
+        """GroupMemory'ye dinleyici olarak bağlanır; mesajlar bu depoya yazılır."""
+        self.memory = memory
+        if self not in memory.listeners:
+            memory.add_listener(self)
+
+    def on_message_added(self, chat_id: int, record: Dict[str, Any]):
+        """Pencere yalnızca `ingest` ile gelen mesajlardan kurulur."""
+
+    def on_messages_cleared(self, chat_id: int, user_id: Optional[int] = None):
+        """GroupMemory dinleyicisi: pencereyi ve silinen mesajların tam metinlerini siler."""
+        self.windows.pop(chat_id, None)
+        path = self._originals_path(chat_id)
+        if not os.path.exists(path):
+            return
+        if user_id is not None:
+            self._blank_originals(path, user_id)
+        elif str(chat_id) not in self.memory.group_messages:
+            # İçe aktarma, dizinleri yeniden kurmak için de bu bildirimi gönderir; sohbet o zaman silinmemiştir
+            os.remove(path)
+
+    def _originals_path(self, chat_id: int) -> str:
+        return os.path.join(self.originals_dir, f"{chat_id}.jsonl")
+
+    def _store_original(self, chat_id: int, user_id: int, username: str, message: str, reason: str) -> int:
+        """Tam metni sohbetin dosyasına ekler, satırın bayt konumunu döndürür."""
+        os.makedirs(self.originals_dir, exist_ok=True)
+        line = json.dumps({"user_id": user_id, "username": username, "message": message, "reason": reason}, ensure_ascii=False)
+        with open(self._originals_path(chat_id), 'ab') as f:
+            offset = f.tell()
+            f.write(line.encode('utf-8') + b"\n")
+        return offset
+
+    @staticmethod
+    def _blank_originals(path: str, user_id: int):
+        """Kullanıcının satırlarını aynı uzunlukta boş kayıtla değiştirir (diğer konumlar geçerli kalır)."""
+        with open(path, 'r+b') as f:
+            offset = 0
+            for line in iter(f.readline, b""):
+                if json.loads(line).get("user_id") == user_id:
+                    f.seek(offset)
+                    f.write(b"{}" + b" " * (len(line) - 3) + b"\n")
+                    f.seek(offset + len(line))
+                offset += len(line)
+
+    def original(self, chat_id: int, msg: Dict[str, Any]) -> str:
+        """Kaydın tam metni: kırpılmış veya tekrar olarak saklandıysa ayrı dosyadan okunur."""
+        offset = msg.get('original_ref')
+        if offset is None:
+            return msg['message']
+        try:
+            with open(self._originals_path(chat_id), 'rb') as f:
+                f.seek(offset)
+                return json.loads(f.readline()).get("message", msg['message'])
+        except (OSError, ValueError) as e:
+            logger.warning(f"Original text of a message in chat {chat_id} is unavailable: {e}")
+            return msg['message']
+
+    @staticmethod
+    def _is_near(seen: _Seen, fingerprint: Optional[int]) -> bool:
+        return (fingerprint is not None and seen.fingerprint is not None
+                and hamming(seen.fingerprint, fingerprint) <= INGEST_SIMHASH_DISTANCE)
+
+    def _find_duplicate(self, window: Deque[_Seen], fingerprint: Optional[int]) -> Optional[_Seen]:
+        return next((seen for seen in reversed(window) if self._is_near(seen, fingerprint)), None)
+
+    def ingest(self, chat_id: int, user_id: int, username: str, message: str) -> str:
+        """Mesajı filtreden geçirip kaydeder; sonucu döndürür ("stored", "repeat", "duplicate" veya "capped")."""
+        normalized = _normalize(message)
+        fingerprint = simhash(normalized) if len(normalized) >= INGEST_MIN_CHARS else None
+        window = self.windows.setdefault(chat_id, deque(maxlen=INGEST_WINDOW_MESSAGES))
+        messages = self.memory.group_messages.get(str(chat_id))
+        last = window[-1] if window else None
+
+        # Araya başka mesaj (bot yanıtı dahil) girmediyse ve aynı kullanıcıdansa art arda tekrar
+        if (last is not None and messages and messages[-1] is last.record and last.record['user_id'] == user_id
+                and (normalized == last.normalized or self._is_near(last, fingerprint))):
+            self.memory.count_repeat(chat_id, last.record)
+            return self._count("repeat", len(message))
+
+        extra = None
+        result = "stored"
+        duplicate = self._find_duplicate(window, fingerprint)
+        if duplicate is not None:
+            preview = message[:INGEST_PREVIEW_CHARS].rstrip() + ("…" if len(message) > INGEST_PREVIEW_CHARS else "")
+            extra = {
+                "original_ref": self._store_original(chat_id, user_id, username, message, "duplicate"),
+                "duplicate_of": duplicate.record['timestamp'],
+            }
+            stored, result = f"{DUPLICATE_PREFIX} {preview}", "duplicate"
+        elif len(message) > INGEST_MAX_CHARS:
+            extra = {"original_ref": self._store_original(chat_id, user_id, username, message, "capped")}
+            stored, result = f"{message[:INGEST_MAX_CHARS]}… [+{len(message) - INGEST_MAX_CHARS} karakter]", "capped"
+        else:
+            stored = message
+
+        record = self.memory.add_group_message(chat_id, user_id, username, stored, "user", extra=extra)
+        window.append(_Seen(fingerprint, normalized, record))
+        return self._count(result, max(0, len(message) - len(stored)))
+
+    @staticmethod
+    def _count(result: str, saved_chars: int) -> str:
+        ingest_results.inc(result=result)
+        if saved_chars:
+            ingest_saved_chars.inc(saved_chars)
+        return result
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "stored": int(ingest_results.get(result="stored")),
+            "repeat": int(ingest_results.get(result="repeat")),
+            "duplicate": int(ingest_results.get(result="duplicate")),
+            "capped": int(ingest_results.get(result="capped")),
+            "saved_chars": int(ingest_saved_chars.get()),
+        }
+
+
+# Global ingest filter instance
+ingest_filter = IngestFilter()
@@ -0,0 +1 @@
+"""Sahte Telegram Bot API ve Gemini sunucularıyla uçtan uca yük testi."""
@@ -0,0 +1,218 @@
+"""Gerçek TelegramAIBot'u sahte Bot API ve Gemini sunucularına karşı çalıştıran yük testi.
+
+Kullanım:
+    python -m loadtest.driver --groups 5 --users 40 --messages 500 --rate 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+
+from loadtest.fake_gemini import FakeGeminiServer, LatencyModel
+from loadtest.fake_telegram import FakeTelegramServer
+
+REPLY_TAG_PATTERN = re.compile(r"\[#q(\d+)\]")
+ERROR_REPLY_PREFIXES = ("Üzgünüm", "Bir hata oluştu")
+
+
+def rss_bytes() -> int:
+    """Sürecin anlık RSS değerini döndürür (Linux)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class FakeServers:
+    """Sahte sunucuları ayrı bir thread'in event loop'unda çalıştırır.
+
+    Bot, Gemini'yi senkron (requests) çağırdığı için sunucular botla aynı
+    loop'ta olsaydı istek hiç yanıtlanamazdı.
+    """
+
+    def __init__(self, telegram: FakeTelegramServer, gemini: FakeGeminiServer):
+        self.telegram = telegram
+        self.gemini = gemini
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="fake-servers", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        self.call(self.telegram.start())
+        self.call(self.gemini.start())
+
+    def call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def push_update(self, *args, **kwargs):
+        async def push():
+            return self.telegram.push_update(*args, **kwargs)
+        return self.call(push())
+
+    def stop(self):
+        self.call(self.telegram.stop())
+        self.call(self.gemini.stop())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+async def run_load_test(args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    telegram = FakeTelegramServer()
+    gemini = FakeGeminiServer(
+        LatencyModel(args.latency, args.latency_median, args.latency_spread, args.first_token_ratio, args.seed),
+        error_rate=args.error_rate,
+    )
+    servers = FakeServers(telegram, gemini)
+    servers.start()
+
+    # Bot modülleri ortam değişkenlerini import anında okur, veri dosyaları çalışma klasörüne yazılır
+    os.chdir(args.workdir or tempfile.mkdtemp(prefix="loadtest_"))
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": "123456:FAKE-TOKEN",
+        "GEMINI_API_KEY": "fake-key",
+        "TELEGRAM_API_BASE_URL": telegram.base_url,
+        "GEMINI_API_ENDPOINT": gemini.endpoint,
+        "ALLOWED_GROUPS": "",
+    })
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from main import TelegramAIBot
+    from group_memory import group_memory
+    from loop_watchdog import loop_watchdog
+
+    bot = TelegramAIBot()
+    application = bot.application
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(poll_interval=0.0, timeout=5)
+    bot_username = application.bot.username
+    # Yük altında loop gecikmesi de ölçülür (start_services çağrılmadığı için burada başlatılır)
+    watchdog_task = asyncio.create_task(loop_watchdog.run())
+
+    groups = [{"id": -1001000000000 - index, "type": "supergroup", "title": f"Grup {index}"} for index in range(args.groups)]
+    users = [{"id": 10_000 + index, "is_bot": False, "first_name": f"Kullanici{index}", "username": f"kullanici{index}"} for index in range(args.users)]
+
+    rss_start = rss_bytes()
+    rss_peak = rss_start
+    injected: Dict[int, float] = {}
+    started = time.perf_counter()
+
+    for index in range(args.messages):
+        sender = rng.choice(users)
+        if rng.random() < args.private_ratio:
+            chat = {"id": sender["id"], "type": "private", "first_name": sender["first_name"]}
+            addressed = True
+            text = f"selam, bir şiir söyler misin #q{index}"
+        else:
+            chat = rng.choice(groups)
+            addressed = rng.random() < args.mention_ratio
+            text = f"@{bot_username} bugün ne düşünüyorsun #q{index}" if addressed else f"bugün hava çok güzel {index}"
+        servers.push_update(chat, sender, text)
+        if addressed:
+            injected[index] = time.perf_counter()
+
+        if index % 50 == 0:
+            rss_peak = max(rss_peak, rss_bytes())
+        next_at = started + (index + 1) / args.rate
+        await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+
+    # Tüm yanıtları (veya zaman aşımını) bekle
+    latencies: Dict[int, float] = {}
+    errors = 0
+    deadline = time.perf_counter() + args.drain_timeout
+    while time.perf_counter() < deadline:
+        latencies, errors = {}, 0
+        for sent in list(telegram.sent):
+            if sent["text"].startswith(ERROR_REPLY_PREFIXES):
+                errors += 1
+            for tag in REPLY_TAG_PATTERN.findall(sent["text"]):
+                tag = int(tag)
+                if tag in injected and tag not in latencies:
+                    latencies[tag] = sent["time"] - injected[tag]
+        rss_peak = max(rss_peak, rss_bytes())
+        if len(latencies) + errors >= len(injected):
+            break
+        await asyncio.sleep(0.2)
+    elapsed = time.perf_counter() - started
+    rss_end = rss_bytes()
+
+    watchdog_task.cancel()
+    loop_stats = loop_watchdog.get_stats()
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    servers.stop()
+
+    values = list(latencies.values())
+    return {
+        "messages": args.messages,
+        "addressed": len(injected),
+        "replies": len(latencies),
+        "error_replies": errors,
+        "unanswered": len(injected) - len(latencies) - errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_replies_per_second": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_p50_ms": round(percentile(values, 0.50) * 1000, 1),
+        "latency_p95_ms": round(percentile(values, 0.95) * 1000, 1),
+        "latency_p99_ms": round(percentile(values, 0.99) * 1000, 1),
+        "loop_lag_p99_ms": loop_stats["lag_p99_ms"],
+        "loop_lag_max_ms": loop_stats["max_lag_ms"],
+        "loop_blocks": loop_stats["blocks"],
+        "rss_start_mb": round(rss_start / 1024 / 1024, 1),
+        "rss_end_mb": round(rss_end / 1024 / 1024, 1),
+        "rss_peak_mb": round(rss_peak / 1024 / 1024, 1),
+        "rss_growth_mb": round((rss_end - rss_start) / 1024 / 1024, 1),
+        "stored_group_messages": sum(len(messages) for messages in group_memory.group_messages.values()),
+        "telegram_requests": telegram.requests,
+        "telegram_connections": len(telegram.connections),
+        "gemini_requests": gemini.requests,
+        "gemini_errors": gemini.errors,
+        "gemini_connections": len(gemini.connections),
+    }
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Sahte Telegram/Gemini sunucularıyla TelegramAIBot yük testi")
+    parser.add_argument("--groups", type=int, default=5, help="Simüle edilecek grup sayısı")
+    parser.add_argument("--users", type=int, default=40, help="Simüle edilecek kullanıcı sayısı")
+    parser.add_argument("--messages", type=int, default=300, help="Gönderilecek toplam mesaj")
+    parser.add_argument("--rate", type=float, default=10.0, help="Saniyede gönderilecek mesaj")
+    parser.add_argument("--mention-ratio", type=float, default=0.3, help="Gruplarda bota yönelik mesaj oranı")
+    parser.add_argument("--private-ratio", type=float, default=0.1, help="Özel mesaj oranı")
+    parser.add_argument("--latency", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--latency-median", type=float, default=0.5, help="Gemini gecikme medyanı (sn)")
+    parser.add_argument("--latency-spread", type=float, default=0.4)
+    parser.add_argument("--first-token-ratio", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Gemini hata oranı (0-1)")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="Son mesajdan sonra yanıt bekleme süresi")
+    parser.add_argument("--workdir", help="Veri dosyalarının yazılacağı klasör (varsayılan geçici klasör)")
+    parser.add_argument("--output", help="Sonuçların yazılacağı JSON dosyası")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    output = os.path.abspath(arguments.output) if arguments.output else None
+    results = asyncio.run(run_load_test(arguments))
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
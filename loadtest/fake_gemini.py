@@ -0,0 +1,114 @@
+import asyncio
+import json
+import random
+import re
+from typing import Optional
+
+from aiohttp import web
+
+# REST yanıtlarında enum'lar sayı olarak gelir (1 = STOP)
+FINISH_REASON_STOP = 1
+
+# Yük testi sürücüsünün mesajlara eklediği etiket; yanıtta geri döndürülür
+REQUEST_TAG_PATTERN = re.compile(r"#q\d+")
+
+
+class LatencyModel:
+    """Yanıt gecikmesi dağılımı: sabit, uniform veya lognormal (saniye)."""
+
+    def __init__(self, distribution: str = "lognormal", median: float = 0.8, spread: float = 0.4, first_token_ratio: float = 0.3, seed: int = 0):
+        self.distribution = distribution
+        self.median = median
+        self.spread = spread
+        self.first_token_ratio = first_token_ratio
+        self.rng = random.Random(seed)
+
+    def sample(self) -> float:
+        if self.distribution == "fixed":
+            return self.median
+        if self.distribution == "uniform":
+            return self.rng.uniform(max(0.0, self.median - self.spread), self.median + self.spread)
+        return self.rng.lognormvariate(0, self.spread) * self.median
+
+
+class FakeGeminiServer:
+    """generateContent / streamGenerateContent taklidi yapan yerel sunucu.
+
+    Gecikme `LatencyModel` ile, hatalar `error_rate` olasılığıyla (HTTP 500)
+    üretilir. Akış isteklerinde ilk parça toplam gecikmenin
+    `first_token_ratio` kadarında gönderilir.
+    """
+
+    def __init__(self, latency: LatencyModel = None, error_rate: float = 0.0, reply_words: int = 30):
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.reply_words = reply_words
+        self.requests = 0
+        self.connections = set()
+        self.errors = 0
+        self.runner: Optional[web.AppRunner] = None
+        self.port: Optional[int] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        app = web.Application()
+        app.router.add_post("/v1beta/{name:.*}", self._handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def _chunk(self, text: str) -> str:
+        return json.dumps({
+            "candidates": [{
+                "content": {"parts": [{"text": text}], "role": "model"},
+                "finishReason": FINISH_REASON_STOP,
+                "index": 0,
+            }]
+        })
+
+    def _reply_text(self, prompt: str) -> str:
+        words = ["efendimiz", "belî", "şiir", "mahzen", "gönül", "selam", "hikmet", "dünya"]
+        rng = self.latency.rng
+        # Prompt'un sonundaki kullanıcı mesajının etiketi (geçmişteki etiketler daha önce gelir)
+        tags = REQUEST_TAG_PATTERN.findall(prompt)
+        prefix = f"[{tags[-1]}] " if tags else ""
+        return prefix + " ".join(rng.choice(words) for _ in range(self.reply_words))
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        if request.transport is not None:
+            self.connections.add(request.transport.get_extra_info("peername"))
+        body = await request.json()
+        prompt = "\n".join(part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", []))
+        total = self.latency.sample()
+
+        if self.latency.rng.random() < self.error_rate:
+            self.errors += 1
+            await asyncio.sleep(total * self.latency.first_token_ratio)
+            return web.json_response({"error": {"code": 500, "message": "fake internal error", "status": "INTERNAL"}}, status=500)
+
+        text = self._reply_text(prompt)
+        if not request.match_info["name"].endswith(":streamGenerateContent"):
+            await asyncio.sleep(total)
+            return web.Response(text=self._chunk(text), content_type="application/json")
+
+        # Akış: ilk parça erken, kalanı toplam gecikme sonunda
+        middle = len(text) // 3
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        await asyncio.sleep(total * self.latency.first_token_ratio)
+        await response.write(f"[{self._chunk(text[:middle])}".encode())
+        await asyncio.sleep(total * (1 - self.latency.first_token_ratio))
+        await response.write(f",{self._chunk(text[middle:])}]".encode())
+        await response.write_eof()
+        return response
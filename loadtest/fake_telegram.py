@@ -0,0 +1,137 @@
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+# JSON olarak çözülecek form alanları (text gibi alanlar düz metin kalır)
+JSON_FIELDS = {"chat_id", "offset", "timeout", "limit", "reply_to_message_id", "message_id", "allowed_updates"}
+
+FAKE_BOT_USER = {"id": 42, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+
+
+class FakeTelegramServer:
+    """getUpdates/sendMessage/editMessageText destekleyen yerel Bot API taklidi.
+
+    Test sürücüsü `push_update` ile güncelleme ekler; bot getUpdates ile
+    bunları alır. Botun gönderdiği her mesaj zaman damgasıyla `sent`
+    listesine kaydedilir.
+    """
+
+    def __init__(self, bot_user: Dict[str, Any] = None):
+        self.bot_user = bot_user or FAKE_BOT_USER
+        self.updates: List[Dict[str, Any]] = []
+        self.sent: List[Dict[str, Any]] = []
+        self.chats: Dict[int, Dict[str, Any]] = {}
+        self.connections = set()
+        self.requests = 0
+        self.next_update_id = 1
+        self.next_message_id = 1_000_000
+        self.new_update: Optional[asyncio.Event] = None
+        self.runner: Optional[web.AppRunner] = None
+        self.port: Optional[int] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Sunucuyu başlatır ve dinlediği portu döndürür."""
+        self.new_update = asyncio.Event()
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def push_update(self, chat: Dict[str, Any], sender: Dict[str, Any], text: str, reply_to_bot: bool = False) -> Dict[str, Any]:
+        """Kuyruğa yeni bir mesaj güncellemesi ekler (sunucunun loop'unda çağrılmalı)."""
+        self.chats[chat["id"]] = chat
+        message = {
+            "message_id": self.next_message_id,
+            "date": int(time.time()),
+            "chat": chat,
+            "from": sender,
+            "text": text,
+        }
+        if reply_to_bot:
+            message["reply_to_message"] = {
+                "message_id": self.next_message_id - 1,
+                "date": int(time.time()),
+                "chat": chat,
+                "from": self.bot_user,
+                "text": "...",
+            }
+        self.next_message_id += 1
+        update = {"update_id": self.next_update_id, "message": message}
+        self.next_update_id += 1
+        self.updates.append(update)
+        self.new_update.set()
+        return update
+
+    async def _parse(self, request: web.Request) -> Dict[str, Any]:
+        if request.content_type == "application/json":
+            return await request.json()
+        params = {}
+        for key, value in (await request.post()).items():
+            if key in JSON_FIELDS:
+                try:
+                    value = json.loads(value)
+                except (TypeError, ValueError):
+                    pass
+            params[key] = value
+        return params
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if request.transport is not None:
+            self.connections.add(request.transport.get_extra_info("peername"))
+        method = request.match_info["method"]
+        params = await self._parse(request)
+        handler = getattr(self, f"_method_{method}", None)
+        result = await handler(params) if handler else True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _method_getMe(self, params):
+        return self.bot_user
+
+    async def _method_getUpdates(self, params):
+        offset = params.get("offset") or 0
+        timeout = float(params.get("timeout") or 0)
+        self.updates = [update for update in self.updates if update["update_id"] >= offset]
+        if not self.updates and timeout > 0:
+            self.new_update.clear()
+            try:
+                await asyncio.wait_for(self.new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        limit = params.get("limit") or 100
+        return self.updates[:limit]
+
+    def _message(self, chat_id: int, text: str, message_id: int = None) -> Dict[str, Any]:
+        if message_id is None:
+            message_id = self.next_message_id
+            self.next_message_id += 1
+        chat = self.chats.get(chat_id, {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"})
+        return {"message_id": message_id, "date": int(time.time()), "chat": chat, "from": self.bot_user, "text": text}
+
+    async def _method_sendMessage(self, params):
+        message = self._message(params["chat_id"], params.get("text", ""))
+        self.sent.append({
+            "chat_id": params["chat_id"],
+            "text": message["text"],
+            "reply_to_message_id": params.get("reply_to_message_id"),
+            "time": time.perf_counter(),
+        })
+        return message
+
+    async def _method_editMessageText(self, params):
+        return self._message(params.get("chat_id", 0), params.get("text", ""), params.get("message_id"))
@@ -0,0 +1,368 @@
+"""Kayıtlı mesaj geçmişini TelegramAIBot.handle_message üzerinden tekrar oynatır.
+
+Girdi olarak `group_messages.json` / `private_messages.json` (ya da aynı
+adlı `.snap` anlık görüntüleri; bot yanıtları atlanır) ya da UPDATE_LOG_FILE ile kaydedilmiş JSONL güncelleme günlüğü
+kullanılır. Mesajlar orijinal sırasıyla, `--speed` kadar sıkıştırılmış
+zamanla sentetik Update'lere çevrilir ve ağ kullanmadan, sahte modelle
+süreç içinde işlenir. Aşama süreleri ve bellek ayırmaları raporlanır; aynı
+iz üzerinde farklı commit'ler karşılaştırılabilir.
+
+Kullanım:
+    python -m loadtest.replay --groups-file group_messages.json --private-file private_messages.json
+    python -m loadtest.replay --update-log updates.jsonl --speed 60 --tracemalloc --output replay.json
+    python -m loadtest.replay --repeat 20 --compare replay.json
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from collections import Counter
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from loadtest.driver import percentile, rss_bytes
+
+MENTION_PATTERN = re.compile(r"^[@/](\w+bot)\b", re.IGNORECASE)
+REPLY_WORDS = ["efendimiz", "belî", "şiir", "mahzen", "gönül", "selam", "hikmet", "dünya"]
+
+
+class StubResponse:
+    """generate_content(stream=True) yanıtı taklidi: parçalar ve birleşik metin."""
+
+    def __init__(self, chunks: List[str]):
+        self.chunks = chunks
+        self.text = "".join(chunks)
+
+    def __iter__(self):
+        return iter(SimpleNamespace(text=chunk) for chunk in self.chunks)
+
+
+class StubModel:
+    """Prompt'tan deterministik yanıt üreten Gemini modeli taklidi.
+
+    `latency` verilirse gerçek senkron istemci gibi event loop'u bloklar.
+    Prompt uzunlukları prompt oluşturucudaki değişiklikleri görmek için
+    kaydedilir.
+    """
+
+    def __init__(self, reply_words: int = 30, latency: float = 0.0):
+        self.reply_words = reply_words
+        self.latency = latency
+        self.prompt_lengths: List[int] = []
+
+    def generate_content(self, prompt: str, stream: bool = False) -> StubResponse:
+        self.prompt_lengths.append(len(prompt))
+        seed = zlib.crc32(prompt.encode("utf-8"))
+        words = [REPLY_WORDS[(seed >> (index % 24)) % len(REPLY_WORDS)] for index in range(self.reply_words)]
+        text = " ".join(words)
+        if self.latency:
+            time.sleep(self.latency)
+        middle = len(text) // 3
+        return StubResponse([text[:middle], text[middle:]])
+
+    def start_chat(self, history: List[Dict[str, Any]] = None) -> "StubChatSession":
+        return StubChatSession(self, history)
+
+
+class StubChatSession:
+    """model.start_chat() taklidi: geçmiş + yeni tur tek prompt olarak modele verilir."""
+
+    def __init__(self, model: "StubModel", history: List[Dict[str, Any]] = None):
+        self.model = model
+        self.history = list(history or [])
+
+    def send_message(self, content: str, stream: bool = False) -> StubResponse:
+        # Gerçek API durumsuzdur; her turda geçmişin tamamı gönderilir
+        prompt = "\n".join(part for turn in self.history for part in turn["parts"]) + "\n" + content
+        response = self.model.generate_content(prompt, stream=stream)
+        self.history += [{"role": "user", "parts": [content]}, {"role": "model", "parts": [response.text]}]
+        return response
+
+
+class StubBot:
+    """Gönderilen mesajları kaydeden, ağ kullanmayan Bot taklidi."""
+
+    def __init__(self, bot_id: int, username: str):
+        self.id = bot_id
+        self.username = username
+        self.sent: List[Dict[str, Any]] = []
+        self.next_message_id = 1
+
+    async def send_message(self, chat_id: int, text: str, reply_to_message_id: int = None, **kwargs):
+        self.sent.append({"chat_id": chat_id, "text": text, "reply_to_message_id": reply_to_message_id})
+        self.next_message_id += 1
+        return SimpleNamespace(message_id=self.next_message_id, chat_id=chat_id, text=text)
+
+
+def load_history(groups_file: Optional[str], private_file: Optional[str]) -> List[Dict[str, Any]]:
+    """Hafıza dosyalarındaki kullanıcı mesajlarını zaman sırasıyla olay listesine çevirir."""
+    # config, run_replay ortam değişkenlerini ayarladıktan sonra yüklenmeli
+    from serializers import MESSAGES, read_store, serializer_for_path
+
+    events = []
+    for path, is_group in ((groups_file, True), (private_file, False)):
+        if not path:
+            continue
+        # Dosya yoksa aynı adlı diğer biçimdeki (.json/.snap) dosya okunur
+        chats = read_store(path, serializer_for_path(path), MESSAGES)
+        for chat_key, messages in chats.items():
+            for msg in messages:
+                # Bot yanıtları sahte modelce yeniden üretilir
+                if msg.get("message_type") == "bot" or msg["user_id"] == 0:
+                    continue
+                events.append({
+                    "time": msg["timestamp"],
+                    "chat": {"id": int(chat_key), "type": "supergroup" if is_group else "private"},
+                    "user_id": msg["user_id"],
+                    "username": msg["username"],
+                    "text": msg["message"],
+                })
+    events.sort(key=lambda event: event["time"])
+    return events
+
+
+def load_update_log(path: str) -> List[Dict[str, Any]]:
+    """UPDATE_LOG_FILE kaydını (her satırda {"time", "update"}) okur."""
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entries.append(json.loads(line))
+    entries.sort(key=lambda entry: entry["time"])
+    return entries
+
+
+def history_update(event: Dict[str, Any], update_id: int, message_id: int) -> Dict[str, Any]:
+    """Geçmiş olayından Bot API formatında güncelleme sözlüğü oluşturur."""
+    sender = {"id": event["user_id"], "is_bot": False, "first_name": event["username"] or str(event["user_id"])}
+    if event["username"]:
+        sender["username"] = event["username"]
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": message_id,
+            "date": int(event["time"]),
+            "chat": event["chat"],
+            "from": sender,
+            "text": event["text"],
+        },
+    }
+
+
+def detect_bot_username(texts: List[str]) -> str:
+    """İzde en sık etiketlenen bot adını bulur (grup mesajlarının yanıt alması için)."""
+    mentions = Counter(match.group(1) for match in map(MENTION_PATTERN.match, texts) if match)
+    return mentions.most_common(1)[0][0] if mentions else "replay_bot"
+
+
+def build_trace(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Girdiyi {"time", "update"} listesine çevirir; `--repeat` için kimlikleri kaydırır."""
+    if args.update_log:
+        base = load_update_log(args.update_log)
+    else:
+        events = load_history(args.groups_file, args.private_file)
+        base = [{"time": event["time"], "update": history_update(event, index + 1, index + 1)} for index, event in enumerate(events)]
+    if not base:
+        return []
+
+    # Aynı kimlikler tekrar önbelleğine takılmasın diye her turda kaydırılır
+    span = base[-1]["time"] - base[0]["time"] + 1.0
+    id_offset = max(entry["update"]["update_id"] for entry in base) + 1
+    message_offset = max(entry["update"].get("message", {}).get("message_id", 0) for entry in base) + 1
+    trace = []
+    for round_index in range(args.repeat):
+        for entry in base:
+            update = json.loads(json.dumps(entry["update"]))
+            update["update_id"] += round_index * id_offset
+            if "message" in update:
+                update["message"]["message_id"] += round_index * message_offset
+            trace.append({"time": entry["time"] + round_index * span, "update": update})
+    return trace
+
+
+def disable_flood_limits():
+    """Sıkıştırılmış zamanda gönderim limitleri kuyruk süresini belirlemesin diye limitleri kaldırır."""
+    import send_queue
+    for name in ("SEND_GLOBAL_RATE", "SEND_PRIVATE_CHAT_RATE", "SEND_GROUP_CHAT_RATE", "SEND_CHAT_BURST"):
+        setattr(send_queue, name, 1e9)
+
+
+def stage_report(histogram) -> Dict[str, Dict[str, float]]:
+    """Aşama histogramından sayı, ortalama ve tahmini yüzdelikleri çıkarır."""
+    stages = {}
+    for stage in sorted(histogram.label_values("stage")):
+        series = histogram.series[(("stage", stage),)]
+        stages[stage] = {
+            "count": series.count,
+            "mean_ms": round(series.total / series.count * 1000, 4),
+            "p50_ms": round(histogram.quantile(0.5, stage=stage) * 1000, 4),
+            "p95_ms": round(histogram.quantile(0.95, stage=stage) * 1000, 4),
+        }
+    return stages
+
+
+async def run_replay(args: argparse.Namespace) -> Dict[str, Any]:
+    # Bot modülleri (geçmiş okunurken yüklenen config dahil) ortam değişkenlerini import anında okur
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": "123456:REPLAY-TOKEN",
+        "GEMINI_API_KEY": "replay-key",
+        "ALLOWED_GROUPS": "",
+    })
+    os.environ.pop("UPDATE_LOG_FILE", None)
+    trace = build_trace(args)
+    if not trace:
+        raise SystemExit("Tekrar oynatılacak mesaj bulunamadı")
+
+    # Veri dosyaları çalışma klasörüne yazılır
+    os.chdir(args.workdir or tempfile.mkdtemp(prefix="replay_"))
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if not args.flood_limits:
+        disable_flood_limits()
+    from telegram import Update
+    from telegram.ext import filters
+    from main import TelegramAIBot
+    from metrics import stage_duration
+
+    texts = [entry["update"].get("message", {}).get("text") or "" for entry in trace]
+    stub_bot = StubBot(args.bot_id, args.bot_username or detect_bot_username(texts))
+    model = StubModel(args.reply_words, args.model_latency)
+    bot = TelegramAIBot(updater=False)
+    bot.create_model = lambda: model
+    handler = bot._instrumented(bot.handle_message)
+    context = SimpleNamespace(bot=stub_bot, args=[], application=bot.application)
+    message_filter = filters.TEXT & ~filters.COMMAND
+
+    # Güncellemeler önceden çözülür; ölçülen süreye JSON çözme dahil edilmez
+    updates = []
+    for entry in trace:
+        update = Update.de_json(entry["update"], stub_bot)
+        if update.message and message_filter.check_update(update):
+            updates.append((entry["time"], update))
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    gc.collect()
+    collections_before = sum(stat["collections"] for stat in gc.get_stats())
+    blocks_before = sys.getallocatedblocks()
+    rss_start = rss_bytes()
+
+    durations, block_deltas, peaks = [], [], []
+    max_lag = 0.0
+    first_time = updates[0][0]
+    started = time.perf_counter()
+    for event_time, update in updates:
+        if args.speed > 0:
+            scheduled = started + (event_time - first_time) / args.speed
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+
+        if args.tracemalloc:
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+        blocks = sys.getallocatedblocks()
+        handle_started = time.perf_counter()
+        await handler(update, context)
+        durations.append(time.perf_counter() - handle_started)
+        block_deltas.append(sys.getallocatedblocks() - blocks)
+        if args.tracemalloc:
+            peaks.append(tracemalloc.get_traced_memory()[1] - traced_before)
+
+    # Kuyruğa alınan yanıtların gönderilmesini bekle
+    deadline = time.perf_counter() + args.drain_timeout
+    while bot.dispatcher.queue_depth() and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    allocations = {
+        "net_blocks": sys.getallocatedblocks() - blocks_before,
+        "net_blocks_per_update": round(sum(block_deltas) / len(block_deltas), 2),
+        "gc_collections": sum(stat["collections"] for stat in gc.get_stats()) - collections_before,
+        "rss_growth_mb": round((rss_bytes() - rss_start) / 1024 / 1024, 1),
+    }
+    if args.tracemalloc:
+        allocations["peak_bytes_per_update_mean"] = round(sum(peaks) / len(peaks))
+        allocations["peak_bytes_per_update_max"] = max(peaks)
+        tracemalloc.stop()
+
+    prompts = model.prompt_lengths
+    return {
+        "updates": len(updates),
+        "replies": len(stub_bot.sent),
+        "queued_replies": bot.dispatcher.queue_depth(),
+        "bot_username": stub_bot.username,
+        "elapsed_seconds": round(elapsed, 3),
+        "max_schedule_lag_ms": round(max_lag * 1000, 1),
+        "handle_message": {
+            "mean_ms": round(sum(durations) / len(durations) * 1000, 4),
+            "p50_ms": round(percentile(durations, 0.50) * 1000, 4),
+            "p95_ms": round(percentile(durations, 0.95) * 1000, 4),
+            "p99_ms": round(percentile(durations, 0.99) * 1000, 4),
+            "max_ms": round(max(durations) * 1000, 4),
+        },
+        "stages": stage_report(stage_duration),
+        "model_calls": len(prompts),
+        "prompt_chars_mean": round(sum(prompts) / len(prompts)) if prompts else 0,
+        "prompt_chars_max": max(prompts, default=0),
+        "allocations": allocations,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    """İki replay raporundaki aşama ortalamalarını karşılaştırır."""
+    rows = [("handle_message", baseline.get("handle_message"), current["handle_message"])]
+    rows += [(stage, baseline.get("stages", {}).get(stage), stats) for stage, stats in current["stages"].items()]
+    for name, before, after in rows:
+        if not before:
+            continue
+        change = (after["mean_ms"] - before["mean_ms"]) / before["mean_ms"] * 100 if before["mean_ms"] else 0.0
+        print(f"  {name:20s} {before['mean_ms']:10.3f} ms -> {after['mean_ms']:10.3f} ms ({change:+.1f}%)")
+    before, after = baseline.get("allocations", {}), current["allocations"]
+    if "net_blocks_per_update" in before:
+        print(f"  {'blocks/update':20s} {before['net_blocks_per_update']:10.2f}    -> {after['net_blocks_per_update']:10.2f}")
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Kayıtlı mesaj geçmişini TelegramAIBot üzerinde tekrar oynatır")
+    parser.add_argument("--groups-file", default="group_messages.json", help="Grup mesajları hafıza dosyası")
+    parser.add_argument("--private-file", default="private_messages.json", help="Özel mesajlar hafıza dosyası")
+    parser.add_argument("--update-log", help="UPDATE_LOG_FILE ile kaydedilmiş JSONL (verilirse hafıza dosyaları yerine)")
+    parser.add_argument("--speed", type=float, default=0.0, help="Zaman sıkıştırma katsayısı (0 = beklemeden)")
+    parser.add_argument("--repeat", type=int, default=1, help="İzin kaç kez art arda oynatılacağı")
+    parser.add_argument("--bot-username", help="Bot kullanıcı adı (varsayılan izde en sık etiketlenen)")
+    parser.add_argument("--bot-id", type=int, default=42, help="Yanıtlanan mesajları tanımak için bot ID'si")
+    parser.add_argument("--reply-words", type=int, default=30, help="Sahte model yanıtındaki kelime sayısı")
+    parser.add_argument("--model-latency", type=float, default=0.0, help="Sahte modelin bloklayan gecikmesi (sn)")
+    parser.add_argument("--flood-limits", action="store_true", help="Gönderim limitlerini açık bırak")
+    parser.add_argument("--drain-timeout", type=float, default=30.0, help="Kuyruktaki yanıtlar için bekleme süresi")
+    parser.add_argument("--tracemalloc", action="store_true", help="Güncelleme başına tepe bellek ayırmasını ölç")
+    parser.add_argument("--workdir", help="Veri dosyalarının yazılacağı klasör (varsayılan geçici klasör)")
+    parser.add_argument("--output", help="Sonuçların yazılacağı JSON dosyası")
+    parser.add_argument("--compare", help="Karşılaştırılacak önceki rapor")
+    args = parser.parse_args(argv)
+    # Çalışma klasörü değişmeden önce yolları sabitle
+    for name in ("groups_file", "private_file", "update_log", "output", "compare"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    return args
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    results = asyncio.run(run_replay(arguments))
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    if arguments.compare:
+        with open(arguments.compare, 'r', encoding='utf-8') as f:
+            compare(results, json.load(f))
@@ -0,0 +1,101 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import re
+from typing import Iterable, Optional
+
+from config import (
+    GEMINI_API_KEY,
+    LOG_BACKUP_COUNT,
+    LOG_FILE,
+    LOG_FORMAT,
+    LOG_LEVEL,
+    LOG_LEVELS,
+    LOG_MAX_BYTES,
+    LOG_ROTATE_WHEN,
+    LOG_SAMPLE_RATE,
+    LOG_SAMPLED_LOGGERS,
+    TELEGRAM_BOT_TOKEN,
+    shard_path,
+)
+
+# Bot API URL'lerindeki token (ör. /bot123456:ABC.../getUpdates)
+BOT_TOKEN_PATTERN = re.compile(r"bot\d+:[A-Za-z0-9_-]+")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class RedactingFilter(logging.Filter):
+    """Log mesajlarındaki bot token'ını ve API anahtarlarını gizler."""
+
+    def __init__(self, secrets: Iterable[str]):
+        super().__init__()
+        self.secrets = [secret for secret in secrets if secret]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        redacted = BOT_TOKEN_PATTERN.sub("bot<gizli>", message)
+        for secret in self.secrets:
+            redacted = redacted.replace(secret, "<gizli>")
+        if redacted != message:
+            record.msg = redacted
+            record.args = None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Yoğun logger'lardaki INFO ve altı kayıtların sadece bir kısmını geçirir."""
+
+    def __init__(self, logger_names: Iterable[str], rate: float):
+        super().__init__()
+        self.logger_names = tuple(logger_names)
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or not self.logger_names:
+            return True
+        if record.name in self.logger_names or record.name.startswith(tuple(f"{name}." for name in self.logger_names)):
+            return random.random() < self.rate
+        return True
+
+
+def _build_file_handler(path: str) -> logging.Handler:
+    """Boyuta veya zamana göre dönen dosya handler'ı oluşturur."""
+    if LOG_ROTATE_WHEN:
+        return logging.handlers.TimedRotatingFileHandler(path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    return logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """Kök logger'ı kuyruk üzerinden yazan, dönen ve gizleyen loglamayı kurar.
+
+    Event loop sadece kayıtları kuyruğa koyar; dosyaya ve konsola yazma,
+    token gizleme ve biçimlendirme QueueListener'ın thread'inde yapılır.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    redactor = RedactingFilter([TELEGRAM_BOT_TOKEN, GEMINI_API_KEY])
+    handlers = [_build_file_handler(shard_path(LOG_FILE)), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.addFilter(redactor)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLED_LOGGERS, LOG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(getattr(logging, LOG_LEVEL))
+    for name, level in LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(getattr(logging, level))
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
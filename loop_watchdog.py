@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from config import LOOP_BLOCK_STACK_DEPTH, LOOP_BLOCK_THRESHOLD, LOOP_LAG_INTERVAL
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+loop_lag = metrics.histogram("bot_event_loop_lag_seconds", "Event loop'un zamanlayıcıya geç kalma süresi (saniye)", LAG_BUCKETS)
+loop_blocks = metrics.counter("bot_event_loop_blocks_total", "Eşiği aşan event loop bloklamaları (handler etiketli)")
+
+
+class LoopWatchdog:
+    """Event loop gecikmesini sürekli ölçer, uzun bloklamalarda bloklayan kodu yakalar.
+
+    Loop üzerindeki görev her LOOP_LAG_INTERVAL'de uyanır ve ne kadar geç
+    uyandığını histograma yazar. Ayrı bir iş parçacığı bu görevin son
+    uyanışını izler; loop LOOP_BLOCK_THRESHOLD'dan uzun süre yanıt vermezse
+    loop iş parçacığının o anki yığınını, çalışan handler'ın adını ve
+    güncellemesini loglar. Handler'lar `track` ile kaydedilir; eşleştirme
+    yığındaki çerçevelere göre yapılır, loop'a dokunulmaz.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_BLOCK_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.heartbeat = time.monotonic()
+        self.reported: Optional[float] = None  # Loglanan bloklamanın başladığı kalp atışı
+        self.blocked_handler: Optional[str] = None
+        self.loop_thread_id: Optional[int] = None
+        self.active: Dict[Any, Tuple[str, Any]] = {}  # handler çerçevesi -> (handler adı, güncelleme)
+        self.recent: Deque[str] = deque(maxlen=20)  # /gorevler için son bloklamaların özeti
+        self.max_lag = 0.0
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    @contextmanager
+    def track(self, handler: str, update, frame):
+        """Handler çalıştığı sürece çerçevesini güncellemeyle eşleştirir (`frame`: handler sarmalayıcısının çerçevesi)."""
+        self.active[frame] = (handler, update)
+        try:
+            yield
+        finally:
+            self.active.pop(frame, None)
+
+    async def run(self):
+        """Gecikmeyi ölçen döngü; iptal edilene kadar çalışır."""
+        self.loop_thread_id = threading.get_ident()
+        self.stop_event.clear()
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self.thread.start()
+        try:
+            while True:
+                self.heartbeat = time.monotonic()
+                await asyncio.sleep(self.interval)
+                lag = max(0.0, time.monotonic() - self.heartbeat - self.interval)
+                loop_lag.observe(lag)
+                self.max_lag = max(self.max_lag, lag)
+                if self.reported is not None and self.reported == self.heartbeat:
+                    # Sayaç loop'ta artırılır; metrik sözlükleri iş parçacığından değiştirilmez
+                    loop_blocks.inc(handler=self.blocked_handler or "none")
+                    logger.warning(f"Event loop resumed after being blocked for {lag + self.interval:.2f}s")
+                    self.reported = None
+        finally:
+            self.stop_event.set()
+
+    def _watch(self):
+        while not self.stop_event.wait(self.interval / 2):
+            heartbeat = self.heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled < self.threshold or self.reported == heartbeat:
+                continue
+            self.reported = heartbeat
+            try:
+                self._report(stalled)
+            except Exception as e:
+                logger.error(f"Loop watchdog could not capture the blocking frame: {e}")
+
+    def _report(self, stalled: float):
+        frame = sys._current_frames().get(self.loop_thread_id)
+        if frame is None:
+            return
+        handler, update = self._find_handler(frame)
+        stack = traceback.format_stack(frame)[-LOOP_BLOCK_STACK_DEPTH:]
+        location = traceback.extract_stack(frame, limit=1)[-1] if stack else None
+        where = f"{os.path.basename(location.filename)}:{location.lineno} {location.name}" if location else "?"
+        message = getattr(update, "effective_message", None)
+        context = (f"handler {handler} (update {getattr(update, 'update_id', '?')}, "
+                   f"chat {message.chat_id if message else '?'})") if handler else "no handler"
+        self.blocked_handler = handler
+        self.recent.append(f"{time.strftime('%H:%M:%S')}  {stalled * 1000:6.0f}+ ms  {context}  @ {where}")
+        logger.warning(f"Event loop blocked for {stalled:.2f}s in {context} at {where}:\n{''.join(stack).rstrip()}")
+
+    def _find_handler(self, frame) -> Tuple[Optional[str], Any]:
+        """Bloklanan yığında kayıtlı bir handler çerçevesi arar (en içteki önce)."""
+        active = dict(self.active)
+        while frame is not None:
+            if frame in active:
+                return active[frame]
+            frame = frame.f_back
+        return None, None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "lag_p99_ms": round((loop_lag.quantile(0.99) or 0.0) * 1000, 1),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "blocks": int(sum(loop_blocks.values.values())),
+        }
+
+
+# Global loop watchdog instance
+loop_watchdog = LoopWatchdog()
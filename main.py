@@ -1,52 +1,192 @@
 import logging
 import asyncio
+import collections
+import functools
+import json
+import os
+import sys
+import time
 from typing import List, Dict, Any
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from telegram.error import TelegramError
+from telegram.error import Forbidden, TelegramError
 import google.generativeai as genai
 from config import *
+import profiling
+import history_export
+
+# Hafıza yüklenmeden önce başlatılırsa yüklenen mesaj listeleri de izlenir
+if TRACEMALLOC_AT_STARTUP:
+    profiling.start_tracemalloc()
+
 from group_memory import group_memory
+from archive import message_archive
+from residency import residency_events
+from durability import durable_commits, durable_writer
 from user_preferences import user_preferences
+from preference_detector import preference_detector
+from semantic_memory import semantic_memory
+from conversation_synopsis import conversation_synopsis
+from chat_sessions import chat_sessions
+from search_index import search_index
+from columnar_store import columnar_store, LENGTH_BINS
+from send_queue import OutboundDispatcher
+from sharding import is_local
+from update_cache import update_cache
+from loop_watchdog import loop_watchdog
+from ingest_filter import ingest_filter, display_text
+import http_clients
+from log_setup import setup_logging
+from metrics import metrics, stage_duration, cache_requests, start_metrics_server
 
 # Loglama ayarları
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=getattr(logging, LOG_LEVEL),
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
+setup_logging()
 logger = logging.getLogger(__name__)
+# Her mesaj için yazılan yoğun loglar (örneklenir)
+message_logger = logging.getLogger("messages")
 
 # Google Gemini istemcisini başlat
-genai.configure(api_key=GEMINI_API_KEY)
+if GEMINI_API_ENDPOINT:
+    genai.configure(api_key=GEMINI_API_KEY, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+    # REST taşımasında paylaşılan oturumun havuzu ayarlanır (gRPC tek kanalı çoğullar)
+    http_clients.tune_gemini_client()
+else:
+    genai.configure(api_key=GEMINI_API_KEY)
 
 class TelegramAIBot:
-    def __init__(self):
-        self.application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    def __init__(self, updater: bool = True):
+        # Giden çağrılar ve getUpdates ayrı havuzlarda; uzun yoklama yanıtların bağlantısını tutmaz
+        builder = (Application.builder().token(TELEGRAM_BOT_TOKEN).base_url(f"{TELEGRAM_API_BASE_URL}/bot")
+                   .request(http_clients.telegram_request()))
+        if updater:
+            builder = builder.get_updates_request(http_clients.updates_request())
+        else:
+            # Çok süreçli modda güncellemeleri ön süreç çeker
+            builder = builder.updater(None)
+        self.application = builder.build()
+        self.dispatcher = OutboundDispatcher()
+        self.metrics_runner = None
+        self.flush_task = None
+        self.watchdog_task = None
+        semantic_memory.attach(group_memory)
+        conversation_synopsis.attach(group_memory)
+        chat_sessions.attach(group_memory)
+        search_index.attach(group_memory)
+        columnar_store.attach(group_memory)
+        ingest_filter.attach(group_memory)
+        self.setup_metrics()
         self.setup_handlers()
+
+    def setup_metrics(self):
+        """Kuyruk ve depo boyutlarını okuma anında hesaplanan göstergeler olarak kaydet"""
+        metrics.gauge("bot_send_queue_depth", "Gönderim kuyruğunda bekleyen mesaj", self.dispatcher.queue_depth)
+        metrics.gauge("bot_update_queue_depth", "İşlenmeyi bekleyen güncelleme", self.application.update_queue.qsize)
+        metrics.gauge("bot_group_chats", "Bellekteki grup sayısı", lambda: len(group_memory.group_messages))
+        metrics.gauge("bot_spilled_group_chats", "Bellekten çıkarılıp diskte bekleyen grup", lambda: len(group_memory.group_messages.spilled))
+        metrics.gauge("bot_group_messages", "Hafızadaki grup mesajı", lambda: sum(len(msgs) for msgs in group_memory.group_messages.values()))
+        metrics.gauge("bot_private_users", "Bellekteki özel sohbet sayısı", lambda: len(group_memory.private_messages))
+        metrics.gauge("bot_spilled_private_users", "Bellekten çıkarılıp diskte bekleyen özel sohbet", lambda: len(group_memory.private_messages.spilled))
+        metrics.gauge("bot_semantic_messages", "Anlamsal hafızada aranabilir mesaj", lambda: semantic_memory.get_stats()["messages"])
+        metrics.gauge("bot_conversation_synopses", "Konuşma özeti olan sohbet-kullanıcı çifti", lambda: conversation_synopsis.get_stats()["synopses"])
+        metrics.gauge("bot_chat_sessions", "Açık Gemini sohbet oturumu", lambda: len(chat_sessions.sessions))
+        metrics.gauge("bot_search_messages", "Arama dizinindeki mesaj", lambda: search_index.get_stats()["messages"])
+        metrics.gauge("bot_column_messages", "Sütunlu depodaki mesaj", lambda: columnar_store.get_stats()["messages"])
+        metrics.gauge("bot_preference_users", "Tercih kaydı olan kullanıcı", lambda: len(user_preferences.user_preferences))
+
+    async def start_services(self):
+        """Bot başladıktan sonra yan servisleri (metrik endpoint'i, periyodik diske yazma) başlat"""
+        if durable_writer.mode != "none":
+            self.flush_task = asyncio.create_task(durable_writer.flush_periodically())
+        if LOOP_WATCHDOG_ENABLED:
+            self.watchdog_task = asyncio.create_task(loop_watchdog.run())
+        if METRICS_ENABLED:
+            # Shard worker'ları ana süreçle çakışmasın diye sonraki portları kullanır
+            port = METRICS_PORT + (int(SHARD_ID) + 1 if SHARD_ID is not None else 0)
+            try:
+                self.metrics_runner = await start_metrics_server(METRICS_HOST, port)
+            except OSError as e:
+                logger.error(f"Metrics endpoint could not be started on port {port}: {e}")
+
+    async def stop_services(self):
+        """Yan servisleri durdur"""
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        if self.watchdog_task is not None:
+            self.watchdog_task.cancel()
+            self.watchdog_task = None
+        conversation_synopsis.cancel_all()
+        semantic_memory.flush()
+        # Bekleyen kayıtlar kapanmadan diske yazılır; handler'lar hâlâ çalışabildiğinden
+        # içerikler loop'ta serileştirilir, yalnızca commit beklenir
+        await asyncio.wrap_future(durable_writer.flush())
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+            self.metrics_runner = None
+
+    def _instrumented(self, callback):
+        """Handler'ın toplam süresini metriklere yazan sarmalayıcı"""
+        @functools.wraps(callback)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            if UPDATE_LOG_FILE:
+                self.record_update(update)
+            # Bekçi loop bloklanırsa yığında bu çerçeveyi arayıp handler'ı ve güncellemeyi bulur
+            with loop_watchdog.track(callback.__name__, update, sys._getframe()), metrics.timer("update"):
+                return await callback(update, context)
+        return wrapper
+
+    def record_update(self, update: Update):
+        """Güncellemeyi loadtest/replay.py ile tekrar oynatılabilmesi için JSONL olarak kaydet"""
+        try:
+            with open(shard_path(UPDATE_LOG_FILE), 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"time": time.time(), "update": update.to_dict()}, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.error(f"Update log could not be written: {e}")
+
+    def create_model(self):
+        """Gemini modelini oluştur (replay aracı sahte modelle değiştirir)"""
+        return genai.GenerativeModel(AI_MODEL)
+
+    def is_admin(self, user_id: int) -> bool:
+        """Kullanıcının ADMIN_USER_IDS listesinde olup olmadığını kontrol et"""
+        return user_id in ADMIN_USER_IDS
     
     def setup_handlers(self):
         """Bot komutlarını ve mesaj işleyicilerini ayarla"""
         # Komut işleyicileri
-        self.application.add_handler(CommandHandler("start", self.start_command))
-        self.application.add_handler(CommandHandler("help", self.help_command))
-        self.application.add_handler(CommandHandler("status", self.status_command))
-        self.application.add_handler(CommandHandler("memory", self.memory_command))
-        self.application.add_handler(CommandHandler("clear", self.clear_memory_command))
-        self.application.add_handler(CommandHandler("groupinfo", self.group_info_command))
-        self.application.add_handler(CommandHandler("ozet", self.summary_command))
-        self.application.add_handler(CommandHandler("temizle", self.clear_group_command))
-        self.application.add_handler(CommandHandler("uyeler", self.users_command))
+        self.application.add_handler(CommandHandler("start", self._instrumented(self.start_command)))
+        self.application.add_handler(CommandHandler("help", self._instrumented(self.help_command)))
+        self.application.add_handler(CommandHandler("status", self._instrumented(self.status_command)))
+        self.application.add_handler(CommandHandler("memory", self._instrumented(self.memory_command)))
+        self.application.add_handler(CommandHandler("clear", self._instrumented(self.clear_memory_command)))
+        self.application.add_handler(CommandHandler("groupinfo", self._instrumented(self.group_info_command)))
+        self.application.add_handler(CommandHandler("ozet", self._instrumented(self.summary_command)))
+        self.application.add_handler(CommandHandler("temizle", self._instrumented(self.clear_group_command)))
+        self.application.add_handler(CommandHandler("uyeler", self._instrumented(self.users_command)))
+        self.application.add_handler(CommandHandler("ara", self._instrumented(self.search_command)))
+        self.application.add_handler(CommandHandler("istatistik", self._instrumented(self.statistics_command)))
+
+        # Yönetici komutları (ADMIN_USER_IDS)
+        self.application.add_handler(CommandHandler("profil", self._instrumented(self.profile_command)))
+        self.application.add_handler(CommandHandler("bellek", self._instrumented(self.memory_profile_command)))
+        self.application.add_handler(CommandHandler("gorevler", self._instrumented(self.tasks_command)))
+        self.application.add_handler(CommandHandler("export", self._instrumented(self.export_command)))
+        self.application.add_handler(CommandHandler("import", self._instrumented(self.import_command)))
         
         # Mesaj işleyicileri
         self.application.add_handler(MessageHandler(
             filters.TEXT & ~filters.COMMAND, 
-            self.handle_message
+            self._instrumented(self.handle_message)
         ))
     
+    async def reply(self, update: Update, text: str, on_sent=None):
+        """Mesaja flood limitlerine uyan gönderim kuyruğu üzerinden yanıt ver (`on_sent` gerçek gönderimde çağrılır)"""
+        message = update.message
+        is_group = message.chat.type in ['group', 'supergroup']
+        # reply_text gibi gruplarda alıntılayarak, özelde düz yanıt ver
+        reply_to_message_id = message.message_id if message.chat.type != 'private' else None
+        return await self.dispatcher.send(message.get_bot(), message.chat.id, text, reply_to_message_id, is_group, on_sent)
+
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Bot başlatma komutu"""
         welcome_message = """
@@ -62,7 +202,7 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
 
 ⚠️ Not: Gururlu, şakacı ve edebi bir köleyim! Bazen eski Türkçe konuşur, bazen şiirle cevap veririm!
         """
-        await update.message.reply_text(welcome_message)
+        await self.reply(update, welcome_message)
         logger.info(f"Start command used by {update.effective_user.id}")
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -79,9 +219,11 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
 
 📊 **GRUP KOMUTLARI:**
 /groupinfo - Grup bilgilerini göster
-/ozet - Son 24 saatlik konuşmaları özetle
+/ozet [saat] - Son 24 (en fazla 168) saatlik konuşmaları özetle
 /temizle - Grup mesajlarını temizle
 /uyeler - Grup üyelerinin durumunu göster
+/ara [kelimeler] - Geçmiş mesajlarda ara
+/istatistik [gün] - Etkinlik haritası, en çok yazanlar ve bot yanıt süresi
 
 🔐 **TERCİH YÖNETİMİ (Kişisel Otonomi):**
 `tercih onayla` - Tercih kaydetme onayını ver
@@ -125,7 +267,7 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
 • Her kullanıcının kimlik haklarına saygı gösteririm
 • Sadece mahzen grubunda aktifim
         """
-        await update.message.reply_text(help_text)
+        await self.reply(update, help_text)
     
     async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Bot durumu komutu"""
@@ -138,7 +280,48 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
 💪 Kişilik: Gururlu, şakacı ve edebi
 📚 Özellikler: Eski Türkçe, şiirler, şakalar
         """
-        await update.message.reply_text(status_text)
+        if self.is_admin(update.effective_user.id):
+            status_text += self.metrics_summary()
+        await self.reply(update, status_text)
+
+    def metrics_summary(self) -> str:
+        """Yöneticiler için /status'a eklenen metrik özeti"""
+        summary = "\n📈 Aşama süreleri (p50 / p95):\n"
+        for stage in sorted(stage_duration.label_values("stage")):
+            count = stage_duration.series[(("stage", stage),)].count
+            p50 = stage_duration.quantile(0.5, stage=stage) * 1000
+            p95 = stage_duration.quantile(0.95, stage=stage) * 1000
+            summary += f"• {stage}: {p50:.0f} ms / {p95:.0f} ms ({count} ölçüm)\n"
+
+        # Değeri okunamayan gösterge (hata loglanır) "?" olarak gösterilir
+        gauges = collections.defaultdict(lambda: "?")
+        for name, metric in metrics.metrics.items():
+            if metric.type_name != "gauge":
+                continue
+            value = metric.get()
+            if value is not None:
+                gauges[name] = value
+        summary += f"\n📬 Kuyruklar: gönderim {gauges['bot_send_queue_depth']}, güncelleme {gauges['bot_update_queue_depth']}\n"
+        summary += f"🗄️ Depo: {gauges['bot_group_chats']} grup, {gauges['bot_group_messages']} grup mesajı, "
+        summary += f"{gauges['bot_private_users']} özel sohbet, {gauges['bot_preference_users']} tercih kaydı\n"
+        summary += f"💤 Diskte: {gauges['bot_spilled_group_chats']} grup, {gauges['bot_spilled_private_users']} özel sohbet "
+        evictions = sum(residency_events.get(store=store, event="evict") for store in ("groups", "private"))
+        reloads = sum(residency_events.get(store=store, event="reload") for store in ("groups", "private"))
+        summary += f"({evictions:.0f} çıkarma / {reloads:.0f} geri yükleme)\n"
+        summary += f"💾 Dayanıklılık: {durable_writer.mode}, {durable_commits.get():.0f} commit\n"
+        session_hits = cache_requests.get(cache="session", result="hit")
+        session_misses = cache_requests.get(cache="session", result="miss")
+        summary += f"💬 Sohbet oturumları: {len(chat_sessions.sessions)} açık ({session_hits:.0f} isabet / {session_misses:.0f} yeniden kurma)\n"
+        loop_stats = loop_watchdog.get_stats()
+        summary += f"🐢 Event loop: p99 gecikme {loop_stats['lag_p99_ms']} ms, en yüksek {loop_stats['max_lag_ms']} ms, {loop_stats['blocks']} bloklama\n"
+        ingest_stats = ingest_filter.get_stats()
+        summary += f"🧹 Alım filtresi: {ingest_stats['repeat']} tekrar birleştirildi, {ingest_stats['duplicate']} yakın tekrar, {ingest_stats['capped']} uzun mesaj kırpıldı ({ingest_stats['saved_chars']} karakter)\n"
+        synopsis_stats = conversation_synopsis.get_stats()
+        summary += f"📝 Konuşma özetleri: {synopsis_stats['synopses']} ({synopsis_stats['turns']} tur özetlendi)\n"
+        hits = cache_requests.get(cache="update", result="hit")
+        misses = cache_requests.get(cache="update", result="miss")
+        summary += f"🎯 Tekrar önbelleği: {hits:.0f} isabet / {misses:.0f} ıskalama\n"
+        return summary
     
     async def memory_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Hafıza durumu komutu"""
@@ -149,7 +332,8 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
         # Grup ve özel mesaj konuşmalarını al
         if chat_id < 0:  # Grup mesajı
             user_conversation = group_memory.get_conversation_history(chat_id, user_id)
-            private_conversation = group_memory.get_private_conversation_history(user_id)
+            # Çok süreçli modda özel mesajlar kullanıcının kendi worker'ında olabilir
+            private_conversation = group_memory.get_private_conversation_history(user_id) if is_local(user_id) else None
             conversation_type = "Grup"
         else:  # Özel mesaj
             user_conversation = group_memory.get_private_conversation_history(user_id)
@@ -158,8 +342,8 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
         
         memory_text = f"""
 🧠 Hafıza Durumu:
-📊 Toplam grup: {stats['total_groups']}
-💬 Toplam grup mesajı: {stats['total_messages']}
+📊 Toplam grup: {stats['total_groups']} ({stats['resident_groups']} bellekte)
+💬 Bellekteki grup mesajı: {stats['total_messages']}
 📝 Maksimum mesaj/grup: {stats['max_messages_per_group']}
 
 👤 Sizin {conversation_type.lower()} konuşmanız:
@@ -168,9 +352,9 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
 💬 Chat ID: {chat_id}
 
 🔒 Özel mesajlarınız:
-📨 Mesaj sayısı: {len(private_conversation)}
+📨 Mesaj sayısı: {len(private_conversation) if private_conversation is not None else "bana özelden /memory yazın"}
         """
-        await update.message.reply_text(memory_text)
+        await self.reply(update, memory_text)
     
     async def clear_memory_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Hafıza temizleme komutu"""
@@ -179,12 +363,18 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
         
         # Grup ve özel mesajları temizle
         if chat_id < 0:  # Grup mesajı
-            group_memory.clear_user_messages(chat_id, user_id)
-            group_memory.clear_private_messages(user_id)
-            await update.message.reply_text("🧹 Grup ve özel mesaj geçmişiniz temizlendi!")
+            group_memory.clear_user_messages(chat_id, user_id, include_archive=False)
+            # Arşiv segmentleri yeniden yazılır; disk işi olduğundan thread'de yapılır
+            await asyncio.get_running_loop().run_in_executor(None, group_memory.clear_archived_user_messages, chat_id, user_id)
+            # Çok süreçli modda özel mesajlar kullanıcının kendi worker'ında olabilir
+            if is_local(user_id):
+                group_memory.clear_private_messages(user_id)
+                await self.reply(update, "🧹 Grup ve özel mesaj geçmişiniz temizlendi!")
+            else:
+                await self.reply(update, "🧹 Grup mesaj geçmişiniz temizlendi! Özel mesaj geçmişiniz için bana özelden /clear yazın.")
         else:  # Özel mesaj
             group_memory.clear_private_messages(user_id)
-            await update.message.reply_text("🧹 Özel mesaj geçmişiniz temizlendi!")
+            await self.reply(update, "🧹 Özel mesaj geçmişiniz temizlendi!")
         
         logger.info(f"Memory cleared for user {user_id} in chat {chat_id}")
     
@@ -209,7 +399,7 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
 • Bot'u gruba admin yapın
 • Mesaj gönderme izni verin
         """
-        await update.message.reply_text(info_text)
+        await self.reply(update, info_text)
 
     async def summary_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Grup mesajlarını özetleme komutu"""
@@ -217,7 +407,7 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
 
         # Sadece gruplarda çalışır
         if update.message.chat.type not in ['group', 'supergroup']:
-            await update.message.reply_text("Bu komut sadece gruplarda çalışır!")
+            await self.reply(update, "Bu komut sadece gruplarda çalışır!")
             return
 
         # Güvenlik kontrolü
@@ -225,14 +415,26 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
             logger.warning(f"Unauthorized summary command attempt: {chat_id} by user {update.effective_user.id}")
             return
 
-        # Son 24 saatlik özet
-        recent_messages = group_memory.get_recent_messages(chat_id, 24)
+        try:
+            hours = int(context.args[0]) if context.args else 24
+        except ValueError:
+            hours = 24
+        hours = max(1, min(hours, SUMMARY_MAX_HOURS))
+
+        # Arşiv + sıcak pencereden akış halinde oku; prompt'a yalnızca en yeni mesajlar girer.
+        # Segment okuma disk işi olduğundan event loop'u bekletmemek için thread'de yapılır;
+        # sıcak pencere (bellekten çıkarılmış olabilir) burada, loop'ta kopyalanır.
+        since = time.time() - hours * 3600
+        hot = group_memory.hot_window(chat_id)
+        recent_messages = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: collections.deque(group_memory.iter_messages(chat_id, since=since, hot=hot), maxlen=SUMMARY_MAX_MESSAGES)
+        )
         if recent_messages:
             # AI ile gerçek özet oluştur
-            ai_summary = await self.create_ai_summary(recent_messages)
-            await update.message.reply_text(ai_summary)
+            ai_summary = await self.create_ai_summary(list(recent_messages))
+            await self.reply(update, ai_summary)
         else:
-            await update.message.reply_text("Son 24 saatte hiç mesaj bulunamadı.")
+            await self.reply(update, f"Son {hours} saatte hiç mesaj bulunamadı.")
         logger.info(f"Summary requested by {update.effective_user.id} in chat {chat_id}")
 
     async def clear_group_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -241,7 +443,7 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
 
         # Sadece gruplarda çalışır
         if update.message.chat.type not in ['group', 'supergroup']:
-            await update.message.reply_text("Bu komut sadece gruplarda çalışır!")
+            await self.reply(update, "Bu komut sadece gruplarda çalışır!")
             return
 
         # Güvenlik kontrolü
@@ -250,7 +452,7 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
             return
 
         group_memory.clear_group_messages(chat_id)
-        await update.message.reply_text("🧹 Grup mesajları temizlendi!")
+        await self.reply(update, "🧹 Grup mesajları temizlendi!")
         logger.info(f"Group messages cleared by {update.effective_user.id} in chat {chat_id}")
 
     async def users_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -259,7 +461,7 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
 
         # Sadece gruplarda çalışır
         if update.message.chat.type not in ['group', 'supergroup']:
-            await update.message.reply_text("Bu komut sadece gruplarda çalışır!")
+            await self.reply(update, "Bu komut sadece gruplarda çalışır!")
             return
 
         # Güvenlik kontrolü
@@ -271,7 +473,7 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
         recent_messages = group_memory.get_recent_messages(chat_id, 24)
         
         if not recent_messages:
-            await update.message.reply_text("Henüz grup üyelerinin mesajları kaydedilmemiş.")
+            await self.reply(update, "Henüz grup üyelerinin mesajları kaydedilmemiş.")
             return
         
         # Kullanıcıları grupla ve istatistiklerini hesapla
@@ -292,7 +494,7 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
             
             # En son mesajı güncelle
             if msg['timestamp'] > user_stats[user_id]['last_timestamp']:
-                user_stats[user_id]['last_message'] = msg['message']
+                user_stats[user_id]['last_message'] = display_text(msg)
                 user_stats[user_id]['last_timestamp'] = msg['timestamp']
         
         # En aktif 10 kullanıcıyı göster
@@ -308,9 +510,240 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
             users_text += f"   📨 Mesaj sayısı: {message_count}\n"
             users_text += f"   💬 Son mesaj: {last_message}\n\n"
         
-        await update.message.reply_text(users_text)
+        await self.reply(update, users_text)
         logger.info(f"Users command used by {update.effective_user.id} in chat {chat_id}")
     
+    async def search_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Sohbet geçmişinde tam metin arama komutu"""
+        chat_id = update.message.chat.id
+
+        # Güvenlik kontrolü
+        if update.message.chat.type in ['group', 'supergroup'] and ALLOWED_GROUPS and chat_id not in ALLOWED_GROUPS:
+            logger.warning(f"Unauthorized search command attempt: {chat_id} by user {update.effective_user.id}")
+            return
+
+        query = " ".join(context.args) if context.args else ""
+        if not query.strip():
+            await self.reply(update, "Kullanım: /ara [kelimeler]\nÖrnek: /ara nazım hikmet şiir")
+            return
+
+        results = search_index.search(chat_id, query)
+        if not results:
+            await self.reply(update, f"🔍 \"{query}\" için sonuç bulunamadı.")
+            return
+
+        search_text = f"🔍 \"{query}\" için sonuçlar:\n\n"
+        for i, result in enumerate(results, 1):
+            date = time.strftime("%d.%m.%Y %H:%M", time.localtime(result["timestamp"]))
+            speaker = "Bot" if result["message_type"] == "bot" else result["username"]
+            message = result["message"][:150] + "..." if len(result["message"]) > 150 else result["message"]
+            search_text += f"{i}. {speaker} ({date}):\n{message}\n\n"
+
+        await self.reply(update, search_text)
+        logger.info(f"Search command used by {update.effective_user.id} in chat {chat_id}")
+
+    async def statistics_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Grup etkinlik istatistikleri komutu"""
+        chat_id = update.message.chat.id
+
+        # Sadece gruplarda çalışır
+        if update.message.chat.type not in ['group', 'supergroup']:
+            await self.reply(update, "Bu komut sadece gruplarda çalışır!")
+            return
+
+        # Güvenlik kontrolü
+        if ALLOWED_GROUPS and chat_id not in ALLOWED_GROUPS:
+            logger.warning(f"Unauthorized statistics command attempt: {chat_id} by user {update.effective_user.id}")
+            return
+
+        try:
+            days = int(context.args[0]) if context.args else STATS_DEFAULT_DAYS
+        except ValueError:
+            days = STATS_DEFAULT_DAYS
+        days = max(1, min(days, STATS_MAX_DAYS))
+
+        stats = columnar_store.chat_statistics(chat_id, since=time.time() - days * 86400, top=STATS_TOP_USERS)
+        if not stats:
+            await self.reply(update, f"Son {days} günde hiç mesaj bulunamadı.")
+            return
+
+        stats_text = f"📊 Grup İstatistikleri (son {days} gün)\n\n"
+        stats_text += f"📨 Mesaj: {stats['messages']} (üye: {stats['user_messages']}, bot: {stats['bot_messages']})\n"
+        stats_text += f"👥 Yazan üye: {stats['active_users']}\n\n"
+
+        stats_text += "🏆 En çok yazanlar:\n"
+        for i, (talker_id, count) in enumerate(stats['top_talkers'], 1):
+            stats_text += f"{i}. {columnar_store.username(chat_id, talker_id)}: {count} mesaj\n"
+
+        if stats['user_messages']:
+            busiest_hour = int(stats['hourly'].argmax())
+            stats_text += f"\n⏰ En yoğun saat: {busiest_hour:02d}:00-{(busiest_hour + 1) % 24:02d}:00\n"
+            stats_text += f"🗓️ Etkinlik haritası (gün x saat):\n{columnar_store.render_heatmap(stats['heatmap'])}\n"
+
+        response_times = stats['response_times']
+        if response_times['count']:
+            stats_text += f"\n🤖 Bot yanıt süresi: medyan {response_times['median']:.1f} sn, %90 {response_times['p90']:.1f} sn ({response_times['count']} yanıt)\n"
+
+        stats_text += f"\n📏 Mesaj uzunluğu: ortalama {stats['length_mean']:.0f}, medyan {stats['length_median']:.0f} karakter\n"
+        for low, high, count in zip(LENGTH_BINS[:-1], LENGTH_BINS[1:], stats['length_histogram']):
+            label = f"{low}-{high - 1}" if high != float('inf') else f"{low}+"
+            stats_text += f"   {label:>8}: {count}\n"
+
+        await self.reply(update, stats_text)
+        logger.info(f"Statistics command used by {update.effective_user.id} in chat {chat_id}")
+
+    def _seconds_argument(self, context: ContextTypes.DEFAULT_TYPE, default: int) -> int:
+        """Komutun ilk argümanını saniye olarak oku"""
+        try:
+            seconds = int(context.args[0]) if context.args else default
+        except ValueError:
+            seconds = default
+        return max(1, min(seconds, PROFILE_MAX_SECONDS))
+
+    async def profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Yönetici: event loop'u belirtilen süre boyunca cProfile ile ölç"""
+        if not self.is_admin(update.effective_user.id):
+            logger.warning(f"Unauthorized profile command attempt by user {update.effective_user.id}")
+            return
+
+        if profiling.is_profiling():
+            await self.reply(update, "⏱️ Zaten çalışan bir profil oturumu var.")
+            return
+
+        seconds = self._seconds_argument(context, 30)
+        await self.reply(update, f"⏱️ {seconds} saniyelik profil başladı...")
+        # Handler'ı bekletmemek için arka planda çalıştır, aksi halde ölçülecek güncellemeler işlenmez
+        context.application.create_task(self._finish_profile(update, seconds), update=update)
+
+    async def _finish_profile(self, update: Update, seconds: int):
+        try:
+            path, summary = await profiling.profile_event_loop(seconds)
+            await self.reply(update, f"📊 Profil sonucu (kümülatif süre):\n{summary}\n\n💾 {path}")
+            logger.info(f"Profile saved to {path}")
+        except Exception as e:
+            logger.error(f"Profiling error: {e}")
+            await self.reply(update, "❌ Profil alınırken hata oluştu.")
+
+    async def memory_profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Yönetici: tracemalloc ile en büyük bellek ayırmalarını göster"""
+        if not self.is_admin(update.effective_user.id):
+            logger.warning(f"Unauthorized memory profile command attempt by user {update.effective_user.id}")
+            return
+
+        if context.args and context.args[0] == "durdur":
+            profiling.stop_tracemalloc()
+            await self.reply(update, "🧠 Bellek izleme durduruldu.")
+            return
+
+        if profiling.start_tracemalloc():
+            await self.reply(update, "🧠 Bellek izleme başlatıldı. Anlık görüntü için /bellek komutunu tekrar kullanın, kapatmak için /bellek durdur.")
+            return
+
+        try:
+            path, summary = profiling.memory_snapshot()
+            await self.reply(update, f"🧠 En büyük bellek ayırmaları:\n{summary}\n\n💾 {path}")
+            logger.info(f"Memory snapshot saved to {path}")
+        except Exception as e:
+            logger.error(f"Memory snapshot error: {e}")
+            await self.reply(update, "❌ Bellek görüntüsü alınırken hata oluştu.")
+
+    async def tasks_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Yönetici: asyncio görevlerini ve yavaş callback'leri raporla"""
+        if not self.is_admin(update.effective_user.id):
+            logger.warning(f"Unauthorized tasks command attempt by user {update.effective_user.id}")
+            return
+
+        seconds = self._seconds_argument(context, 10)
+        await self.reply(update, f"🔍 {seconds} saniye boyunca yavaş callback'ler izleniyor...")
+        context.application.create_task(self._finish_loop_report(update, seconds), update=update)
+
+    async def _finish_loop_report(self, update: Update, seconds: int):
+        try:
+            path, summary = await profiling.loop_report(seconds)
+            if loop_watchdog.recent:
+                summary += "\n\nSon bloklamalar:\n" + "\n".join(list(loop_watchdog.recent)[-5:])
+            await self.reply(update, f"🔍 Event loop raporu:\n{summary}\n\n💾 {path}")
+        except Exception as e:
+            logger.error(f"Loop report error: {e}")
+            await self.reply(update, "❌ Event loop raporu alınırken hata oluştu.")
+
+    async def export_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Yönetici: sohbetin geçmişini (arşiv dahil) ve tercihlerini .jsonl.gz belgesi olarak gönder"""
+        if not self.is_admin(update.effective_user.id):
+            logger.warning(f"Unauthorized export command attempt by user {update.effective_user.id}")
+            return
+
+        try:
+            chat_id = int(context.args[0]) if context.args else update.effective_chat.id
+        except ValueError:
+            await self.reply(update, "❌ Kullanım: /export [chat_id]")
+            return
+        private = chat_id > 0
+
+        # Sıcak pencere ve tercihler burada kopyalanır; arşiv okuma ve sıkıştırma iş parçacığında yapılır
+        hot, preferences = history_export.snapshot(group_memory, user_preferences, chat_id, private)
+        path = history_export.export_path(chat_id, private)
+        try:
+            counts = await asyncio.get_running_loop().run_in_executor(
+                None, history_export.write_export, path, message_archive, chat_id, private, hot, preferences)
+            if counts["bytes"] > EXPORT_MAX_UPLOAD_MB * 1024 * 1024:
+                await self.reply(update, f"⚠️ Dosya Telegram sınırını aşıyor ({counts['bytes'] / 1e6:.1f} MB); sunucuda bırakıldı:\n{path}")
+                return
+            # Dosya özel mesajlar ve tercih/onay kayıtları içerebilir; gruba değil yöneticinin özeline gönderilir
+            with open(path, 'rb') as f:
+                await update.message.get_bot().send_document(
+                    update.effective_user.id, f, filename=os.path.basename(path),
+                    caption=f"📦 {chat_id}: {counts['messages']} mesaj, {counts['preferences']} tercih kaydı")
+            os.remove(path)
+            if update.effective_chat.type != 'private':
+                await self.reply(update, "📦 Dışa aktarım dosyası size özelden gönderildi.")
+            logger.info(f"Exported chat {chat_id}: {counts['messages']} messages, {counts['bytes']} bytes")
+        except Forbidden:
+            # Bot kullanıcıya yalnızca kullanıcı özelden başlattıysa yazabilir
+            await self.reply(update, "❌ Dosyayı özelden gönderemedim; önce bana özelden /start yazın.")
+        except Exception as e:
+            logger.error(f"Export error for chat {chat_id}: {e}")
+            await self.reply(update, "❌ Dışa aktarım sırasında hata oluştu.")
+
+    async def import_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Yönetici: yanıtlanan dışa aktarım belgesini hafızaya ve tercihlere toplu olarak yükle"""
+        if not self.is_admin(update.effective_user.id):
+            logger.warning(f"Unauthorized import command attempt by user {update.effective_user.id}")
+            return
+
+        source = update.message.reply_to_message
+        document = source.document if source else None
+        if document is None:
+            await self.reply(update, "📥 Dışa aktarım dosyasını yanıtlayarak /import [hedef chat_id] yazın.")
+            return
+        try:
+            target = int(context.args[0]) if context.args else None
+        except ValueError:
+            await self.reply(update, "❌ Kullanım: /import [chat_id]")
+            return
+        if document.file_size and document.file_size > IMPORT_MAX_DOWNLOAD_MB * 1024 * 1024:
+            await self.reply(update, f"⚠️ Bot en fazla {IMPORT_MAX_DOWNLOAD_MB} MB dosya indirebilir; büyük dosyalar için: python history_export.py import DOSYA")
+            return
+
+        path = history_export.export_path(target or update.effective_chat.id, False)
+        try:
+            telegram_file = await document.get_file()
+            await telegram_file.download_to_drive(path)
+            chats, preferences = await asyncio.get_running_loop().run_in_executor(None, history_export.read_import, path, target)
+            counts = await history_export.apply_import_async(group_memory, user_preferences, chats, preferences)
+            await self.reply(update, f"📥 {counts['messages']} mesaj ({counts['skipped']} zaten vardı) ve {counts['preferences']} tercih kaydı yüklendi.")
+            logger.info(f"Imported {counts['messages']} messages and {counts['preferences']} preferences from {document.file_name}")
+        except history_export.ExportFormatError as e:
+            await self.reply(update, f"❌ Dosya okunamadı: {e}")
+        except Exception as e:
+            logger.error(f"Import error: {e}")
+            await self.reply(update, "❌ İçe aktarım sırasında hata oluştu.")
+        finally:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
     async def handle_preference_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message: str, user_id: int, chat_id: int, username: str):
         """Kullanıcı tercih komutlarını işler"""
         try:
@@ -336,20 +769,20 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
                         # Tercih değerini doğrula
                         is_valid, validation_msg = user_preferences.validate_preference(pref_type, pref_value)
                         if not is_valid:
-                            await update.message.reply_text(f"❌ {validation_msg}")
+                            await self.reply(update, f"❌ {validation_msg}")
                             return
                         
                         # Tercihi kaydet (onay kontrolü ile)
                         success, result_msg = user_preferences.add_preference(chat_id, user_id, username, pref_type, pref_value, requesting_user_id=user_id)
                         if success:
-                            await update.message.reply_text(f"✅ Tercih kaydedildi: **{pref_type}** = {pref_value}")
+                            await self.reply(update, f"✅ Tercih kaydedildi: **{pref_type}** = {pref_value}")
                             logger.info(f"Preference saved: {pref_type}={pref_value} for user {user_id} in chat {chat_id}")
                         else:
-                            await update.message.reply_text(f"⚠️ {result_msg}")
+                            await self.reply(update, f"⚠️ {result_msg}")
                     else:
-                        await update.message.reply_text("❌ Format: `tercih kaydet [tip]: [değer]`")
+                        await self.reply(update, "❌ Format: `tercih kaydet [tip]: [değer]`")
                 else:
-                    await update.message.reply_text("❌ Format: `tercih kaydet [tip]: [değer]`")
+                    await self.reply(update, "❌ Format: `tercih kaydet [tip]: [değer]`")
             
             elif "tercih sil" in message_lower or "preference delete" in message_lower:
                 # Format: "tercih sil [tip]"
@@ -357,10 +790,10 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
                 if len(parts) >= 3:
                     pref_type = " ".join(parts[2:]).strip()
                     user_preferences.remove_preference(chat_id, user_id, pref_type)
-                    await update.message.reply_text(f"🗑️ Tercih silindi: **{pref_type}**")
+                    await self.reply(update, f"🗑️ Tercih silindi: **{pref_type}**")
                     logger.info(f"Preference deleted: {pref_type} for user {user_id} in chat {chat_id}")
                 else:
-                    await update.message.reply_text("❌ Format: `tercih sil [tip]`")
+                    await self.reply(update, "❌ Format: `tercih sil [tip]`")
             
             elif "tercihlerim" in message_lower or "my preferences" in message_lower:
                 # Kullanıcının tercihlerini göster
@@ -369,27 +802,27 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
                     prefs_text = f"📋 **{username}**'nin tercihleri:\n\n"
                     for pref_type, pref_value in user_prefs["preferences"].items():
                         prefs_text += f"• **{pref_type}**: {pref_value}\n"
-                    await update.message.reply_text(prefs_text)
+                    await self.reply(update, prefs_text)
                 else:
-                    await update.message.reply_text(f"📋 **{username}**, henüz tercih kaydetmemişsin.")
+                    await self.reply(update, f"📋 **{username}**, henüz tercih kaydetmemişsin.")
             
             elif "tercih onayla" in message_lower or "preference consent" in message_lower:
                 # Kullanıcının tercih kaydetme onayını ver
                 success, result_msg = user_preferences.give_consent(chat_id, user_id, username, requesting_user_id=user_id)
                 if success:
-                    await update.message.reply_text("✅ Tercih kaydetme onayınız verildi! Artık tercihlerinizi kaydedebilirim.")
+                    await self.reply(update, "✅ Tercih kaydetme onayınız verildi! Artık tercihlerinizi kaydedebilirim.")
                     logger.info(f"Consent given by user {user_id} in chat {chat_id}")
                 else:
-                    await update.message.reply_text(f"❌ {result_msg}")
+                    await self.reply(update, f"❌ {result_msg}")
             
             elif "tercih onayı geri al" in message_lower or "revoke consent" in message_lower:
                 # Kullanıcının tercih kaydetme onayını geri al
                 success, result_msg = user_preferences.revoke_consent(chat_id, user_id, requesting_user_id=user_id)
                 if success:
-                    await update.message.reply_text("🗑️ Tercih kaydetme onayınız geri alındı ve tüm tercihleriniz silindi.")
+                    await self.reply(update, "🗑️ Tercih kaydetme onayınız geri alındı ve tüm tercihleriniz silindi.")
                     logger.info(f"Consent revoked by user {user_id} in chat {chat_id}")
                 else:
-                    await update.message.reply_text(f"❌ {result_msg}")
+                    await self.reply(update, f"❌ {result_msg}")
             
             elif "tercih durumum" in message_lower or "preference status" in message_lower:
                 # Kullanıcının tercih durumunu göster
@@ -406,7 +839,7 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
                 else:
                     status_text += "\n📝 Henüz kayıtlı tercih yok."
                 
-                await update.message.reply_text(status_text)
+                await self.reply(update, status_text)
             
             elif "tercih yardım" in message_lower or "preference help" in message_lower:
                 help_text = """📋 **Tercih Komutları:**
@@ -433,17 +866,15 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
 • `tercih kaydet ton: şakacı` (şakacı ol)
 
 **Gizlilik:** Tercihlerinizi kaydetmek için önce `tercih onayla` komutunu kullanın."""
-                await update.message.reply_text(help_text)
+                await self.reply(update, help_text)
             
         except Exception as e:
             logger.error(f"Error handling preference command: {e}")
-            await update.message.reply_text("❌ Tercih komutu işlenirken hata oluştu.")
+            await self.reply(update, "❌ Tercih komutu işlenirken hata oluştu.")
     
     async def auto_detect_preferences(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message: str, user_id: int, chat_id: int, username: str):
         """Kullanıcı mesajlarından otomatik tercih algılar"""
         try:
-            message_lower = message.lower()
-            
             # Bot adını temizle
             bot_username = context.bot.username
             if bot_username:
@@ -452,97 +883,33 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
                 elif message.startswith(f'/{bot_username}'):
                     message = message.replace(f'/{bot_username}', '').strip()
             
-            message_lower = message.lower()
-            detected_preferences = []
-            
-            # Hitap tercihleri
-            if any(word in message_lower for word in ['bana', 'sen', 'siz', 'hitap', 'çağır', 'seslen']):
-                if 'sen' in message_lower and ('de' in message_lower or 'diye' in message_lower or 'şekilde' in message_lower):
-                    detected_preferences.append(('hitap', 'sen'))
-                elif 'siz' in message_lower and ('de' in message_lower or 'diye' in message_lower or 'şekilde' in message_lower):
-                    detected_preferences.append(('hitap', 'siz'))
-                elif 'efendim' in message_lower:
-                    detected_preferences.append(('hitap', 'efendim'))
-                elif 'kanka' in message_lower or 'dost' in message_lower:
-                    detected_preferences.append(('hitap', 'kanka'))
-            
-            # Dil tercihleri
-            if any(word in message_lower for word in ['eski türkçe', 'osmanlıca', 'arapça', 'farsça']):
-                if 'eski türkçe' in message_lower or 'osmanlıca' in message_lower:
-                    detected_preferences.append(('dil', 'eski türkçe'))
-                elif 'arapça' in message_lower:
-                    detected_preferences.append(('dil', 'arapça'))
-                elif 'farsça' in message_lower:
-                    detected_preferences.append(('dil', 'farsça'))
-            elif 'modern' in message_lower and 'türkçe' in message_lower:
-                detected_preferences.append(('dil', 'modern türkçe'))
-            
-            # Ton tercihleri
-            if any(word in message_lower for word in ['şakacı', 'esprili', 'komik', 'eğlenceli']):
-                detected_preferences.append(('ton', 'şakacı'))
-            elif any(word in message_lower for word in ['ciddi', 'resmi', 'formal']):
-                detected_preferences.append(('ton', 'ciddi'))
-            elif any(word in message_lower for word in ['romantik', 'aşık', 'şiirsel']):
-                detected_preferences.append(('ton', 'romantik'))
-            
-            # Şair tercihleri
-            poets = ['nazım hikmet', 'yahya kemal', 'orhan veli', 'cemal süreya', 'attila ilhan', 'turgut uyar', 'edip cansever', 'shelley', 'keats', 'byron']
-            for poet in poets:
-                if poet in message_lower and any(word in message_lower for word in ['seviyorum', 'beğeniyorum', 'okuyor', 'şiir']):
-                    detected_preferences.append(('şair', poet))
-            
-            # Kişilik tercihleri
-            if any(word in message_lower for word in ['gururlu', 'dik başlı', 'kendine güvenen']):
-                detected_preferences.append(('kişilik', 'gururlu'))
-            elif any(word in message_lower for word in ['itaatkar', 'saygılı', 'hizmetkar']):
-                detected_preferences.append(('kişilik', 'itaatkar'))
-            elif any(word in message_lower for word in ['şakacı', 'esprili', 'komik']):
-                detected_preferences.append(('kişilik', 'şakacı'))
-            
-            # Özel tercihler
-            if 'ben' in message_lower and any(word in message_lower for word in ['seviyorum', 'beğeniyorum', 'hoşlanıyorum']):
-                # Genel sevme ifadelerini yakala
-                if 'şiir' in message_lower:
-                    detected_preferences.append(('ilgi', 'şiir'))
-                elif 'müzik' in message_lower:
-                    detected_preferences.append(('ilgi', 'müzik'))
-                elif 'kitap' in message_lower:
-                    detected_preferences.append(('ilgi', 'kitap'))
-                elif 'sanat' in message_lower:
-                    detected_preferences.append(('ilgi', 'sanat'))
+            # Tüm tercih ifadeleri tek geçişte aranır (bkz. preference_detector.PREFERENCE_RULES)
+            detected_preferences = preference_detector.detect(message)
             
             # Tercihleri kaydet (onay kontrolü ile)
             if detected_preferences:
-                saved_preferences = []
-                failed_preferences = []
-                
-                for pref_type, pref_value in detected_preferences:
-                    # Tercih değerini doğrula
-                    is_valid, validation_msg = user_preferences.validate_preference(pref_type, pref_value)
-                    if not is_valid:
-                        failed_preferences.append(f"{pref_type}: {validation_msg}")
-                        continue
-                    
-                    # Tercihi kaydet (onay kontrolü ile)
-                    success, result_msg = user_preferences.add_preference(chat_id, user_id, username, pref_type, pref_value, requesting_user_id=user_id)
-                    if success:
-                        saved_preferences.append(f"**{pref_type}**: {pref_value}")
-                    else:
-                        failed_preferences.append(f"{pref_type}: {result_msg}")
+                # Tüm tercihler tek doğrulama ve tek dosya yazımıyla kaydedilir
+                results = user_preferences.apply_batch(
+                    chat_id, user_id, username,
+                    [("set", pref_type, pref_value) for pref_type, pref_value in detected_preferences],
+                    requesting_user_id=user_id
+                )
+                saved_preferences = [f"**{result['type']}**: {result['value']}" for result in results if result["success"]]
+                failed_preferences = [f"{result['type']}: {result['message']}" for result in results if not result["success"]]
                 
                 # Kullanıcıya bildirim gönder
                 if saved_preferences:
                     prefs_text = "🧠 **Otomatik tercih algılandı ve kaydedildi:**\n"
                     for pref in saved_preferences:
                         prefs_text += f"• {pref}\n"
-                    await update.message.reply_text(prefs_text)
+                    await self.reply(update, prefs_text)
                     logger.info(f"Auto-detected and saved preferences for {username}: {saved_preferences}")
                 
                 if failed_preferences:
                     failed_text = "⚠️ **Bazı tercihler kaydedilemedi:**\n"
                     for failed in failed_preferences:
                         failed_text += f"• {failed}\n"
-                    await update.message.reply_text(failed_text)
+                    await self.reply(update, failed_text)
             
         except Exception as e:
             logger.error(f"Error in auto preference detection: {e}")
@@ -556,6 +923,17 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
 
             user_id = update.message.from_user.id
             chat_id = update.message.chat.id
+            message_id = update.message.message_id
+
+            # Yeniden başlatma veya tekrar gönderimde aynı güncellemeyi ikinci kez işleme
+            processed = update_cache.check(update.update_id, chat_id, message_id)
+            if processed is not None:
+                logger.info(f"Duplicate update {update.update_id} (message {message_id} in chat {chat_id}) skipped")
+                # Yanıt yalnızca ilk seferde gönderilemeden kaldıysa yeniden gönderilir
+                if processed["reply"] and not processed.get("delivered"):
+                    await self.reply(update, processed["reply"], on_sent=lambda: update_cache.mark_delivered(chat_id, message_id))
+                return
+            update_cache.mark(update.update_id, chat_id, message_id)
 
             # Güvenlik kontrolü: Sadece izin verilen gruplarda çalış
             if update.message.chat.type in ['group', 'supergroup']:
@@ -565,24 +943,31 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
 
             # Kullanıcı adını al
             username = update.message.from_user.username or update.message.from_user.first_name
-            
+
+            # Grupta bot etiketlendi mi veya bota yanıt mı verildi
+            bot_username = context.bot.username
+            addressed = bool(bot_username and (user_message.startswith(f'@{bot_username}') or
+                                               user_message.startswith(f'/{bot_username}') or
+                                               (update.message.reply_to_message and
+                                                update.message.reply_to_message.from_user.id == context.bot.id)))
+
             # Mesajları kaydet (grup ve özel mesajlar ayrı)
             if update.message.chat.type in ['group', 'supergroup']:
-                # Grup mesajları
-                group_memory.add_group_message(chat_id, user_id, username, user_message, "user")
-                logger.info(f"Group message saved from {username} ({user_id}) in chat {chat_id}: {user_message[:50]}...")
+                # Grup mesajları; bota yönelmeyenler tekrar/uzunluk filtresinden geçer
+                if addressed or not INGEST_FILTER_ENABLED:
+                    group_memory.add_group_message(chat_id, user_id, username, user_message, "user")
+                    result = "stored"
+                else:
+                    result = ingest_filter.ingest(chat_id, user_id, username, user_message)
+                message_logger.info(f"Group message {result} from {username} ({user_id}) in chat {chat_id}: {user_message[:LOG_MESSAGE_PREVIEW]}...")
             else:
                 # Özel mesajlar
                 group_memory.add_private_message(user_id, username, user_message, "user")
-                logger.info(f"Private message saved from {username} ({user_id}): {user_message[:50]}...")
+                message_logger.info(f"Private message saved from {username} ({user_id}): {user_message[:LOG_MESSAGE_PREVIEW]}...")
 
             # Kullanıcı tercihi algılama (bot'a yönelik mesajlarda)
             if update.message.chat.type in ['group', 'supergroup']:
-                bot_username = context.bot.username
-                if bot_username and (user_message.startswith(f'@{bot_username}') or
-                                     user_message.startswith(f'/{bot_username}') or
-                                     (update.message.reply_to_message and
-                                      update.message.reply_to_message.from_user.id == context.bot.id)):
+                if addressed:
                     # Tercih kaydetme komutlarını kontrol et
                     if "tercih" in user_message.lower() or "preference" in user_message.lower():
                         await self.handle_preference_command(update, context, user_message, user_id, chat_id, username)
@@ -593,11 +978,7 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
             # Bot'a yönelik mesajları kontrol et (sadece bot etiketlenen veya yanıtlanan mesajlar)
             bot_should_respond = False
             if update.message.chat.type in ['group', 'supergroup']:
-                bot_username = context.bot.username
-                if bot_username and (user_message.startswith(f'@{bot_username}') or 
-                                   user_message.startswith(f'/{bot_username}') or
-                                   update.message.reply_to_message and 
-                                   update.message.reply_to_message.from_user.id == context.bot.id):
+                if addressed:
                     bot_should_respond = True
                     
                     # Bot adını mesajdan temizle
@@ -619,10 +1000,11 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
                     if recent_messages:
                         # AI ile gerçek özet oluştur
                         ai_summary = await self.create_ai_summary(recent_messages)
-                        await update.message.reply_text(ai_summary)
+                        update_cache.set_reply(chat_id, message_id, ai_summary)
+                        await self.reply(update, ai_summary, on_sent=lambda: update_cache.mark_delivered(chat_id, message_id))
                         return
                     else:
-                        await update.message.reply_text("Son 24 saatte hiç mesaj bulunamadı.")
+                        await self.reply(update, "Son 24 saatte hiç mesaj bulunamadı.")
                         return
 
                 # Yapay zeka yanıtı al
@@ -634,25 +1016,28 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
                         group_memory.add_bot_response(chat_id, ai_response, user_id, username)
                     else:
                         group_memory.add_private_bot_response(user_id, ai_response)
+                    update_cache.set_reply(chat_id, message_id, ai_response)
+
+                    # every-write modunda mesaj ve yanıt diske yazılmadan gönderilmez
+                    await durable_writer.wait_durable()
 
                     # Mesajı gönder
-                    await update.message.reply_text(ai_response)
+                    await self.reply(update, ai_response, on_sent=lambda: update_cache.mark_delivered(chat_id, message_id))
                     logger.info(f"AI response sent to {user_id}")
                 else:
-                    await update.message.reply_text("Üzgünüm, şu anda yanıt veremiyorum. Lütfen daha sonra tekrar deneyin.")
+                    await self.reply(update, "Üzgünüm, şu anda yanıt veremiyorum. Lütfen daha sonra tekrar deneyin.")
 
         except Exception as e:
             logger.error(f"Error handling message: {e}")
             try:
-                await update.message.reply_text("Bir hata oluştu. Lütfen daha sonra tekrar deneyin.")
+                await self.reply(update, "Bir hata oluştu. Lütfen daha sonra tekrar deneyin.")
             except:
                 pass
     
     async def get_ai_response(self, message: str, user_id: int, chat_id: int) -> str:
         """Google Gemini API ile yanıt al"""
         try:
-            # Gemini modelini oluştur
-            model = genai.GenerativeModel('models/gemini-2.0-flash')
+            prompt_started = time.perf_counter()
 
             # Konuşma geçmişini al (grup veya özel mesaj)
             if chat_id < 0:  # Grup mesajı
@@ -673,11 +1058,11 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
                         if user_id_msg not in user_last_messages:
                             user_last_messages[user_id_msg] = {
                                 'username': username,
-                                'last_message': msg['message'],
+                                'last_message': display_text(msg),
                                 'timestamp': msg['timestamp']
                             }
                         elif msg['timestamp'] > user_last_messages[user_id_msg]['timestamp']:
-                            user_last_messages[user_id_msg]['last_message'] = msg['message']
+                            user_last_messages[user_id_msg]['last_message'] = display_text(msg)
                             user_last_messages[user_id_msg]['timestamp'] = msg['timestamp']
                     
                     group_users_context = "\n\nGrup üyelerinin son mesajları:\n"
@@ -687,15 +1072,9 @@ Sadece bana bir mesaj gönderin, size hizmet etmeye çalışacağım!
                         if last_message:
                             group_users_context += f"- {username}: {last_message}\n"
             
-            # Kullanıcının tercihlerini al
-            user_prefs = user_preferences.get_user_preferences(chat_id, user_id)
-            user_preferences_text = ""
-            if user_prefs and "preferences" in user_prefs:
-                prefs = user_prefs["preferences"]
-                if prefs:
-                    user_preferences_text = "\n\nBu kullanıcının tercihleri:\n"
-                    for pref_type, pref_value in prefs.items():
-                        user_preferences_text += f"- {pref_type}: {pref_value}\n"
+            # Kullanıcının ve grubun tercihleri (değişene kadar önbellekteki hazır metin)
+            user_preferences_text = user_preferences.get_prompt_fragment(chat_id, user_id)
+            group_preferences_text = user_preferences.get_chat_prompt_block(chat_id) if chat_id < 0 else ""
             
             # Sistem prompt'u oluştur
             system_prompt = """Sen mahzen grubunun şahsi kölesisin ama gururlu, şakacı ve edebi bir kölesin. Türkçe konuşuyorsun ve mahzen grubunun üyelerine hizmet ediyorsun.
@@ -764,20 +1143,43 @@ Ama çoğunlukla yardımcı ve hizmetkar ol."""
             # Prompt'u oluştur
             if conversation_history:
                 # Konuşma geçmişi varsa, son birkaç mesajı dahil et
-                recent_history = conversation_history[-6:]  # Son 6 mesaj (3 çift)
-                context = "\n".join([f"{'Bot' if msg['message_type'] == 'bot' else msg['username']}: {msg['message']}" for msg in recent_history])
-                prompt = f"{system_prompt}{group_users_context}{user_preferences_text}\n\nKonuşma geçmişi:\n{context}\n\nKullanıcı: {message}"
+                recent_history = conversation_history[-RECENT_HISTORY_TURNS:]
+                # Daha eski turların özeti; birikmişse yanıtı bekletmeden arka planda yenilenir
+                synopsis = conversation_synopsis.prompt_context(chat_id, user_id)
+                conversation_synopsis.schedule(chat_id, user_id, conversation_history, self.generate_synopsis)
+                # Son konuşmadan önceki mesajlardan soruyla ilgili olanlar
+                relevant_history = semantic_memory.prompt_context(chat_id, message, before=recent_history[0]['timestamp'])
+                context_blocks = f"{group_users_context}{group_preferences_text}{user_preferences_text}{synopsis}{relevant_history}"
+
+            if conversation_history and CHAT_SESSIONS_ENABLED:
+                # Persona ve son turlar oturumda durur; yalnızca güncel bağlam ve yeni tur gönderilir
+                entry = chat_sessions.get(chat_id, user_id, conversation_history, system_prompt, self.create_model)
+                pending = chat_sessions.pending_messages(entry, conversation_history)
+                user_turn = "\n".join(pending + [f"{conversation_history[-1]['username']}: {message}"])
+                stage_duration.observe(time.perf_counter() - prompt_started, stage="prompt_build")
+                try:
+                    ai_response = self.generate_text(entry.session, f"{context_blocks.strip()}\n\n{user_turn}")
+                except Exception:
+                    # Yarım kalan akış oturum geçmişini bozar; sonraki yanıtta geçmişten yeniden kurulur
+                    chat_sessions.drop((chat_id, user_id))
+                    raise
             else:
-                prompt = f"{system_prompt}{group_users_context}{user_preferences_text}\n\nKullanıcı sorusu: {message}"
-            
-            # Gemini'den yanıt al
-            response = model.generate_content(prompt)
-            
-            ai_response = response.text.strip()
+                if conversation_history:
+                    context = "\n".join([f"{'Bot' if msg['message_type'] == 'bot' else msg['username']}: {display_text(msg)}" for msg in recent_history])
+                    prompt = f"{system_prompt}{context_blocks}\n\nKonuşma geçmişi:\n{context}\n\nKullanıcı: {message}"
+                else:
+                    prompt = f"{system_prompt}{group_users_context}{group_preferences_text}{user_preferences_text}\n\nKullanıcı sorusu: {message}"
+                stage_duration.observe(time.perf_counter() - prompt_started, stage="prompt_build")
+
+                # Gemini'den yanıt al
+                ai_response = self.generate_text(self.create_model(), prompt)
             
             # Mesaj uzunluğu kontrolü
             if len(ai_response) > MAX_MESSAGE_LENGTH:
                 ai_response = ai_response[:MAX_MESSAGE_LENGTH-3] + "..."
+
+            if conversation_history and CHAT_SESSIONS_ENABLED:
+                chat_sessions.record(chat_id, user_id, user_turn, ai_response, conversation_history[-1]['timestamp'])
             
             return ai_response
             
@@ -785,16 +1187,38 @@ Ama çoğunlukla yardımcı ve hizmetkar ol."""
             logger.error(f"Gemini API error: {e}")
             return None
     
+    def generate_text(self, model, prompt: str) -> str:
+        """Gemini'den akış olarak yanıt al; ilk parça ve toplam süreyi ölç
+
+        `model` bir ChatSession ise prompt oturuma yeni tur olarak gönderilir.
+        """
+        started = time.perf_counter()
+        if hasattr(model, "send_message"):
+            response = model.send_message(prompt, stream=True)
+        else:
+            response = model.generate_content(prompt, stream=True)
+        first_chunk = True
+        for _ in response:
+            if first_chunk:
+                stage_duration.observe(time.perf_counter() - started, stage="gemini_first_token")
+                first_chunk = False
+        stage_duration.observe(time.perf_counter() - started, stage="gemini_total")
+        return response.text.strip()
+
+    def generate_synopsis(self, prompt: str) -> str:
+        """Konuşma özeti için Gemini'yi akışsız çağır (iş parçacığında çalışır; yanıt metriklerine girmez)"""
+        return self.create_model().generate_content(prompt).text.strip()
+
     async def create_ai_summary(self, messages: List[Dict[str, Any]]) -> str:
         """AI ile grup mesajlarını özetler"""
         try:
-            model = genai.GenerativeModel('models/gemini-2.0-flash')
+            model = self.create_model()
             
             # Mesajları formatla
             formatted_messages = []
             for msg in messages:
                 username = msg['username'] or f"User_{msg['user_id']}"
-                formatted_messages.append(f"{username}: {msg['message']}")
+                formatted_messages.append(f"{username}: {display_text(msg)}")
             
             messages_text = "\n".join(formatted_messages)
             
@@ -815,8 +1239,7 @@ Grup mesajları:
 
 Özet:"""
             
-            response = model.generate_content(prompt)
-            summary = response.text.strip()
+            summary = self.generate_text(model, prompt)
             
             # Mesaj uzunluğu kontrolü
             if len(summary) > MAX_MESSAGE_LENGTH:
@@ -835,6 +1258,7 @@ Grup mesajları:
             await self.application.initialize()
             await self.application.start()
             await self.application.updater.start_polling()
+            await self.start_services()
             
             logger.info("Bot başarıyla başlatıldı!")
             
@@ -844,6 +1268,7 @@ Grup mesajları:
         except Exception as e:
             logger.error(f"Bot başlatma hatası: {e}")
         finally:
+            await self.stop_services()
             await self.application.stop()
 
 async def main():
@@ -856,8 +1281,15 @@ async def main():
         logger.error("GEMINI_API_KEY bulunamadı!")
         return
     
+    if SHARD_WORKERS > 1:
+        # Sohbetleri worker süreçlerine dağıt
+        from sharding import run_sharded
+        await run_sharded(SHARD_WORKERS)
+        return
+
     bot = TelegramAIBot()
     await bot.run()
 
 if __name__ == "__main__":
+    http_clients.install_event_loop_policy()
     asyncio.run(main())
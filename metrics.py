@@ -0,0 +1,199 @@
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Saniye cinsinden varsayılan histogram sınırları (0.5 ms - 60 sn)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """Sadece artan sayaç."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(_label_key(labels), 0)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in self.values.items()]
+
+
+class Gauge:
+    """Anlık değer; `callback` verilirse değer her okumada hesaplanır."""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, help_text: str, callback: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+        self.values: Dict[LabelKey, float] = {}
+
+    def set(self, value: float, **labels):
+        self.values[_label_key(labels)] = value
+
+    def get(self, **labels) -> Optional[float]:
+        """Değeri döndürür; `callback` hata verirse hatayı loglayıp None döndürür."""
+        if self.callback is not None:
+            try:
+                return self.callback()
+            except Exception as e:
+                logger.error(f"Gauge {self.name} callback failed: {e}")
+                return None
+        return self.values.get(_label_key(labels), 0)
+
+    def render(self) -> List[str]:
+        if self.callback is not None:
+            value = self.get()
+            return [f"{self.name} {value}"] if value is not None else []
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in self.values.items()]
+
+
+class _HistogramSeries:
+    def __init__(self, bucket_count: int):
+        self.counts = [0] * (bucket_count + 1)  # Son kova +Inf
+        self.total = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """Kovalı gecikme histogramı (Prometheus histogram formatında)."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.series: Dict[LabelKey, _HistogramSeries] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = _HistogramSeries(len(self.buckets))
+        series.counts[bisect.bisect_left(self.buckets, value)] += 1
+        series.total += value
+        series.count += 1
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Kovalardan doğrusal ara değerleme ile yüzdelik tahmini yapar."""
+        series = self.series.get(_label_key(labels))
+        if series is None or series.count == 0:
+            return None
+        rank = q * series.count
+        cumulative = 0
+        for index, count in enumerate(series.counts):
+            if cumulative + count >= rank and count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * ((rank - cumulative) / count)
+            cumulative += count
+        return self.buckets[-1]
+
+    def label_values(self, label: str) -> List[str]:
+        return [dict(key).get(label) for key in self.series]
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series.counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {series.count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series.total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Botun sayaç, gösterge ve histogramlarını tutar."""
+
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        existing = self.metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._register(Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str, callback: Callable[[], float] = None) -> Gauge:
+        gauge = self._register(Gauge(name, help_text, callback))
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets))
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Bloğun süresini `bot_stage_duration_seconds{stage=...}` histogramına yazar."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage_duration.observe(time.perf_counter() - started, stage=stage)
+
+    def render(self) -> str:
+        """Tüm metrikleri Prometheus metin formatında döndürür."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+async def start_metrics_server(host: str, port: int):
+    """Metrikleri `/metrics` adresinde sunan yerel HTTP sunucusunu başlatır."""
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return runner
+
+# Global metrics registry
+metrics = MetricsRegistry()
+
+stage_duration = metrics.histogram("bot_stage_duration_seconds", "Yanıt aşamalarının süresi (saniye)")
+cache_requests = metrics.counter("bot_cache_requests_total", "Önbellek sorguları (cache ve result etiketli)")
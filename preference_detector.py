@@ -0,0 +1,287 @@
+from typing import Dict, FrozenSet, List, Set, Tuple
+
+from turkish_text import fold_diacritics, normalize, tokenize
+
+# Otomatik tercih algılama kuralları.
+# Her grup bir tercih türüdür; adaylar sırayla denenir ve ilk uyan kaydedilir
+# ("all_matches" grubunda uyan her aday kaydedilir). Koşul listesindeki her
+# eleman "bu ifadelerden en az biri geçiyor" demektir. "*" ile biten ifadeler
+# kelime başında eşleşir ve ek alabilir (şiir* -> şiiri, şiirler); diğerleri
+# tam kelime olarak eşleşir. Kelimeler Türkçe harfler indirgenerek (ş -> s, ç -> c)
+# karşılaştırılır; "=" ile başlayan ifadeler indirgenmemiş kelimeyle eşleşir
+# (hitaptaki "sen", "şen" kelimesiyle karışmasın diye).
+PREFERENCE_RULES = [
+    {
+        "type": "hitap",
+        "requires": [["bana", "=sen", "=siz", "hitap*", "çağır*", "seslen*"]],
+        "candidates": [
+            ("sen", [["=sen"], ["de", "diye", "şekilde"]]),
+            ("siz", [["=siz"], ["de", "diye", "şekilde"]]),
+            ("efendim", [["efendim"]]),
+            ("kanka", [["kanka*", "dost*"]]),
+        ],
+    },
+    {
+        "type": "dil",
+        "candidates": [
+            ("eski türkçe", [["eski türkçe*", "osmanlıca*"]]),
+            ("arapça", [["arapça*"]]),
+            ("farsça", [["farsça*"]]),
+            ("modern türkçe", [["modern"], ["türkçe*"]]),
+        ],
+    },
+    {
+        "type": "ton",
+        "candidates": [
+            ("şakacı", [["şakacı*", "esprili*", "komik*", "eğlenceli*"]]),
+            ("ciddi", [["ciddi*", "resmi*", "formal*"]]),
+            ("romantik", [["romantik*", "aşık*", "şiirsel*"]]),
+        ],
+    },
+    {
+        "type": "şair",
+        "all_matches": True,
+        "requires": [["seviyorum", "beğeniyorum", "okuyor*", "şiir*"]],
+        "candidates": [
+            (poet, [[f"{poet}*"]])
+            for poet in ["nazım hikmet", "yahya kemal", "orhan veli", "cemal süreya", "attila ilhan",
+                         "turgut uyar", "edip cansever", "shelley", "keats", "byron"]
+        ],
+    },
+    {
+        "type": "kişilik",
+        "candidates": [
+            ("gururlu", [["gururlu*", "dik başlı*", "kendine güvenen*"]]),
+            ("itaatkar", [["itaatkar*", "saygılı*", "hizmetkar*"]]),
+            ("şakacı", [["şakacı*", "esprili*", "komik*"]]),
+        ],
+    },
+    {
+        "type": "ilgi",
+        "requires": [["ben"], ["seviyorum", "beğeniyorum", "hoşlanıyorum"]],
+        "candidates": [
+            ("şiir", [["şiir*"]]),
+            ("müzik", [["müzik*"]]),
+            ("kitap", [["kitap*"]]),
+            ("sanat", [["sanat*"]]),
+        ],
+    },
+]
+
+Condition = List[FrozenSet[int]]
+
+RESULT_CACHE_SIZE = 10_000
+
+
+class KeywordAutomaton:
+    """Tüm ifadeleri tek geçişte bulan kelime düzeyinde Aho-Corasick tarzı otomat.
+
+    Alfabe kelimelerdir: her kelime bir kez tam kelime ve kök (ek alabilen)
+    sembollerine çözülür ve sonuç önbelleğe alınır, böylece sık geçen
+    kelimeler tek sözlük aramasıyla geçilir. Çok kelimeli ifadeler sembol
+    trie'sinde yürünür; aynı anda açık kalan düğümler birlikte ilerletilir.
+
+    Metin harfleri indirgenmeden (`turkish_text.tokenize(text, fold=False)`)
+    verilir; kelime çözülürken bir kez indirgenir. Normal ifadeler indirgenmiş
+    kelimeyle, `exact` ifadeler kelimenin kendisiyle eşleşir; ikisi aynı
+    otomatta tek geçişte aranır. İfadeler `turkish_text.normalize` ile
+    (exact ise `fold=False`) hazırlanmalıdır.
+    """
+
+    def __init__(self, cache_size: int = 50_000):
+        self.symbols: Dict[Tuple[str, bool, bool], int] = {}  # (kelime, kök mü, indirgenmemiş mi) -> sembol
+        self.stem_lengths: List[int] = []
+        self.children: List[Dict[int, int]] = [{}]
+        self.outputs: List[List[int]] = [[]]
+        self.pattern_count = 0
+        self.cache_size = cache_size
+        self.word_cache: Dict[str, Tuple[Tuple[int, ...], Tuple[int, ...]]] = {}
+        self.matching_words: Set[str] = set()  # Önbellekte sembolü olan kelimeler
+        self.inner_symbols: Set[int] = set()
+        self.has_exact = False
+
+    def _symbol(self, word: str, stem: bool, exact: bool) -> int:
+        key = (word, stem, exact)
+        if key not in self.symbols:
+            self.symbols[key] = len(self.symbols)
+            if stem and len(word) not in self.stem_lengths:
+                self.stem_lengths.append(len(word))
+        return self.symbols[key]
+
+    def add(self, phrase: str, whole_word: bool, exact: bool = False) -> int:
+        """İfadeyi ekler ve kimliğini döndürür; yalnızca son kelime kök olabilir.
+
+        `exact` ifadeler harfleri indirgenmemiş kelimelerle eşleşir.
+        """
+        words = phrase.split()
+        self.has_exact = self.has_exact or exact
+        node = 0
+        for index, word in enumerate(words):
+            symbol = self._symbol(word, not whole_word and index == len(words) - 1, exact)
+            next_node = self.children[node].get(symbol)
+            if next_node is None:
+                next_node = len(self.children)
+                self.children.append({})
+                self.outputs.append([])
+                self.children[node][symbol] = next_node
+            node = next_node
+        pattern_id = self.pattern_count
+        self.pattern_count += 1
+        self.outputs[node].append(pattern_id)
+        self.word_cache.clear()
+        self.matching_words.clear()
+        return pattern_id
+
+    def build(self):
+        """Kök uzunluklarını sıralar ve ifadelerin ikinci ve sonraki kelimelerindeki sembolleri toplar."""
+        self.stem_lengths.sort()
+        self.inner_symbols = {symbol for edges in self.children[1:] for symbol in edges}
+        self.word_cache.clear()
+        self.matching_words.clear()
+
+    def _resolve(self, word: str) -> Tuple[Tuple[int, ...], Tuple[int, ...], Tuple[int, ...]]:
+        """Kelimeyi önbellekli olarak (tamamladığı tek kelimelik ifadeler,
+        devam ettirebileceği semboller, başlattığı çok kelimeli ifade düğümleri)
+        üçlüsüne çözer."""
+        resolved = self.word_cache.get(word)
+        if resolved is None:
+            symbols = []
+            forms = [(fold_diacritics(word), False)]
+            if self.has_exact:
+                forms.append((word, True))
+            for form, exact in forms:
+                whole = self.symbols.get((form, False, exact))
+                if whole is not None:
+                    symbols.append(whole)
+                for length in self.stem_lengths:
+                    if length > len(form):
+                        break
+                    stem = self.symbols.get((form[:length], True, exact))
+                    if stem is not None:
+                        symbols.append(stem)
+            root = self.children[0]
+            starts = [root[symbol] for symbol in symbols if symbol in root]
+            resolved = (
+                tuple(pattern_id for node in starts for pattern_id in self.outputs[node]),
+                tuple(symbol for symbol in symbols if symbol in self.inner_symbols),
+                tuple(node for node in starts if self.children[node]),
+            )
+            if len(self.word_cache) >= self.cache_size:
+                self.word_cache.clear()
+                self.matching_words.clear()
+            self.word_cache[word] = resolved
+            if symbols:
+                self.matching_words.add(word)
+        return resolved
+
+    def search(self, words: List[str]) -> Set[int]:
+        """Kelime dizisinde geçen ifadelerin kimliklerini döndürür."""
+        children, outputs, cache = self.children, self.outputs, self.word_cache
+        found = set()
+        # Çoğu mesajda hiçbir ifade geçmez; bilinen kelimelerde bu küme işlemleriyle anlaşılır
+        distinct = set(words)
+        for word in distinct.difference(cache):
+            self._resolve(word)
+        if distinct.isdisjoint(self.matching_words):
+            return found
+
+        matching = self.matching_words
+        active: List[int] = []
+        previous = -2
+        # Yalnızca sembolü olan kelimeler gezilir; çok kelimeli ifadeler için komşuluk indeksle izlenir
+        for index, word in [(index, word) for index, word in enumerate(words) if word in matching]:
+            patterns, symbols, starts = cache[word]
+            found.update(patterns)
+            if active and symbols and index == previous + 1:
+                next_active = list(starts)
+                for node in active:
+                    edges = children[node]
+                    for symbol in symbols:
+                        child = edges.get(symbol)
+                        if child is not None:
+                            found.update(outputs[child])
+                            if children[child]:
+                                next_active.append(child)
+                active = next_active
+            else:
+                active = starts
+            previous = index
+        return found
+
+
+class PreferenceDetector:
+    """Mesajdaki tüm tercihleri tek geçişte algılar.
+
+    Kurallardaki ifadeler bir kez normalleştirilip otomata derlenir; mesaj
+    taranınca kurallar yalnızca bulunan ifade kümesi üzerinden değerlendirilir.
+    "=" ile işaretli ifadeler aynı otomata indirgenmemiş olarak eklenir;
+    mesaj her durumda tek kez taranır.
+    """
+
+    def __init__(self, rules: List[Dict] = None):
+        self.automaton = KeywordAutomaton()
+        self.phrase_ids: Dict[Tuple[str, bool, bool], int] = {}
+        self.groups = [self._compile_group(group) for group in (rules or PREFERENCE_RULES)]
+        self.automaton.build()
+        # Bulunan ifade kümeleri mesajlar arasında çok tekrar eder; kural sonucu bunlar için saklanır
+        self.result_cache: Dict[FrozenSet[int], List[Tuple[str, str]]] = {}
+
+    def _phrase_id(self, phrase: str) -> int:
+        whole_word = not phrase.endswith("*")
+        exact = phrase.startswith("=")
+        phrase = phrase.lstrip("=").rstrip("*")
+        key = (normalize(phrase, fold=not exact), whole_word, exact)
+        if key not in self.phrase_ids:
+            self.phrase_ids[key] = self.automaton.add(*key)
+        return self.phrase_ids[key]
+
+    def _compile_condition(self, condition: List[List[str]]) -> Condition:
+        return [frozenset(self._phrase_id(phrase) for phrase in alternatives) for alternatives in condition]
+
+    def _compile_group(self, group: Dict) -> Tuple[str, bool, FrozenSet[int], Condition, List[Tuple[str, Condition]]]:
+        candidates = [(value, self._compile_condition(condition)) for value, condition in group["candidates"]]
+        # Adaylardan hiçbirinin ifadesi geçmiyorsa grup hiç değerlendirilmez
+        triggers = frozenset().union(*(alternatives for _, condition in candidates for alternatives in condition))
+        return (
+            group["type"],
+            group.get("all_matches", False),
+            triggers,
+            self._compile_condition(group.get("requires", [])),
+            candidates,
+        )
+
+    @staticmethod
+    def _satisfied(condition: Condition, found: Set[int]) -> bool:
+        for alternatives in condition:
+            if found.isdisjoint(alternatives):
+                return False
+        return True
+
+    def detect(self, text: str) -> List[Tuple[str, str]]:
+        """Mesajdaki (tercih türü, değer) çiftlerini kural sırasıyla döndürür."""
+        found = self.automaton.search(tokenize(text, fold=False))
+        if not found:
+            return []
+
+        key = frozenset(found)
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            return list(cached)
+
+        detected = []
+        for preference_type, all_matches, triggers, requires, candidates in self.groups:
+            if found.isdisjoint(triggers) or not self._satisfied(requires, found):
+                continue
+            for value, condition in candidates:
+                if self._satisfied(condition, found):
+                    detected.append((preference_type, value))
+                    if not all_matches:
+                        break
+        if len(self.result_cache) >= RESULT_CACHE_SIZE:
+            self.result_cache.clear()
+        self.result_cache[key] = detected
+        return list(detected)
+
+
+# Global preference detector instance
+preference_detector = PreferenceDetector()
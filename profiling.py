@@ -0,0 +1,156 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+from collections import Counter
+from typing import List, Tuple
+
+from config import PROFILE_DIR, PROFILE_TOP_N, SLOW_CALLBACK_SECONDS, TRACEMALLOC_FRAMES, shard_path
+
+logger = logging.getLogger(__name__)
+
+_profiling_active = False
+
+
+def _output_path(prefix: str, extension: str) -> str:
+    """Profil çıktısı için zaman damgalı dosya yolu oluşturur."""
+    directory = shard_path(PROFILE_DIR)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}.{extension}")
+
+
+def is_profiling() -> bool:
+    return _profiling_active
+
+
+async def profile_event_loop(seconds: float) -> Tuple[str, str]:
+    """Event loop thread'ini `seconds` boyunca cProfile ile ölçer.
+
+    Ham istatistikler `.prof` dosyasına (snakeviz/pstats ile açılabilir),
+    kümülatif süreye göre sıralı ilk satırlar `.txt` dosyasına yazılır.
+    Dosya yolu ve kısa özet döndürülür.
+    """
+    global _profiling_active
+    if _profiling_active:
+        raise RuntimeError("Profiling is already running")
+
+    _profiling_active = True
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+        _profiling_active = False
+
+    path = _output_path("profile", "prof")
+    profiler.dump_stats(path)
+
+    report = io.StringIO()
+    stats = pstats.Stats(profiler, stream=report)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(50)
+    with open(path.replace(".prof", ".txt"), 'w', encoding='utf-8') as f:
+        f.write(report.getvalue())
+
+    lines = []
+    entries = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+    for (filename, lineno, function), (_, calls, _, cumulative, _) in entries[:PROFILE_TOP_N]:
+        lines.append(f"{cumulative * 1000:8.1f} ms  {calls:6d}x  {os.path.basename(filename)}:{lineno} {function}")
+    return path, "\n".join(lines)
+
+
+def start_tracemalloc() -> bool:
+    """Bellek izlemeyi başlatır; zaten açıksa False döndürür."""
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    return True
+
+
+def stop_tracemalloc():
+    tracemalloc.stop()
+
+
+def memory_snapshot() -> Tuple[str, str]:
+    """tracemalloc anlık görüntüsü alır, en büyük ayırmaları dosyaya ve özete yazar."""
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ))
+    statistics = snapshot.statistics("lineno")
+    current, peak = tracemalloc.get_traced_memory()
+
+    path = _output_path("tracemalloc", "txt")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"current={current} peak={peak}\n\n")
+        for stat in snapshot.statistics("traceback")[:50]:
+            f.write(f"{stat.size / 1024:.1f} KiB in {stat.count} blocks\n")
+            for line in stat.traceback.format():
+                f.write(f"{line}\n")
+            f.write("\n")
+
+    lines = [f"Toplam: {current / 1024 / 1024:.1f} MiB (tepe {peak / 1024 / 1024:.1f} MiB)"]
+    for stat in statistics[:PROFILE_TOP_N]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size / 1024:8.1f} KiB  {stat.count:7d} blok  {os.path.basename(frame.filename)}:{frame.lineno}")
+    return path, "\n".join(lines)
+
+
+class _SlowCallbackCollector(logging.Handler):
+    """asyncio debug modunun 'Executing ... took X seconds' uyarılarını toplar."""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.records: List[str] = []
+
+    def emit(self, record: logging.LogRecord):
+        message = record.getMessage()
+        if message.startswith("Executing"):
+            self.records.append(message)
+
+
+def describe_tasks() -> List[str]:
+    """Çalışan asyncio görevlerini coroutine adına göre sayar."""
+    counts = Counter()
+    for task in asyncio.all_tasks():
+        coro = task.get_coro()
+        counts[getattr(coro, "__qualname__", repr(coro))] += 1
+    return [f"{count:4d}  {name}" for name, count in counts.most_common()]
+
+
+async def loop_report(seconds: float) -> Tuple[str, str]:
+    """Görev sayılarını raporlar ve `seconds` boyunca yavaş callback'leri toplar."""
+    loop = asyncio.get_running_loop()
+    asyncio_logger = logging.getLogger("asyncio")
+    collector = _SlowCallbackCollector()
+
+    previous_debug = loop.get_debug()
+    previous_threshold = loop.slow_callback_duration
+    asyncio_logger.addHandler(collector)
+    loop.slow_callback_duration = SLOW_CALLBACK_SECONDS
+    loop.set_debug(True)
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        loop.set_debug(previous_debug)
+        loop.slow_callback_duration = previous_threshold
+        asyncio_logger.removeHandler(collector)
+
+    tasks = describe_tasks()
+    path = _output_path("asyncio", "txt")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"Tasks ({len(asyncio.all_tasks())}):\n")
+        f.write("\n".join(tasks))
+        f.write(f"\n\nSlow callbacks (> {SLOW_CALLBACK_SECONDS}s) in {seconds}s:\n")
+        f.write("\n".join(collector.records))
+
+    lines = [f"Görev sayısı: {len(asyncio.all_tasks())}"]
+    lines.extend(tasks[:PROFILE_TOP_N])
+    lines.append(f"\nYavaş callback (> {SLOW_CALLBACK_SECONDS * 1000:.0f} ms): {len(collector.records)}")
+    lines.extend(record[:200] for record in collector.records[:5])
+    return path, "\n".join(lines)
@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List
+
+from config import (RESIDENCY_IDLE_SECONDS, RESIDENCY_MEMORY_BUDGET_MB, RESIDENCY_SPILL_DIR, RESIDENCY_SWEEP_SECONDS,
+                    shard_path)
+from durability import atomic_replace, durable_writer
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Bellek bütçesi hesabında mesaj başına eklenen yaklaşık sözlük/nesne yükü (bayt)
+MESSAGE_OVERHEAD_BYTES = 600
+
+residency_events = metrics.counter("bot_residency_events_total", "Sohbet bellekten çıkarma/geri yükleme olayları")
+
+
+class ResidentStore(dict):
+    """Sohbet anahtarı -> mesaj listesi sözlüğü; yalnızca etkin sohbetler bellekte tutulur.
+
+    RESIDENCY_IDLE_SECONDS boyunca erişilmeyen sohbetler ve bellek bütçesi
+    aşıldığında en uzun süredir erişilmeyenler önce kendi dosyalarına
+    yazılır, sonra bellekten çıkarılır. Çıkarılmış bir anahtara `in`, `[]`
+    veya `get` ile erişildiğinde sohbet dosyasından sessizce geri yüklenir.
+    `values()`/`items()`/`len()` yalnızca bellekteki sohbetleri kapsar.
+    """
+
+    def __init__(self, name: str, spill_dir: str = None):
+        super().__init__()
+        self.name = name
+        self.spill_dir = os.path.join(spill_dir or shard_path(RESIDENCY_SPILL_DIR), name)
+        self.last_access: Dict[str, float] = {}
+        self.spilled: set = set()  # Dosyada olup bellekte olmayan anahtarlar
+        self.reloaded: set = set()  # Dosyasından geri yüklenip dosyası henüz silinmemiş anahtarlar
+        self.last_sweep = time.time()
+        os.makedirs(self.spill_dir, exist_ok=True)
+
+    def load(self, data: Dict[str, List[Dict[str, Any]]]):
+        """Ana dosyadaki sohbetleri bellekte, diğerlerini dosyada kabul eder."""
+        self.clear()
+        self.update(data)
+        now = time.time()
+        self.last_access = {key: now for key in data}
+        files = {name[:-len(".json")] for name in os.listdir(self.spill_dir) if name.endswith(".json")}
+        self.spilled = files - set(data)
+        self.reloaded = files & set(data)
+
+    def _spill_path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{key}.json")
+
+    def _reload(self, key: str) -> bool:
+        try:
+            with open(self._spill_path(key), 'r', encoding='utf-8') as f:
+                messages = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            logger.warning(f"Could not reload {self.name} chat {key}: {e}")
+            self.spilled.discard(key)
+            return False
+        # Yalnızca eklenen mesajlar için dosya silinmez, sohbet yeniden çıkarılınca
+        # üzerine yazılır; liste değiştirilirse (silme) dosyası da silinir
+        self.spilled.discard(key)
+        self.reloaded.add(key)
+        super().__setitem__(key, messages)
+        residency_events.inc(store=self.name, event="reload")
+        return True
+
+    def __contains__(self, key) -> bool:
+        if dict.__contains__(self, key):
+            return True
+        return key in self.spilled and self._reload(key)
+
+    def __missing__(self, key):
+        if key in self.spilled and self._reload(key):
+            return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.last_access[key] = time.time()
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __setitem__(self, key, value):
+        self.last_access[key] = time.time()
+        self.spilled.discard(key)
+        if key in self.reloaded:
+            # Eski içerik (ör. silinen kullanıcının mesajları) diskte kalmasın
+            self._remove_spill(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.last_access.pop(key, None)
+        self.spilled.discard(key)
+        self._remove_spill(key)
+
+    def _remove_spill(self, key: str):
+        self.reloaded.discard(key)
+        try:
+            os.remove(self._spill_path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, key: str):
+        """Sohbeti dosyasına (atomik olarak) yazar ve bellekten çıkarır."""
+        # Ana dosya sohbeti içermeyen haliyle fsync'lenmeden önce sohbet dosyası kalıcı olmalı
+        data = json.dumps(dict.__getitem__(self, key), ensure_ascii=False).encode('utf-8')
+        atomic_replace(self._spill_path(key), data, sync=durable_writer.mode != "none", backup=False)
+        super().__delitem__(key)
+        self.last_access.pop(key, None)
+        self.spilled.add(key)
+        self.reloaded.discard(key)
+        residency_events.inc(store=self.name, event="evict")
+
+    @staticmethod
+    def estimate_bytes(messages: List[Dict[str, Any]]) -> int:
+        return sum(len(msg['message']) + len(msg['username'] or "") + MESSAGE_OVERHEAD_BYTES for msg in messages)
+
+    def sweep(self, keep: str = None, force: bool = False) -> int:
+        """Boşta kalan ve bütçeyi aşan sohbetleri çıkarır; çıkarılan sayıyı döndürür.
+
+        En fazla RESIDENCY_SWEEP_SECONDS'da bir çalışır. `keep` o anda
+        yazılan sohbettir ve bütçe için çıkarılmaz.
+        """
+        now = time.time()
+        if not force and now - self.last_sweep < RESIDENCY_SWEEP_SECONDS:
+            return 0
+        self.last_sweep = now
+        # update() gibi yollarla eklenenlerin erişim zamanı yoksa şimdi sayılır
+        by_age = sorted(dict.keys(self), key=lambda key: self.last_access.setdefault(key, now))
+        evicted = 0
+        remaining = []
+        for key in by_age:
+            if key != keep and now - self.last_access[key] > RESIDENCY_IDLE_SECONDS:
+                self._evict(key)
+                evicted += 1
+            else:
+                remaining.append(key)
+
+        budget = RESIDENCY_MEMORY_BUDGET_MB * 1024 * 1024
+        sizes = {key: self.estimate_bytes(dict.__getitem__(self, key)) for key in remaining}
+        used = sum(sizes.values())
+        for key in remaining:
+            if used <= budget:
+                break
+            if key == keep:
+                continue
+            self._evict(key)
+            used -= sizes[key]
+            evicted += 1
+        if evicted:
+            logger.info(f"Evicted {evicted} {self.name} chats from memory ({len(self)} resident, {len(self.spilled)} on disk)")
+        return evicted
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "resident": len(self),
+            "spilled": len(self.spilled),
+            "total": len(self) + len(self.spilled),
+        }
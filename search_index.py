@@ -0,0 +1,308 @@
+import json
+import logging
+import math
+import os
+import re
+import time
+from array import array
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import SEARCH_MAX_MESSAGES, SEARCH_RESULTS, shard_path
+from metrics import metrics
+from turkish_text import tokenize
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX_FILE = "search_index.jsonl"
+
+# Harf indirgemesinden (ç -> c, ı -> i ...) sonraki biçimleriyle yaygın çekim ve iyelik ekleri.
+# En uzun ek önce denenir; kelimeden en fazla iki ek atılır ve kök en az MIN_STEM_LENGTH harf kalır.
+TURKISH_SUFFIXES = sorted({
+    "lar", "ler", "larin", "lerin", "lari", "leri", "lara", "lere", "larda", "lerde", "lardan", "lerden",
+    "da", "de", "ta", "te", "dan", "den", "tan", "ten", "nda", "nde", "ndan", "nden",
+    "daki", "deki", "taki", "teki", "ki",
+    "in", "un", "nin", "nun", "yin", "yun",
+    "i", "u", "a", "e", "yi", "yu", "ya", "ye", "na", "ne", "ni", "nu",
+    "im", "um", "imiz", "umuz", "iniz", "unuz", "si", "su", "sini", "sunu",
+    "la", "le", "yla", "yle", "ca", "ce", "dir", "dur", "tir", "tur",
+    "mis", "mus", "di", "du", "ti", "tu", "dim", "dum", "tim", "tum", "dik", "duk", "tik", "tuk", "yor", "iyor", "uyor", "acak", "ecek", "mak", "mek",
+}, key=len, reverse=True)
+MIN_STEM_LENGTH = 3
+
+# Dizinlenmeyen çok sık kelimeler (harf indirgenmiş)
+STOPWORDS = frozenset({
+    "ve", "veya", "ile", "bir", "bu", "su", "o", "da", "de", "mi", "mu", "ne", "icin", "ama", "gibi",
+    "ki", "ya", "cok", "daha", "en", "her", "hem", "ben", "sen", "biz", "siz", "onlar",
+})
+
+# BM25 parametreleri
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Özel isimlerden kesme işaretiyle ayrılan ekler (Hikmet'in, Ankara'daki) terim sayılmaz
+APOSTROPHE_SUFFIX_PATTERN = re.compile(r"['’]\w+")
+
+STEM_CACHE_SIZE = 100_000
+_stem_cache: Dict[str, str] = {}
+
+
+def stem(word: str) -> str:
+    """Harf indirgenmiş kelimeden yaygın Türkçe ekleri atar (kaba, sözlüksüz kökleme)."""
+    stemmed = _stem_cache.get(word)
+    if stemmed is None:
+        stemmed = word
+        for _ in range(2):
+            for suffix in TURKISH_SUFFIXES:
+                if stemmed.endswith(suffix) and len(stemmed) - len(suffix) >= MIN_STEM_LENGTH:
+                    stemmed = stemmed[:-len(suffix)]
+                    break
+            else:
+                break
+        if len(_stem_cache) >= STEM_CACHE_SIZE:
+            _stem_cache.clear()
+        _stem_cache[word] = stemmed
+    return stemmed
+
+
+def analyze(text: str) -> List[str]:
+    """Metni dizin terimlerine çevirir: Türkçe küçültme, harf indirgeme, durak kelime ve kökleme."""
+    if "'" in text or "’" in text:
+        text = APOSTROPHE_SUFFIX_PATTERN.sub("", text)
+    return [stem(word) for word in tokenize(text) if word not in STOPWORDS]
+
+
+class ChatIndex:
+    """Bir sohbetin ters dizini.
+
+    Belgeler artan kimliklerle eklenir; terim başına belge kimlikleri ve terim
+    sıklıkları sıkıştırılmış `array` olarak tutulur. Silinen belgeler yerinde
+    işaretlenir, dizin gerektiğinde kalan belgelerle yeniden kurulur.
+    """
+
+    def __init__(self):
+        self.base = 0  # İlk saklanan belgenin kimliği
+        self.documents: List[Optional[Tuple[float, int, str, bool, str]]] = []
+        self.lengths = array('H')
+        self.live_flags = array('B')  # Silinen belgelerde 0
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.alive = 0
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return self.alive
+
+    def add(self, document: Tuple[float, int, str, bool, str]):
+        """(zaman, user_id, kullanıcı adı, bot mu, mesaj) belgesini dizine ekler."""
+        doc_id = self.base + len(self.documents)
+        terms = Counter(analyze(document[4]))
+        self.documents.append(document)
+        length = min(sum(terms.values()), 0xFFFF)
+        self.lengths.append(length)
+        self.live_flags.append(1)
+        self.alive += 1
+        self.total_length += length
+        for term, frequency in terms.items():
+            entry = self.postings.get(term)
+            if entry is None:
+                entry = self.postings[term] = (array('I'), array('H'))
+            entry[0].append(doc_id)
+            entry[1].append(min(frequency, 0xFFFF))
+
+    def remove(self, user_id: Optional[int] = None):
+        """Kullanıcının (None ise herkesin) belgelerini siler."""
+        for index, document in enumerate(self.documents):
+            if document is not None and (user_id is None or document[1] == user_id):
+                self.documents[index] = None
+                self.live_flags[index] = 0
+                self.alive -= 1
+                self.total_length -= self.lengths[index]
+        if self.alive < len(self.documents) // 2:
+            self.rebuild()
+
+    def drop_oldest(self, count: int):
+        """En eski `count` belgeyi atar ve dizini yeniden kurar."""
+        self.rebuild(self.documents[count:], self.base + count)
+
+    def rebuild(self, documents: List[Optional[Tuple]] = None, base: int = None):
+        """Dizini yalnızca silinmemiş belgelerle yeniden kurar."""
+        documents = self.documents if documents is None else documents
+        base = self.base if base is None else base
+        self.__init__()
+        self.base = base
+        for document in documents:
+            if document is not None:
+                self.add(document)
+
+    def live_documents(self) -> List[Tuple[float, int, str, bool, str]]:
+        return [document for document in self.documents if document is not None]
+
+    def search(self, query: str, limit: int) -> List[Tuple[float, Tuple]]:
+        """BM25 ile sıralanmış (skor, belge) listesi döndürür."""
+        terms = set(analyze(query))
+        if not terms or not self.alive:
+            return []
+        count = len(self.documents)
+        lengths = np.frombuffer(self.lengths, dtype=np.uint16).astype(np.float32)
+        average_length = max(self.total_length / self.alive, 1.0)
+        scores = np.zeros(count, dtype=np.float32)
+        for term in terms:
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            # frombuffer görünümü hemen kopyalanır; açık görünüm array'in büyümesini engellerdi
+            indices = np.frombuffer(entry[0], dtype=np.uint32).astype(np.int64) - self.base
+            frequencies = np.frombuffer(entry[1], dtype=np.uint16).astype(np.float32)
+            document_frequency = len(indices)
+            idf = math.log(1.0 + (self.alive - document_frequency + 0.5) / (document_frequency + 0.5))
+            normalization = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths[indices] / average_length)
+            # Bir terimin listesinde belge kimlikleri tekildir; doğrudan indeksle toplanabilir
+            scores[indices] += idf * frequencies * (BM25_K1 + 1.0) / (frequencies + normalization)
+
+        if self.alive < count:
+            scores *= np.frombuffer(self.live_flags, dtype=np.uint8)
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        if len(matched) > limit:
+            matched = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+        # Eşit skorda yeni mesaj önce gelir
+        ranked = sorted(matched, key=lambda index: (-scores[index], -index))
+        return [(float(scores[index]), self.documents[index]) for index in ranked]
+
+
+class SearchIndex:
+    """Sohbet geçmişinde tam metin araması.
+
+    GroupMemory'ye dinleyici olarak bağlanır ve her mesajı sohbetin ters
+    dizinine ekler. Sıcak hafızadan (MAX_GROUP_MESSAGES) düşen mesajlar
+    aranabilir kalır; sohbet başına SEARCH_MAX_MESSAGES aşılınca en eskiler
+    atılır. Mesajlar ek-yalnızca, satır başına kısa bir JSON dizisi olarak
+    saklanır; dizin yüklemede yeniden kurulur.
+    """
+
+    def __init__(self, index_file: str = None):
+        self.index_file = index_file or shard_path(SEARCH_INDEX_FILE)
+        self.chats: Dict[int, ChatIndex] = {}
+        self._load()
+
+    def _chat(self, chat_id: int) -> ChatIndex:
+        index = self.chats.get(chat_id)
+        if index is None:
+            index = self.chats[chat_id] = ChatIndex()
+        return index
+
+    def _load(self):
+        """Kayıt dosyasını okuyup dizinleri kurar; silinmiş kayıt çoksa dosyayı sıkıştırır."""
+        if not os.path.exists(self.index_file):
+            return
+        started = time.perf_counter()
+        lines = 0
+        with open(self.index_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Yarım yazılmış son satır
+                lines += 1
+                if entry[0] == "a":
+                    self._add(entry[1], tuple(entry[2:]))
+                elif entry[0] == "c" and entry[1] in self.chats:
+                    self._remove(entry[1], entry[2])
+        live = sum(len(index) for index in self.chats.values())
+        if lines > live * 1.5:
+            self._rewrite()
+        logger.info(f"Search index loaded: {live} messages in {len(self.chats)} chats ({time.perf_counter() - started:.2f}s)")
+
+    def _append(self, entry: List[Any]):
+        with metrics.timer("persistence"):
+            with open(self.index_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _rewrite(self):
+        """Dosyayı yalnızca dizindeki mesajlarla yeniden yazar."""
+        temporary = f"{self.index_file}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            for chat_id, index in self.chats.items():
+                for document in index.live_documents():
+                    f.write(json.dumps(["a", chat_id, *document], ensure_ascii=False) + "\n")
+        os.replace(temporary, self.index_file)
+
+    def _add(self, chat_id: int, document: Tuple[float, int, str, bool, str]):
+        index = self._chat(chat_id)
+        index.add(document)
+        # Her mesajda yeniden kurmamak için sınırın %10 fazlası birikince toplu atılır
+        if len(index.documents) > SEARCH_MAX_MESSAGES * 1.1:
+            index.drop_oldest(len(index.documents) - SEARCH_MAX_MESSAGES)
+
+    def _remove(self, chat_id: int, user_id: Optional[int]):
+        """Kullanıcının (None ise herkesin) belgelerini siler; boşalan sohbetin dizini atılır."""
+        index = self.chats[chat_id]
+        index.remove(user_id)
+        if not len(index):
+            del self.chats[chat_id]
+
+    @staticmethod
+    def _document(record: Dict[str, Any]) -> Tuple[float, int, str, bool, str]:
+        return (record["timestamp"], record["user_id"], record["username"], record.get("message_type") == "bot", record["message"] or "")
+
+    def attach(self, memory):
+        """GroupMemory'ye dinleyici olarak bağlanır; dizin boşsa sıcak hafızadaki mesajları bir kez ekler."""
+        if self in memory.listeners:
+            return
+        memory.add_listener(self)
+        if self.chats:
+            return
+        for messages_by_chat in (memory.group_messages, memory.private_messages):
+            for chat_key, messages in messages_by_chat.items():
+                for message in messages:
+                    self._add(int(chat_key), self._document(message))
+        if self.chats:
+            self._rewrite()
+            logger.info(f"Search index backfilled from group memory: {self.get_stats()['messages']} messages")
+
+    def on_message_added(self, chat_id: int, record: Dict[str, Any]):
+        """GroupMemory dinleyicisi: mesajı dizine ekler."""
+        document = self._document(record)
+        self._add(chat_id, document)
+        self._append(["a", chat_id, *document])
+
+    def on_messages_cleared(self, chat_id: int, user_id: Optional[int] = None):
+        """GroupMemory dinleyicisi: sohbetin veya kullanıcının mesajlarını dizinden siler."""
+        if chat_id not in self.chats:
+            return
+        self._remove(chat_id, user_id)
+        self._append(["c", chat_id, user_id])
+
+    def on_messages_replaced(self, chat_id: int, records: List[Dict[str, Any]]):
+        """GroupMemory dinleyicisi: sohbetin dizinini verilen (kronolojik) mesajlarla toplu yeniden kurar."""
+        self.chats.pop(chat_id, None)
+        for record in records[-SEARCH_MAX_MESSAGES:]:
+            self._add(chat_id, self._document(record))
+        self._rewrite()
+
+    def search(self, chat_id: int, query: str, limit: int = SEARCH_RESULTS) -> List[Dict[str, Any]]:
+        """Sorgu terimleriyle en ilgili mesajları skor sırasıyla döndürür."""
+        index = self.chats.get(chat_id)
+        if index is None:
+            return []
+        with metrics.timer("search"):
+            ranked = index.search(query, limit)
+        return [
+            {"timestamp": timestamp, "user_id": user_id, "username": username,
+             "message_type": "bot" if is_bot else "user", "message": message, "score": score}
+            for score, (timestamp, user_id, username, is_bot, message) in ranked
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "chats": len(self.chats),
+            "messages": sum(len(index) for index in self.chats.values()),
+            "terms": sum(len(index.postings) for index in self.chats.values()),
+        }
+
+
+# Global search index instance
+search_index = SearchIndex()
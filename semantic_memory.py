@@ -0,0 +1,392 @@
+import atexit
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import (SEMANTIC_DIM, SEMANTIC_FLUSH_MESSAGES, SEMANTIC_FLUSH_SECONDS, SEMANTIC_MAX_MESSAGES,
+                    SEMANTIC_MIN_SCORE, SEMANTIC_NGRAM_RANGE, SEMANTIC_PROMPT_CHARS, SEMANTIC_TOP_K, shard_path)
+from metrics import metrics
+from turkish_text import tokenize
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_MEMORY_FILE = "semantic_memory.jsonl"
+VECTORS_SUFFIX = ".vec"
+
+# Vektör dosyası: başlık (magic, özetleme sürümü, boyut, n-gram aralığı) + float32 satırlar.
+# Satırlar kayıt dosyasındaki mesaj satırlarıyla (silme işaretleri hariç) birebir sıralıdır.
+VECTORS_MAGIC = b"KVEC"
+VECTORS_HEADER = struct.Struct("<4sHHHH")
+HASH_VERSION = 1
+
+# Vektörde saklanmayan, yalnızca prompt'a yazılan mesaj alanları
+RECORD_FIELDS = ("user_id", "username", "message", "message_type", "timestamp")
+
+
+class HashedNgramEmbedder:
+    """Ağ gerektirmeyen, karakter n-gram özetleme (hashing trick) tabanlı vektörleştirici.
+
+    Kelimeler normalleştirilip " kelime " biçiminde n-gramlara bölünür, her
+    n-gram işaretli olarak `dim` boyutlu vektörün bir hücresine eklenir.
+    Terim sıklığı logaritmik ölçeklenir ve vektör L2 ile normalleştirilir.
+    Doküman sıklıkları (IDF) sorgu tarafında ağırlık olarak kullanılır.
+
+    Python'un str hash'i süreç başına rastgele olduğundan n-gram'lar CRC32
+    ile özetlenir; aynı metin her süreçte aynı vektörü verir ve vektörler
+    diske yazılıp yeniden başlatmada tekrar hesaplanmadan okunabilir.
+    """
+
+    def __init__(self, dim: int = SEMANTIC_DIM, ngram_range=SEMANTIC_NGRAM_RANGE, cache_size: int = 100_000):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.document_frequency = np.zeros(dim, dtype=np.float64)
+        self.documents = 0
+        # Sohbetlerde kelimeler çok tekrar eder; kelime başına n-gram katkıları saklanır
+        self.cache_size = cache_size
+        self.word_features: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def _word_features(self, word: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Kelimenin n-gram hücre indekslerini ve işaretlerini döndürür."""
+        features = self.word_features.get(word)
+        if features is None:
+            dim = self.dim
+            low, high = self.ngram_range
+            padded = f" {word} "
+            hashes = [zlib.crc32(padded[start:start + size].encode('utf-8'))
+                      for size in range(low, high + 1) for start in range(len(padded) - size + 1)]
+            features = (
+                np.fromiter((hashed % dim for hashed in hashes), dtype=np.int64, count=len(hashes)),
+                np.fromiter((1.0 if hashed & 1 << 20 else -1.0 for hashed in hashes), dtype=np.float64, count=len(hashes)),
+            )
+            if len(self.word_features) >= self.cache_size:
+                self.word_features.clear()
+            self.word_features[word] = features
+        return features
+
+    def signature(self) -> bytes:
+        """Vektör dosyası başlığı; ayarlar değişince dosyadaki vektörler kullanılmaz."""
+        return VECTORS_HEADER.pack(VECTORS_MAGIC, HASH_VERSION, self.dim, *self.ngram_range)
+
+    def embed(self, text: str) -> np.ndarray:
+        """Metnin normalleştirilmiş vektörünü döndürür."""
+        words = tokenize(text)
+        if not words:
+            return np.zeros(self.dim, dtype=np.float32)
+        features = [self._word_features(word) for word in words]
+        counts = np.bincount(
+            np.concatenate([indices for indices, _ in features]),
+            weights=np.concatenate([signs for _, signs in features]),
+            minlength=self.dim,
+        )
+        # Alt doğrusal terim sıklığı: sign(tf) * (1 + log|tf|); çakışıp sıfırlanan hücreler sıfır kalır
+        magnitudes = np.abs(counts)
+        vector = (np.sign(counts) * (1.0 + np.log(magnitudes, out=np.zeros_like(magnitudes), where=magnitudes > 0))).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+    def observe(self, vector: np.ndarray, amount: int = 1):
+        """Doküman sıklıklarını günceller (silmede negatif `amount`)."""
+        self.document_frequency += amount * (vector != 0)
+        self.documents = max(0, self.documents + amount)
+
+    def query_weights(self) -> np.ndarray:
+        """Sorgu vektörüne uygulanacak düzgünleştirilmiş IDF ağırlıkları."""
+        return np.log((1.0 + self.documents) / (1.0 + self.document_frequency)).astype(np.float32) + 1.0
+
+
+class ChatVectors:
+    """Bir sohbetin mesaj vektörleri: kapasitesi 1.5 katına çıkarak büyüyen
+    matris, zaman damgası dizisi ve mesaj kayıtları."""
+
+    def __init__(self, dim: int, capacity: int = 256):
+        self.matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.records: List[Dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _resize(self, capacity: int, rows: np.ndarray):
+        matrix = np.zeros((capacity, self.matrix.shape[1]), dtype=np.float32)
+        timestamps = np.zeros(capacity, dtype=np.float64)
+        matrix[:len(rows)] = self.matrix[rows]
+        timestamps[:len(rows)] = self.timestamps[rows]
+        self.matrix, self.timestamps = matrix, timestamps
+
+    def append(self, vector: np.ndarray, record: Dict[str, Any]):
+        count = len(self.records)
+        if count == len(self.matrix):
+            self._resize(count + count // 2, np.arange(count))
+        self.matrix[count] = vector
+        self.timestamps[count] = record["timestamp"]
+        self.records.append(record)
+
+    def keep(self, mask: np.ndarray):
+        """Maskede True olan satırları tutar, diğerlerini siler."""
+        rows = np.flatnonzero(mask)
+        self._resize(max(256, len(rows) + len(rows) // 4), rows)
+        self.records = [self.records[row] for row in rows]
+
+
+class SemanticMemory:
+    """Sohbet geçmişinde yerel vektör araması.
+
+    GroupMemory'ye dinleyici olarak bağlanır; her yeni mesaj vektörleştirilip
+    sohbetin matrisine eklenir. Sıcak hafızadan (MAX_GROUP_MESSAGES) düşen
+    mesajlar burada aranabilir kalır. Kayıtlar ek-yalnızca JSONL dosyasına,
+    vektörleri yanındaki `.vec` dosyasına SEMANTIC_FLUSH_MESSAGES'lık
+    gruplar halinde eklenir; çökmede en fazla son grup kaybolur (mesajlar
+    GroupMemory'de kalır). Silmeler dosyaya işaret kaydı olarak hemen
+    eklenir ve yüklemede uygulanır.
+    """
+
+    def __init__(self, memory_file: str = None, embedder: HashedNgramEmbedder = None):
+        self.memory_file = memory_file or shard_path(SEMANTIC_MEMORY_FILE)
+        self.vectors_file = os.path.splitext(self.memory_file)[0] + VECTORS_SUFFIX
+        self.embedder = embedder or HashedNgramEmbedder()
+        self.chats: Dict[int, ChatVectors] = {}
+        self.pending_lines: List[str] = []  # Henüz diske eklenmemiş kayıt satırları
+        self.pending_vectors: List[np.ndarray] = []  # ...ve mesaj satırlarının vektörleri
+        self.last_flush = time.monotonic()
+        self._load()
+        atexit.register(self.flush)
+
+    def _read_vectors(self, expected: int) -> Optional[np.ndarray]:
+        """Kayıtlı vektörleri okur; dosya yoksa, ayarlar değiştiyse veya satır sayısı tutmuyorsa None."""
+        try:
+            with open(self.vectors_file, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        signature = self.embedder.signature()
+        if not data.startswith(signature):
+            return None
+        row_bytes = self.embedder.dim * 4
+        if (len(data) - len(signature)) != expected * row_bytes:
+            return None  # Kayıt ve vektör eklemeleri arasında kesilmiş
+        return np.frombuffer(data, dtype=np.float32, offset=len(signature)).reshape(expected, self.embedder.dim)
+
+    def _load(self):
+        """Kayıtları dosyadan okur; vektörler `.vec` dosyasından alınır, geçersizse yeniden hesaplanır."""
+        if not os.path.exists(self.memory_file):
+            return
+        started = time.perf_counter()
+        entries, clears, rows = [], 0, 0
+        with open(self.memory_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Yarım yazılmış son satır
+                if entry.get("op") == "clear":
+                    clears += 1
+                    entries = [item for item in entries if not self._matches_clear(item[0], entry)]
+                else:
+                    entries.append((entry, rows))
+                    rows += 1
+
+        stored = self._read_vectors(rows)
+        for entry, row in entries:
+            chat_id = entry.pop("chat_id")
+            self._add(chat_id, entry, stored[row] if stored is not None else None)
+        self._trim_all()
+        # Silinmiş veya sınırdan düşmüş kayıtlar çoksa dosyayı temizle, vektör dosyası geçersizse yeniden yaz
+        live = sum(len(vectors) for vectors in self.chats.values())
+        if clears or rows > live * 1.5 or (stored is None and entries):
+            self._rewrite()
+        logger.info(f"Semantic memory loaded: {live} messages in {len(self.chats)} chats"
+                    f"{'' if stored is not None else ' (re-embedded)'} ({time.perf_counter() - started:.2f}s)")
+
+    @staticmethod
+    def _matches_clear(entry: Dict[str, Any], clear: Dict[str, Any]) -> bool:
+        return entry["chat_id"] == clear["chat_id"] and clear.get("user_id") in (None, entry["user_id"])
+
+    def _append(self, entry: Dict[str, Any], vector: np.ndarray = None):
+        """Kaydı yazma kuyruğuna ekler; kuyruk dolunca veya süre geçince diske yazılır."""
+        self.pending_lines.append(json.dumps(entry, ensure_ascii=False) + "\n")
+        if vector is not None:
+            self.pending_vectors.append(vector)
+        if len(self.pending_lines) >= SEMANTIC_FLUSH_MESSAGES or time.monotonic() - self.last_flush >= SEMANTIC_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        """Kuyruktaki kayıtları ve vektörleri dosyalarının sonuna tek seferde ekler."""
+        self.last_flush = time.monotonic()
+        if not self.pending_lines:
+            return
+        with metrics.timer("persistence"):
+            if self.pending_vectors:
+                with open(self.vectors_file, 'ab') as f:
+                    if not f.tell():
+                        f.write(self.embedder.signature())
+                    f.write(np.stack(self.pending_vectors).astype(np.float32).tobytes())
+            with open(self.memory_file, 'a', encoding='utf-8') as f:
+                f.write("".join(self.pending_lines))
+        self.pending_lines, self.pending_vectors = [], []
+
+    def _rewrite(self):
+        """Dosyaları yalnızca bellekteki kayıt ve vektörlerle yeniden yazar (kuyruk da bunlara dahildir)."""
+        temporary = f"{self.memory_file}.tmp"
+        vectors_temporary = f"{self.vectors_file}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f, open(vectors_temporary, 'wb') as vectors_f:
+            vectors_f.write(self.embedder.signature())
+            for chat_id, vectors in self.chats.items():
+                for record in vectors.records:
+                    f.write(json.dumps({"chat_id": chat_id, **record}, ensure_ascii=False) + "\n")
+                vectors_f.write(vectors.matrix[:len(vectors)].tobytes())
+        os.replace(vectors_temporary, self.vectors_file)
+        os.replace(temporary, self.memory_file)
+        self.pending_lines, self.pending_vectors = [], []
+        self.last_flush = time.monotonic()
+
+    def _add(self, chat_id: int, record: Dict[str, Any], vector: np.ndarray = None) -> np.ndarray:
+        vectors = self.chats.get(chat_id)
+        if vectors is None:
+            vectors = self.chats[chat_id] = ChatVectors(self.embedder.dim)
+        if vector is None:
+            vector = self.embedder.embed(record["message"] or "")
+        vectors.append(vector, record)
+        self.embedder.observe(vector)
+        return vector
+
+    def _trim(self, chat_id: int):
+        """Sohbet SEMANTIC_MAX_MESSAGES sınırını aştıysa en eski mesajları düşürür."""
+        vectors = self.chats[chat_id]
+        excess = len(vectors) - SEMANTIC_MAX_MESSAGES
+        if excess <= 0:
+            return
+        # Her mesajda kopyalamamak için sınırın %10 fazlası birikince toplu düşürülür
+        excess = len(vectors) - int(SEMANTIC_MAX_MESSAGES * 0.9)
+        for index in range(excess):
+            self.embedder.observe(vectors.matrix[index], -1)
+        mask = np.ones(len(vectors), dtype=bool)
+        mask[:excess] = False
+        vectors.keep(mask)
+
+    def _trim_all(self):
+        for chat_id in list(self.chats):
+            if len(self.chats[chat_id]) > SEMANTIC_MAX_MESSAGES:
+                self._trim(chat_id)
+
+    def attach(self, memory):
+        """GroupMemory'ye dinleyici olarak bağlanır.
+
+        Anlamsal hafıza boşsa (ilk kurulum) sıcak hafızadaki mesajlar bir kez
+        dizine eklenir ve dosyaya yazılır.
+        """
+        if self in memory.listeners:
+            return
+        memory.add_listener(self)
+        if self.chats:
+            return
+        for messages_by_chat in (memory.group_messages, memory.private_messages):
+            for chat_key, messages in messages_by_chat.items():
+                for message in messages:
+                    self._add(int(chat_key), {field: message.get(field) for field in RECORD_FIELDS})
+        if self.chats:
+            self._trim_all()
+            self._rewrite()
+            logger.info(f"Semantic memory backfilled from group memory: {self.get_stats()['messages']} messages")
+
+    def on_message_added(self, chat_id: int, record: Dict[str, Any]):
+        """GroupMemory dinleyicisi: yeni mesajı vektörleştirip ekler."""
+        entry = {field: record.get(field) for field in RECORD_FIELDS}
+        vector = self._add(chat_id, entry)
+        self._append({"chat_id": chat_id, **entry}, vector)
+        if len(self.chats[chat_id]) > SEMANTIC_MAX_MESSAGES * 1.1:
+            self._trim(chat_id)
+
+    def on_messages_cleared(self, chat_id: int, user_id: Optional[int] = None):
+        """GroupMemory dinleyicisi: sohbetin veya kullanıcının mesajlarını siler."""
+        vectors = self.chats.get(chat_id)
+        if vectors is None:
+            return
+        if user_id is None:
+            mask = np.zeros(len(vectors), dtype=bool)
+        else:
+            mask = np.fromiter((record["user_id"] != user_id for record in vectors.records), dtype=bool, count=len(vectors))
+        for index in np.flatnonzero(~mask):
+            self.embedder.observe(vectors.matrix[index], -1)
+        if mask.any():
+            vectors.keep(mask)
+        else:
+            del self.chats[chat_id]
+        # Silme beklemeden diske yazılır
+        self._append({"op": "clear", "chat_id": chat_id, "user_id": user_id})
+        self.flush()
+
+    def on_messages_replaced(self, chat_id: int, records: List[Dict[str, Any]]):
+        """GroupMemory dinleyicisi: sohbeti verilen (kronolojik) mesajlarla toplu yeniden kurar."""
+        vectors = self.chats.pop(chat_id, None)
+        if vectors is not None:
+            for index in range(len(vectors)):
+                self.embedder.observe(vectors.matrix[index], -1)
+        for record in records[-SEMANTIC_MAX_MESSAGES:]:
+            self._add(chat_id, {field: record.get(field) for field in RECORD_FIELDS})
+        self._rewrite()
+
+    def search(self, chat_id: int, query: str, k: int = SEMANTIC_TOP_K, before: float = None, min_score: float = SEMANTIC_MIN_SCORE) -> List[Dict[str, Any]]:
+        """Sorguya en benzer k mesajı skorlarıyla döndürür.
+
+        `before` verilirse yalnızca bu zamandan önceki mesajlar aranır (prompt'ta
+        zaten bulunan son konuşmayı tekrar getirmemek için).
+        """
+        vectors = self.chats.get(chat_id)
+        if vectors is None or not len(vectors):
+            return []
+        query_vector = self.embedder.embed(query) * self.embedder.query_weights()
+        norm = np.linalg.norm(query_vector)
+        if not norm:
+            return []
+        query_vector /= norm
+
+        count = len(vectors)
+        if before is not None:
+            # Kayıtlar zaman sıralı; sınırdan önceki son satır ikili aramayla bulunur
+            count = int(np.searchsorted(vectors.timestamps[:count], before, side="left"))
+            if count == 0:
+                return []
+        scores = vectors.matrix[:count] @ query_vector
+        k = min(k, count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {**vectors.records[index], "score": float(scores[index])}
+            for index in top if scores[index] >= min_score
+        ]
+
+    def prompt_context(self, chat_id: int, query: str, before: float = None, budget: int = SEMANTIC_PROMPT_CHARS) -> str:
+        """En ilgili eski mesajları karakter bütçesi içinde, kronolojik sırayla prompt metnine çevirir."""
+        with metrics.timer("semantic_search"):
+            results = self.search(chat_id, query, before=before)
+        lines, used = [], 0
+        for result in results:
+            speaker = "Bot" if result.get("message_type") == "bot" else result["username"]
+            line = f"- {speaker}: {result['message']}"
+            if used + len(line) > budget:
+                continue
+            lines.append((result["timestamp"], line))
+            used += len(line)
+        if not lines:
+            return ""
+        return "\n\nİlgili eski mesajlar:\n" + "\n".join(line for _, line in sorted(lines)) + "\n"
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = sum(len(vectors) for vectors in self.chats.values())
+        return {
+            "chats": len(self.chats),
+            "messages": total,
+            "matrix_bytes": sum(vectors.matrix.nbytes for vectors in self.chats.values()),
+        }
+
+
+# Global semantic memory instance
+semantic_memory = SemanticMemory()
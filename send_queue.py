@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+
+from telegram import Message
+from telegram.error import RetryAfter, TelegramError
+
+from config import (
+    MAX_MESSAGE_LENGTH,
+    SEND_CHAT_BURST,
+    SEND_GLOBAL_RATE,
+    SEND_GROUP_CHAT_RATE,
+    SEND_MERGE_MAX_LENGTH,
+    SEND_PRIVATE_CHAT_RATE,
+)
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Bu sayıdan fazla sohbet durumu birikirse boşta olanlar temizlenir
+MAX_IDLE_CHAT_STATES = 1000
+
+
+class TokenBucket:
+    """Saniyede `rate` token üreten, en fazla `capacity` token biriktiren kova."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Bir token için beklenmesi gereken süreyi döndürür (0 ise hemen alınabilir)."""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        """Bir token harcar. Önce `delay()` ile kontrol edilmelidir."""
+        self.tokens -= 1
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class _ChatState:
+    """Tek bir sohbetin kovası, bekleyen mesajları ve duraklatma süresi."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.bucket = TokenBucket(rate, capacity)
+        self.queue: Deque[Dict] = deque()
+        self.paused_until = 0.0
+        self.drain_task: Optional[asyncio.Task] = None
+        self.bot = None
+
+    def is_idle(self) -> bool:
+        return not self.queue and self.drain_task is None and self.bucket.is_full()
+
+
+class OutboundDispatcher:
+    """Telegram flood limitlerine uyan giden mesaj dağıtıcısı.
+
+    Limitlerin altındayken mesaj doğrudan gönderilir. Sohbetin veya genel
+    kovanın tokenı yoksa, ya da Telegram `retry_after` ile beklememizi
+    istediyse mesaj sohbetin kuyruğuna alınır ve arka planda gönderilir.
+    Kuyrukta art arda bekleyen kısa mesajlar tek mesajda birleştirilir.
+    """
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(SEND_GLOBAL_RATE, SEND_GLOBAL_RATE)
+        self.chats: Dict[int, _ChatState] = {}
+
+    def _get_state(self, chat_id: int, is_group: bool) -> _ChatState:
+        state = self.chats.get(chat_id)
+        if state is None:
+            if len(self.chats) >= MAX_IDLE_CHAT_STATES:
+                self._prune()
+            rate = SEND_GROUP_CHAT_RATE if is_group else SEND_PRIVATE_CHAT_RATE
+            state = _ChatState(rate, SEND_CHAT_BURST)
+            self.chats[chat_id] = state
+        return state
+
+    def _prune(self):
+        """Boşta olan sohbet durumlarını siler (dolu kova yeni kovayla aynıdır)."""
+        for chat_id in [chat_id for chat_id, state in self.chats.items() if state.is_idle()]:
+            del self.chats[chat_id]
+
+    def _wait_time(self, state: _ChatState) -> float:
+        paused = state.paused_until - time.monotonic()
+        return max(paused, state.bucket.delay(), self.global_bucket.delay())
+
+    def queue_depth(self) -> int:
+        """Kuyrukta bekleyen toplam mesaj sayısını döndürür."""
+        return sum(len(state.queue) for state in self.chats.values())
+
+    async def send(self, bot, chat_id: int, text: str, reply_to_message_id: int = None, is_group: bool = False,
+                   on_sent: Callable[[], None] = None) -> Optional[Message]:
+        """Mesajı gönderir; kuyruğa alındıysa None döndürür.
+
+        `on_sent` mesaj Telegram'a gerçekten ulaştığında çağrılır: doğrudan
+        gönderimde hemen, kuyruktaysa arka plandaki gönderimden sonra.
+        """
+        state = self._get_state(chat_id, is_group)
+
+        # Hızlı yol: kuyruk boş ve limitlerin altındaysak doğrudan gönder
+        if not state.queue and self._wait_time(state) == 0:
+            state.bucket.consume()
+            self.global_bucket.consume()
+            try:
+                with metrics.timer("send"):
+                    sent = await bot.send_message(chat_id=chat_id, text=text, reply_to_message_id=reply_to_message_id)
+                if on_sent is not None:
+                    on_sent()
+                return sent
+            except RetryAfter as e:
+                self._pause(chat_id, state, e)
+
+        state.queue.append({"text": text, "reply_to_message_id": reply_to_message_id,
+                            "on_sent": [on_sent] if on_sent is not None else []})
+        state.bot = bot
+        if state.drain_task is None:
+            state.drain_task = asyncio.create_task(self._drain(chat_id, state))
+        return None
+
+    def _pause(self, chat_id: int, state: _ChatState, error: RetryAfter):
+        retry_after = float(error.retry_after)
+        state.paused_until = time.monotonic() + retry_after
+        logger.warning(f"Flood limit hit for chat {chat_id}, retrying after {retry_after}s")
+
+    def _pop_merged(self, queue: Deque[Dict]) -> Dict:
+        """Kuyruğun başındaki mesajı, arkasından gelen kısa mesajlarla birleştirerek çıkarır.
+
+        Başka bir mesaja yanıt olan mesajlar yalnızca aynı mesaja yanıt
+        olanlarla ya da yanıtsız olanlarla birleştirilir; aksi halde
+        yanıtlar yanlış mesajın altına düşerdi.
+        """
+        pending = queue.popleft()
+        if len(pending["text"]) > SEND_MERGE_MAX_LENGTH:
+            return pending
+
+        text = pending["text"]
+        on_sent = list(pending["on_sent"])
+        while queue:
+            next_text = queue[0]["text"]
+            reply_to = queue[0]["reply_to_message_id"]
+            if reply_to is not None and reply_to != pending["reply_to_message_id"]:
+                break
+            if len(next_text) > SEND_MERGE_MAX_LENGTH or len(text) + len(next_text) + 2 > MAX_MESSAGE_LENGTH:
+                break
+            text = f"{text}\n\n{next_text}"
+            on_sent.extend(queue.popleft()["on_sent"])
+        return {"text": text, "reply_to_message_id": pending["reply_to_message_id"], "on_sent": on_sent}
+
+    async def _drain(self, chat_id: int, state: _ChatState):
+        """Sohbet kuyruğunu limitlere uyarak boşaltır."""
+        try:
+            while state.queue:
+                wait = self._wait_time(state)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+
+                state.bucket.consume()
+                self.global_bucket.consume()
+                pending = self._pop_merged(state.queue)
+                try:
+                    with metrics.timer("send"):
+                        await state.bot.send_message(
+                            chat_id=chat_id,
+                            text=pending["text"],
+                            reply_to_message_id=pending["reply_to_message_id"],
+                        )
+                    for callback in pending["on_sent"]:
+                        callback()
+                except RetryAfter as e:
+                    state.queue.appendleft(pending)
+                    self._pause(chat_id, state, e)
+                except TelegramError as e:
+                    logger.error(f"Queued message to chat {chat_id} could not be sent: {e}")
+        finally:
+            state.drain_task = None
+            state.bot = None
@@ -0,0 +1,383 @@
+"""Depo dosyaları için takılabilir serileştiriciler ve biçim dönüştürücü.
+
+`GroupMemory` ve `UserPreferences` dosyalarını STORAGE_FORMAT'a göre JSON
+(dışa/içe aktarma için okunabilir biçim) ya da sürümlü ikili anlık görüntü
+olarak yazar. İkili biçim:
+
+    başlık:  SNAPSHOT_HEADER (magic, sürüm, tür, kayıt sayısı, yük uzunluğu, CRC32)
+    yük:     eleman sayısı önekli sayısal sütunlar, metin uzunlukları ve tek
+             UTF-8 metin bloğu
+    mesajlar: sohbet başına mesaj sayıları, user_id, timestamp, tür/bayrak ve
+              sözlükle kodlanmış kullanıcı adı sütunları
+    tercihler: chat_id, user_id, created_by, last_updated, bayrak ve sözlükle
+               kodlanmış tercih çiftleri sütunları
+
+Mesajlardaki `datetime` alanı `timestamp`'ten türetildiği için ikili biçimde
+saklanmaz; JSON'a yazılırken yeniden üretilir.
+
+Dönüştürücü (biçim dosya uzantısından anlaşılır):
+    python serializers.py group_messages.json group_messages.snap
+    python serializers.py user_preferences.snap user_preferences.json
+"""
+import argparse
+import gc
+import json
+import os
+import struct
+import sys
+import zlib
+from array import array
+from datetime import datetime
+from itertools import accumulate
+from typing import Any, Dict, List, Tuple
+
+from durability import BACKUP_SUFFIX, atomic_replace, durable_writer, read_with_recovery
+
+SNAPSHOT_MAGIC = b"KSNP"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<4sHBxIQI")
+
+# Depo türleri
+MESSAGES = "messages"  # sohbet anahtarı -> mesaj listesi
+PREFERENCES = "preferences"  # tercih anahtarı -> kullanıcı kaydı
+KIND_CODES = {MESSAGES: 1, PREFERENCES: 2}
+
+MESSAGE_FIELDS = ("user_id", "username", "message", "message_type", "timestamp", "datetime")
+MESSAGE_TYPE_CODES = {"user": 0, "bot": 1}
+MESSAGE_TYPE_NAMES = {code: name for name, code in MESSAGE_TYPE_CODES.items()}
+OTHER_TYPE = 2  # Türü `extra` içinde saklanır
+NO_TYPE = 3  # Eski kayıtlarda `message_type` alanı yok
+USERNAME_NONE = 0x80  # Tür/bayrak baytında: kullanıcı adı None
+
+PREFERENCE_FIELDS = ("chat_id", "user_id", "username", "preferences", "consent_given", "last_updated", "created_by")
+CONSENT_GIVEN = 0x01
+HAS_CREATED_BY = 0x02
+
+
+class SnapshotError(ValueError):
+    """İkili anlık görüntü bozuk veya desteklenmeyen sürümde."""
+
+
+def _message_datetime(message: Dict[str, Any]) -> Dict[str, Any]:
+    if "datetime" in message:
+        return message
+    return {**message, "datetime": datetime.fromtimestamp(message["timestamp"]).isoformat()}
+
+
+class JsonSerializer:
+    """Bugüne kadarki okunabilir JSON biçimi (indent=4)."""
+
+    name = "json"
+    extension = ".json"
+
+    def dumps(self, data: Dict[str, Any], kind: str) -> bytes:
+        if kind == MESSAGES:
+            data = {key: [_message_datetime(message) for message in messages] for key, messages in data.items()}
+        return json.dumps(data, ensure_ascii=False, indent=4).encode('utf-8')
+
+    def loads(self, raw: bytes, kind: str) -> Dict[str, Any]:
+        return json.loads(raw.decode('utf-8'))
+
+
+class BinarySerializer:
+    """Başlıklı, CRC32 sağlamalı, sürümlü ikili anlık görüntü.
+
+    Kayıtlar sütunlara ayrılır: sayılar `array` olarak ham baytlarla, tüm
+    metinler karakter uzunluklarıyla birlikte tek bir UTF-8 bloğunda
+    yazılır. Tekrarlanan metinler (kullanıcı adları, tercih değerleri) bir
+    kez saklanır. Nadir ek alanlar kompakt JSON olarak ayrı tutulur.
+    """
+
+    name = "binary"
+    extension = ".snap"
+
+    def dumps(self, data: Dict[str, Any], kind: str) -> bytes:
+        payload = self._dump_messages(data) if kind == MESSAGES else self._dump_preferences(data)
+        header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, KIND_CODES[kind], len(data), len(payload), zlib.crc32(payload))
+        return header + payload
+
+    def loads(self, raw: bytes, kind: str) -> Dict[str, Any]:
+        if len(raw) < SNAPSHOT_HEADER.size:
+            raise SnapshotError("snapshot is truncated")
+        magic, version, kind_code, count, length, checksum = SNAPSHOT_HEADER.unpack_from(raw)
+        if magic != SNAPSHOT_MAGIC:
+            raise SnapshotError("not a snapshot file")
+        if version > SNAPSHOT_VERSION:
+            raise SnapshotError(f"unsupported snapshot version {version}")
+        if kind_code != KIND_CODES[kind]:
+            raise SnapshotError(f"snapshot does not contain {kind}")
+        payload = memoryview(raw)[SNAPSHOT_HEADER.size:]
+        if len(payload) != length or zlib.crc32(payload) != checksum:
+            raise SnapshotError("snapshot checksum mismatch")
+        try:
+            return self._load_messages(payload, count) if kind == MESSAGES else self._load_preferences(payload, count)
+        except (struct.error, UnicodeDecodeError, ValueError, IndexError) as e:
+            raise SnapshotError(f"snapshot payload is corrupt: {e}") from e
+
+    @staticmethod
+    def _pack(columns: List[array], strings: List[str]) -> bytes:
+        """Eleman sayısı önekli sütunlar + metin uzunlukları + tek metin bloğu."""
+        # Uzunluklar karakter cinsindendir; metin bloğu bir kez çözülüp dilimlenir
+        columns = columns + [array('I', map(len, strings))]
+        parts = []
+        for column in columns:
+            parts.append(struct.pack("<I", len(column)))
+            parts.append(column.tobytes())
+        parts.append("".join(strings).encode('utf-8'))
+        return b"".join(parts)
+
+    @staticmethod
+    def _unpack(payload: memoryview, typecodes: str) -> Tuple[List[array], List[str]]:
+        """`_pack` çıktısını sütunlara ve metin listesine ayırır."""
+        offset = 0
+        columns = []
+        for typecode in typecodes + 'I':
+            (count,) = struct.unpack_from("<I", payload, offset)
+            offset += 4
+            column = array(typecode)
+            size = column.itemsize * count
+            column.frombytes(payload[offset:offset + size])
+            if len(column) != count:
+                raise SnapshotError("snapshot payload is truncated")
+            columns.append(column)
+            offset += size
+        *columns, lengths = columns
+        text = bytes(payload[offset:]).decode('utf-8')
+        ends = list(accumulate(lengths))
+        strings = [text[start:end] for start, end in zip([0] + ends, ends)]
+        return columns, strings
+
+    @staticmethod
+    def _dump_messages(data: Dict[str, List[Dict[str, Any]]]) -> bytes:
+        counts = array('I')
+        user_ids = array('q')
+        timestamps = array('d')
+        types = array('B')
+        username_codes = array('I')
+        extra_indices = array('I')
+        usernames: Dict[str, int] = {}  # Kullanıcı adları sözlükle kodlanır, yüklemede nesneler paylaşılır
+        texts: List[str] = []
+        extras: List[str] = []
+        for messages in data.values():
+            counts.append(len(messages))
+            for message in messages:
+                type_code = MESSAGE_TYPE_CODES.get(message["message_type"], OTHER_TYPE) if "message_type" in message else NO_TYPE
+                username = message["username"]
+                if username is None:
+                    type_code |= USERNAME_NONE
+                extra = {key: value for key, value in message.items() if key not in MESSAGE_FIELDS}
+                if type_code & ~USERNAME_NONE == OTHER_TYPE:
+                    extra["message_type"] = message["message_type"]
+                if extra:
+                    extra_indices.append(len(texts))
+                    extras.append(json.dumps(extra, ensure_ascii=False))
+                user_ids.append(message["user_id"])
+                timestamps.append(message["timestamp"])
+                types.append(type_code)
+                username_codes.append(usernames.setdefault(username or "", len(usernames)))
+                texts.append(message["message"])
+        strings = list(data.keys()) + list(usernames) + texts + extras
+        columns = [counts, user_ids, timestamps, types, username_codes, extra_indices]
+        return BinarySerializer._pack(columns, strings)
+
+    @staticmethod
+    def _load_messages(payload: memoryview, chats: int) -> Dict[str, List[Dict[str, Any]]]:
+        columns, strings = BinarySerializer._unpack(payload, "IqdBII")
+        counts, user_ids, timestamps, types, username_codes, extra_indices = columns
+        total = len(user_ids)
+        if len(counts) != chats or not len(timestamps) == len(types) == len(username_codes) == total:
+            raise SnapshotError("snapshot columns do not match")
+        vocabulary = len(strings) - chats - total - len(extra_indices)
+        usernames = strings[chats:chats + vocabulary]
+        texts = strings[chats + vocabulary:chats + vocabulary + total]
+        type_names = [MESSAGE_TYPE_NAMES.get(code & ~USERNAME_NONE) for code in range(256)]
+        messages = [
+            {"user_id": user_id, "username": usernames[code], "message": text, "message_type": type_names[type_code], "timestamp": timestamp}
+            for user_id, code, text, type_code, timestamp in zip(
+                user_ids.tolist(), username_codes, texts, types, timestamps.tolist()
+            )
+        ]
+        # Nadir durumlar ayrı geçişte düzeltilir
+        for index, type_code in enumerate(types):
+            if type_code & USERNAME_NONE:
+                messages[index]["username"] = None
+            if type_code & ~USERNAME_NONE == NO_TYPE:
+                del messages[index]["message_type"]
+        for index, extra in zip(extra_indices, strings[chats + vocabulary + total:]):
+            messages[index].update(json.loads(extra))
+
+        data: Dict[str, List[Dict[str, Any]]] = {}
+        start = 0
+        for key, count in zip(strings[:chats], counts):
+            data[key] = messages[start:start + count]
+            start += count
+        return data
+
+    @staticmethod
+    def _dump_preferences(data: Dict[str, Dict[str, Any]]) -> bytes:
+        chat_ids = array('q')
+        user_ids = array('q')
+        created_by = array('q')
+        last_updated = array('d')
+        flags = array('B')
+        preference_counts = array('I')
+        preference_codes = array('I')  # Tür/değer çiftleri, sözlük kodlarıyla
+        extra_indices = array('I')
+        vocabulary: Dict[str, int] = {}
+        keys, usernames, extras = [], [], []
+        for index, (key, record) in enumerate(data.items()):
+            extra = {name: value for name, value in record.items() if name not in PREFERENCE_FIELDS}
+            if extra:
+                extra_indices.append(index)
+                extras.append(json.dumps(extra, ensure_ascii=False))
+            flag = CONSENT_GIVEN if record.get("consent_given") else 0
+            if "created_by" in record:
+                flag |= HAS_CREATED_BY
+            if record.get("username") is None:
+                flag |= USERNAME_NONE
+            chat_ids.append(record["chat_id"])
+            user_ids.append(record["user_id"])
+            created_by.append(record.get("created_by") or 0)
+            last_updated.append(record.get("last_updated", 0.0))
+            flags.append(flag)
+            preferences = record.get("preferences", {})
+            preference_counts.append(len(preferences))
+            for preference_type, preference_value in preferences.items():
+                preference_codes.append(vocabulary.setdefault(preference_type, len(vocabulary)))
+                preference_codes.append(vocabulary.setdefault(preference_value, len(vocabulary)))
+            keys.append(key)
+            usernames.append(record.get("username") or "")
+        strings = keys + usernames + list(vocabulary) + extras
+        columns = [chat_ids, user_ids, created_by, last_updated, flags, preference_counts, preference_codes, extra_indices]
+        return BinarySerializer._pack(columns, strings)
+
+    @staticmethod
+    def _load_preferences(payload: memoryview, count: int) -> Dict[str, Dict[str, Any]]:
+        columns, strings = BinarySerializer._unpack(payload, "qqqdBIII")
+        chat_ids, user_ids, created_by, last_updated, flags, preference_counts, preference_codes, extra_indices = columns
+        if any(len(column) != count for column in columns[:6]):
+            raise SnapshotError("snapshot columns do not match")
+        keys = strings[:count]
+        usernames = strings[count:2 * count]
+        vocabulary = strings[2 * count:len(strings) - len(extra_indices)]
+        codes = iter([vocabulary[code] for code in preference_codes])
+        records = [
+            {
+                "chat_id": chat_id,
+                "user_id": user_id,
+                "username": username,
+                "preferences": {next(codes): next(codes) for _ in range(preferences)},
+                "consent_given": bool(flag & CONSENT_GIVEN),
+                "last_updated": updated,
+            }
+            for chat_id, user_id, username, preferences, flag, updated in zip(
+                chat_ids.tolist(), user_ids.tolist(), usernames, preference_counts, flags, last_updated.tolist()
+            )
+        ]
+        for record, flag, creator in zip(records, flags, created_by.tolist()):
+            if flag & HAS_CREATED_BY:
+                record["created_by"] = creator
+            if flag & USERNAME_NONE:
+                record["username"] = None
+        for index, extra in zip(extra_indices, strings[len(strings) - len(extra_indices):]):
+            records[index].update(json.loads(extra))
+        return dict(zip(keys, records))
+
+
+SERIALIZERS = {serializer.name: serializer for serializer in (JsonSerializer(), BinarySerializer())}
+
+
+def get_serializer(name: str):
+    try:
+        return SERIALIZERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown storage format: {name} (expected one of {', '.join(SERIALIZERS)})")
+
+
+def serializer_for_path(path: str):
+    """Dosya uzantısına göre serileştiriciyi seçer."""
+    extension = os.path.splitext(path)[1]
+    for serializer in SERIALIZERS.values():
+        if serializer.extension == extension:
+            return serializer
+    raise ValueError(f"Unknown storage file extension: {path}")
+
+
+def store_path(path: str, serializer) -> str:
+    """Dosya yolunun uzantısını serileştiricininkiyle değiştirir."""
+    return os.path.splitext(path)[0] + serializer.extension
+
+
+def _modified(path: str) -> float:
+    """Dosyanın (yoksa yedeğinin) değişme zamanı; ikisi de yoksa -1."""
+    for candidate in (path, f"{path}{BACKUP_SUFFIX}"):
+        try:
+            return os.path.getmtime(candidate)
+        except OSError:
+            continue
+    return -1.0
+
+
+def read_store(path: str, serializer, kind: str) -> Dict[str, Any]:
+    """Depo dosyasını okur; aynı adlı diğer biçimdeki dosya daha yeniyse ondan geçiş yapar.
+
+    Böylece STORAGE_FORMAT değiştirildiğinde ilk açılışta son yazılan dosya
+    okunur ve ilk kayıtta yeni biçimde yazılır. Eski biçimdeki dosya diskte
+    kalsa da biçim geri alındığında onun yerine daha yeni dosya yüklenir.
+    Bozuk dosyalar kenara alınıp son iyi anlık görüntü (.bak) kullanılır
+    (`read_with_recovery`).
+    """
+    candidates = [(path, serializer)] + [
+        (store_path(path, other), other) for other in SERIALIZERS.values() if other is not serializer
+    ]
+    # Sıralama kararlı: değişme zamanları eşitse seçili biçim önce denenir
+    candidates.sort(key=lambda candidate: _modified(candidate[0]), reverse=True)
+    for candidate, candidate_serializer in candidates:
+        data = read_with_recovery(candidate, lambda raw: _loads_without_gc(candidate_serializer, raw, kind))
+        if data is not None:
+            return data
+    return {}
+
+
+def _loads_without_gc(serializer, raw: bytes, kind: str) -> Dict[str, Any]:
+    # Milyonlarca kapsayıcı oluşturulurken çöp toplayıcının tekrar tekrar tüm
+    # yığını taraması yükleme süresini neredeyse ikiye katlıyor
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return serializer.loads(raw, kind)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def write_store(path: str, serializer, kind: str, data: Dict[str, Any]):
+    """Depoyu DURABILITY_MODE'a göre atomik olarak yazar (interval modunda serileştirme ertelenir)."""
+    durable_writer.write(path, lambda: serializer.dumps(data, kind))
+
+
+def guess_kind(path: str, raw: bytes) -> str:
+    """Anlık görüntüde türü başlıktan, JSON'da dosya adından çıkarır."""
+    if raw.startswith(SNAPSHOT_MAGIC) and len(raw) >= SNAPSHOT_HEADER.size:
+        kind_code = SNAPSHOT_HEADER.unpack_from(raw)[2]
+        return next((kind for kind, code in KIND_CODES.items() if code == kind_code), MESSAGES)
+    return PREFERENCES if "preferences" in os.path.basename(path) else MESSAGES
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Depo dosyalarını JSON ve ikili anlık görüntü arasında dönüştürür")
+    parser.add_argument("source", help="Kaynak dosya (.json veya .snap)")
+    parser.add_argument("target", help="Hedef dosya (.json veya .snap)")
+    parser.add_argument("--kind", choices=sorted(KIND_CODES), help="Depo türü (varsayılan: dosya adından)")
+    args = parser.parse_args(argv)
+
+    with open(args.source, 'rb') as f:
+        raw = f.read()
+    kind = args.kind or guess_kind(args.source, raw)
+    data = serializer_for_path(args.source).loads(raw, kind)
+    atomic_replace(args.target, serializer_for_path(args.target).dumps(data, kind))
+    print(f"{args.source} ({os.path.getsize(args.source)} bytes) -> {args.target} ({os.path.getsize(args.target)} bytes), {len(data)} {kind} records")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
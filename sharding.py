@@ -0,0 +1,250 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import random
+import time
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from config import BOT_USERNAME, SHARD_ID, SHARD_WORKERS, TELEGRAM_API_BASE_URL, TELEGRAM_BOT_TOKEN
+
+logger = logging.getLogger(__name__)
+
+# Güncelleme içinde sohbet bilgisinin bulunabileceği alanlar
+UPDATE_MESSAGE_FIELDS = ("message", "edited_message", "channel_post", "edited_channel_post")
+
+
+def shard_key(update: Dict[str, Any]) -> Optional[int]:
+    """Güncellemenin hangi sohbete (özelde kullanıcıya) ait olduğunu döndürür."""
+    for field in UPDATE_MESSAGE_FIELDS:
+        message = update.get(field)
+        if message:
+            return message.get("chat", {}).get("id")
+
+    # Mesaj içermeyen güncellemelerde (callback vb.) gönderen kullanıcıya göre dağıt
+    for value in update.values():
+        if isinstance(value, dict) and "from" in value:
+            return value["from"]["id"]
+    return None
+
+
+def shard_for_key(key: int, workers: int) -> int:
+    """Sohbetin (özelde kullanıcının) verilerini tutan worker numarası."""
+    return zlib.crc32(str(key).encode()) % workers
+
+
+def shard_for_update(update: Dict[str, Any], workers: int) -> int:
+    """Güncellemenin gideceği worker numarasını sohbet ID'sinin hash'ine göre seçer."""
+    key = shard_key(update)
+    if key is None:
+        return 0
+    return shard_for_key(key, workers)
+
+
+def is_local(key: int) -> bool:
+    """Sohbetin verileri bu süreçte mi (tek süreçli modda her zaman)."""
+    return SHARD_ID is None or shard_for_key(key, SHARD_WORKERS) == int(SHARD_ID)
+
+
+def _worker_main(shard_id: int, updates: multiprocessing.Queue, results: multiprocessing.Queue, dry_run: bool):
+    """Worker sürecinin giriş noktası."""
+    if dry_run:
+        _run_dry_worker(shard_id, updates, results)
+    else:
+        from http_clients import install_event_loop_policy
+        install_event_loop_policy()
+        asyncio.run(_run_bot_worker(shard_id, updates, results))
+
+
+def _run_dry_worker(shard_id: int, updates: multiprocessing.Queue, results: multiprocessing.Queue):
+    """Botu çalıştırmadan gelen güncellemeleri sayar (yerel test için)."""
+    keys = set()
+    count = 0
+    while True:
+        data = updates.get()
+        if data is None:
+            break
+        keys.add(shard_key(data))
+        count += 1
+    results.put({"shard_id": shard_id, "updates": count, "keys": sorted(k for k in keys if k is not None)})
+
+
+async def _run_bot_worker(shard_id: int, updates: multiprocessing.Queue, results: multiprocessing.Queue):
+    """Kendi shard'ının GroupMemory/UserPreferences durumuna sahip bot worker'ı."""
+    from telegram import Update
+    from main import TelegramAIBot
+
+    bot = TelegramAIBot(updater=False)
+    application = bot.application
+    await application.initialize()
+    await application.start()
+    await bot.start_services()
+    logger.info(f"Shard worker {shard_id} started")
+
+    loop = asyncio.get_running_loop()
+    count = 0
+    try:
+        while True:
+            data = await loop.run_in_executor(None, updates.get)
+            if data is None:
+                break
+            await application.update_queue.put(Update.de_json(data, application.bot))
+            count += 1
+    finally:
+        await bot.stop_services()
+        await application.stop()
+        await application.shutdown()
+        results.put({"shard_id": shard_id, "updates": count})
+
+
+class ShardRouter:
+    """Güncellemeleri sohbet ID'sine göre worker süreçlerine dağıtan ön süreç."""
+
+    def __init__(self, workers: int = SHARD_WORKERS, dry_run: bool = False):
+        self.workers = workers
+        self.dry_run = dry_run
+        self.context = multiprocessing.get_context("spawn")
+        self.results = self.context.Queue()
+        self.queues: List[multiprocessing.Queue] = []
+        self.processes: List[multiprocessing.Process] = []
+        self.routed = [0] * workers
+
+    def start(self):
+        """Worker süreçlerini başlatır."""
+        for shard_id in range(self.workers):
+            queue = self.context.Queue()
+            process = self.context.Process(
+                target=_worker_main,
+                args=(shard_id, queue, self.results, self.dry_run),
+                name=f"shard-{shard_id}",
+            )
+            # Worker, veri dosyalarını config.SHARD_ID'ye göre ayırır; SHARD_WORKERS ile
+            # hangi sohbetlerin (ör. özel mesajların) kendisinde olduğunu hesaplar (`is_local`)
+            previous_workers = os.environ.get("SHARD_WORKERS")
+            os.environ["SHARD_ID"] = str(shard_id)
+            os.environ["SHARD_WORKERS"] = str(self.workers)
+            try:
+                process.start()
+            finally:
+                del os.environ["SHARD_ID"]
+                if previous_workers is None:
+                    del os.environ["SHARD_WORKERS"]
+                else:
+                    os.environ["SHARD_WORKERS"] = previous_workers
+            self.queues.append(queue)
+            self.processes.append(process)
+        logger.info(f"{self.workers} shard workers started")
+
+    def route(self, update: Dict[str, Any]) -> int:
+        """Güncellemeyi ilgili worker'ın kuyruğuna koyar ve worker numarasını döndürür."""
+        shard_id = shard_for_update(update, self.workers)
+        self.queues[shard_id].put(update)
+        self.routed[shard_id] += 1
+        return shard_id
+
+    def stop(self) -> List[Dict[str, Any]]:
+        """Worker'ları durdurur ve her birinin özetini döndürür."""
+        for queue in self.queues:
+            queue.put(None)
+        results = [self.results.get() for _ in self.processes]
+        for process in self.processes:
+            process.join()
+        return sorted(results, key=lambda result: result["shard_id"])
+
+
+async def poll_updates(router: ShardRouter):
+    """Telegram'dan getUpdates ile güncelleme çeker ve worker'lara dağıtır."""
+    from telegram import Bot
+    from http_clients import telegram_request, updates_request
+
+    bot = Bot(TELEGRAM_BOT_TOKEN, base_url=f"{TELEGRAM_API_BASE_URL}/bot",
+              request=telegram_request(), get_updates_request=updates_request())
+    offset = None
+    async with bot:
+        await bot.delete_webhook()
+        while True:
+            updates = await bot.get_updates(offset=offset, timeout=30)
+            for update in updates:
+                router.route(update.to_dict())
+                offset = update.update_id + 1
+
+
+async def fake_updates(count: int, groups: int = 10, users: int = 50, private_ratio: float = 0.2, seed: int = 0) -> AsyncIterator[Dict[str, Any]]:
+    """Yerel test için Telegram formatında sahte güncellemeler üretir."""
+    rng = random.Random(seed)
+    bot_username = BOT_USERNAME or "fake_bot"
+    for update_id in range(1, count + 1):
+        user_id = 1000 + rng.randrange(users)
+        sender = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+        if rng.random() < private_ratio:
+            chat = {"id": user_id, "type": "private", "first_name": sender["first_name"]}
+            text = f"merhaba {update_id}"
+        else:
+            chat = {"id": -1000000000000 - rng.randrange(groups), "type": "supergroup", "title": "Fake"}
+            text = f"@{bot_username} merhaba {update_id}" if rng.random() < 0.3 else f"sohbet {update_id}"
+        yield {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": chat,
+                "from": sender,
+                "text": text,
+            },
+        }
+        await asyncio.sleep(0)
+
+
+async def run_sharded(workers: int = SHARD_WORKERS):
+    """Çok süreçli modda botu çalıştırır: ön süreç Telegram'ı dinler, worker'lar yanıtlar."""
+    router = ShardRouter(workers)
+    router.start()
+    try:
+        await poll_updates(router)
+    finally:
+        router.stop()
+
+
+async def run_fake(workers: int, count: int, groups: int, users: int, dry_run: bool) -> List[Dict[str, Any]]:
+    """Sahte güncelleme kaynağıyla dağıtımı yerelde çalıştırır."""
+    router = ShardRouter(workers, dry_run=dry_run)
+    router.start()
+    started = time.perf_counter()
+    try:
+        async for update in fake_updates(count, groups, users):
+            router.route(update)
+    finally:
+        results = router.stop()
+    elapsed = time.perf_counter() - started
+
+    # Aynı sohbet birden fazla worker'a gitmemeli
+    if dry_run:
+        seen = {}
+        for result in results:
+            for key in result["keys"]:
+                if key in seen:
+                    raise RuntimeError(f"Chat {key} routed to shards {seen[key]} and {result['shard_id']}")
+                seen[key] = result["shard_id"]
+
+    for result in results:
+        print(f"shard {result['shard_id']}: {result['updates']} güncelleme")
+    print(f"Toplam {count} güncelleme, {elapsed:.2f} sn")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sohbetleri worker süreçlerine dağıtarak botu çalıştırır.")
+    parser.add_argument("--workers", type=int, default=max(SHARD_WORKERS, 2))
+    parser.add_argument("--fake", type=int, metavar="N", help="Telegram yerine N sahte güncelleme kullan")
+    parser.add_argument("--groups", type=int, default=10)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--dry-run", action="store_true", help="Worker'larda botu çalıştırmadan sadece say")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    if args.fake:
+        asyncio.run(run_fake(args.workers, args.fake, args.groups, args.users, args.dry_run))
+    else:
+        asyncio.run(run_sharded(args.workers))
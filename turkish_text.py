@@ -0,0 +1,53 @@
+import re
+from typing import List
+
+# Türkçe karakterleri olmadan yazılan mesajlar da eşleşsin diye harfler ASCII karşılıklarına indirgenir
+DIACRITIC_PAIRS = (("ç", "c"), ("ğ", "g"), ("ı", "i"), ("ö", "o"), ("ş", "s"), ("ü", "u"), ("â", "a"), ("î", "i"), ("û", "u"))
+
+NON_WORD_PATTERN = re.compile(r"[\W_]+")
+
+
+def turkish_lower(text: str) -> str:
+    """Türkçe kurallarına göre küçük harfe çevirir.
+
+    str.lower() "İ" harfini "i̇" (i + birleşik nokta), "I" harfini "i" yapar;
+    Türkçede İ -> i, I -> ı olmalıdır.
+    """
+    text = text.replace("İ", "i").replace("I", "ı").lower()
+    if "\u0307" in text:
+        text = text.replace("\u0307", "")
+    return text
+
+
+def fold_diacritics(text: str) -> str:
+    """Küçük harfli metindeki şapka ve Türkçe harfleri ASCII karşılıklarına indirger."""
+    if text.isascii():
+        return text
+    # str.translate ASCII dışı metinde yavaş; kısa mesajlarda replace zinciri daha hızlı
+    for source, target in DIACRITIC_PAIRS:
+        if source in text:
+            text = text.replace(source, target)
+    return text
+
+
+def tokenize(text: str, fold: bool = True) -> List[str]:
+    """Metni küçültüp harfleri indirgeyerek kelimelere ayırır (noktalama ayırıcıdır).
+
+    `fold=False` ile Türkçe harfler korunur ("şen" ile "sen" ayrı kalır).
+    """
+    lowered = turkish_lower(text)
+    words = (fold_diacritics(lowered) if fold else lowered).split()
+    if all(map(str.isalnum, words)):
+        return words
+    raw_words, words = words, []
+    for word in raw_words:
+        if word.isalnum():
+            words.append(word)
+        else:
+            words.extend(part for part in NON_WORD_PATTERN.split(word) if part)
+    return words
+
+
+def normalize(text: str, fold: bool = True) -> str:
+    """Karşılaştırma için normalleştirilmiş, kelimeleri tek boşlukla ayrılmış metin döndürür."""
+    return " ".join(tokenize(text, fold))
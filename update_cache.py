@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from config import UPDATE_CACHE_SIZE, shard_path
+from durability import atomic_replace, durable_writer, read_with_recovery
+from metrics import cache_requests, metrics
+
+logger = logging.getLogger(__name__)
+
+PROCESSED_UPDATES_FILE = "processed_updates.jsonl"
+LEGACY_PROCESSED_UPDATES_FILE = "processed_updates.json"  # Eski tam-yazım biçimi, ilk açılışta taşınır
+
+class UpdateCache:
+    """İşlenmiş güncellemeleri hatırlayan sınırlı, kalıcı idempotency penceresi.
+
+    Kayıtlar chat_id+message_id ile tutulur, update_id ayrıca indekslenir.
+    Yeniden başlatma veya webhook tekrarında gelen güncelleme bulunursa mesaj
+    tekrar kaydedilmez ve Gemini'ye tekrar gidilmez. İşaretleme, yanıt ve
+    teslim bilgisi ek-yalnızca dosyaya birer kısa satır olarak yazılır;
+    satırlar pencerenin iki katını aşınca dosya sıkıştırılır.
+    """
+
+    def __init__(self, cache_file: str = None, max_entries: int = UPDATE_CACHE_SIZE):
+        self.cache_file = cache_file or shard_path(PROCESSED_UPDATES_FILE)
+        self.max_entries = max_entries
+        self.records: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.update_index: Dict[int, str] = {}
+        self.lines = 0  # Dosyadaki satır sayısı; pencerenin iki katını aşınca dosya sıkıştırılır
+        self._load_cache()
+
+    def _load_cache(self):
+        """İşlenmiş güncellemeleri kayıt dosyasından yükler."""
+        if not os.path.exists(self.cache_file):
+            self._migrate_legacy()
+            return
+        with open(self.cache_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Yarım yazılmış son satır
+                self.lines += 1
+                self._apply(entry)
+        if self.lines > self.max_entries * 2:
+            self._compact()
+
+    def _migrate_legacy(self):
+        """Eski JSON dizisi dosyasını kayıt dosyasına taşır."""
+        legacy_file = os.path.join(os.path.dirname(self.cache_file), LEGACY_PROCESSED_UPDATES_FILE)
+        records = read_with_recovery(legacy_file, json.loads)
+        if records is None:
+            return
+        for record in records:
+            self._insert(record)
+        self._compact()
+        os.remove(legacy_file)
+        logger.info(f"Migrated {len(self.records)} processed updates to {self.cache_file}")
+
+    def _apply(self, entry: List[Any]):
+        """Kayıt dosyasındaki bir satırı pencereye uygular."""
+        if entry[0] == "m":
+            self._insert(entry[1])
+            return
+        record = self.records.get(self._get_key(entry[1], entry[2]))
+        if record is None:
+            return  # Pencereden düşmüş güncelleme
+        if entry[0] == "r":
+            record["reply"] = entry[3]
+        elif entry[0] == "d":
+            record["delivered"] = True
+
+    def _append(self, entry: List[Any]):
+        """Satırı kayıt dosyasına ekler; her güncelleme dosyayı baştan yazmaz.
+
+        every-write modunda satır fsync'lenir ki yanıt gönderilmeden önce
+        diskte olsun; diğer modlarda işletim sistemine bırakılır.
+        """
+        with metrics.timer("persistence"):
+            with open(self.cache_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                if durable_writer.mode == "every-write":
+                    f.flush()
+                    os.fsync(f.fileno())
+        self.lines += 1
+        if self.lines > self.max_entries * 2:
+            self._compact()
+
+    def _compact(self):
+        """Dosyayı yalnızca penceredeki kayıtlarla yeniden yazar."""
+        data = "".join(json.dumps(["m", record], ensure_ascii=False) + "\n" for record in self.records.values())
+        with metrics.timer("persistence"):
+            atomic_replace(self.cache_file, data.encode('utf-8'), sync=durable_writer.mode != "none", backup=False)
+        self.lines = len(self.records)
+
+    def _get_key(self, chat_id: int, message_id: int) -> str:
+        return f"{chat_id}_{message_id}"
+
+    def _insert(self, record: Dict[str, Any]):
+        key = self._get_key(record["chat_id"], record["message_id"])
+        self.records[key] = record
+        if record.get("update_id") is not None:
+            self.update_index[record["update_id"]] = key
+
+        # Pencereyi sınırla, en eski kayıtları at
+        while len(self.records) > self.max_entries:
+            _, oldest = self.records.popitem(last=False)
+            if self.update_index.get(oldest.get("update_id")) == self._get_key(oldest["chat_id"], oldest["message_id"]):
+                del self.update_index[oldest["update_id"]]
+
+    def check(self, update_id: int, chat_id: int, message_id: int) -> Optional[Dict[str, Any]]:
+        """Güncelleme daha önce işlendiyse kaydını, işlenmediyse None döndürür."""
+        key = self.update_index.get(update_id)
+        if key is None:
+            key = self._get_key(chat_id, message_id)
+        record = self.records.get(key)
+        cache_requests.inc(cache="update", result="hit" if record is not None else "miss")
+        return record
+
+    def mark(self, update_id: int, chat_id: int, message_id: int):
+        """Güncellemeyi işlenmiş olarak işaretler (işe başlamadan önce çağrılır)."""
+        self._insert({
+            "update_id": update_id,
+            "chat_id": chat_id,
+            "message_id": message_id,
+            "reply": None,
+            "timestamp": time.time()
+        })
+        self._append(["m", self.records[self._get_key(chat_id, message_id)]])
+
+    def set_reply(self, chat_id: int, message_id: int, reply: str):
+        """Güncellemeye üretilen yanıtı saklar; tekrar gelirse bu yanıt kullanılır."""
+        record = self.records.get(self._get_key(chat_id, message_id))
+        if record is not None:
+            record["reply"] = reply
+            self._append(["r", chat_id, message_id, reply])
+
+    def mark_delivered(self, chat_id: int, message_id: int):
+        """Saklanan yanıtın gönderildiğini işaretler; tekrar gelen güncellemede yeniden gönderilmez."""
+        record = self.records.get(self._get_key(chat_id, message_id))
+        if record is not None:
+            record["delivered"] = True
+            self._append(["d", chat_id, message_id])
+
+# Global update cache instance
+update_cache = UpdateCache()
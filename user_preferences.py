@@ -1,36 +1,191 @@
-import json
-import os
+import copy
 import time
-from typing import Dict, List, Any
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Tuple
+from config import GROUP_PREFERENCES_PROMPT_USERS, STORAGE_FORMAT, shard_path
+from metrics import metrics
+from serializers import PREFERENCES, get_serializer, read_store, store_path, write_store
 
 USER_PREFERENCES_FILE = "user_preferences.json"
 
+# Güvenli tercih türleri ve değerleri
+SAFE_PREFERENCE_VALUES = {
+    "hitap": frozenset(["sen", "siz", "efendim", "kanka", "dost"]),
+    "dil": frozenset(["eski türkçe", "modern türkçe", "arapça", "farsça"]),
+    "ton": frozenset(["şakacı", "ciddi", "romantik", "nazik"]),
+    "kişilik": frozenset(["gururlu", "itaatkar", "şakacı", "saygılı"]),
+    "ilgi": frozenset(["şiir", "müzik", "kitap", "sanat", "edebiyat"]),
+    "şair": frozenset(["nazım hikmet", "yahya kemal", "orhan veli", "cemal süreya", "attila ilhan"]),
+}
+
 class UserPreferences:
-    def __init__(self):
+    def __init__(self, preferences_file: str = None, storage_format: str = None):
+        self.serializer = get_serializer(storage_format or STORAGE_FORMAT)
+        self.preferences_file = store_path(preferences_file or shard_path(USER_PREFERENCES_FILE), self.serializer)
         self.user_preferences: Dict[str, Dict[str, Any]] = {}
+        self._transaction_depth = 0
+        self._dirty = False
+        self._journal: Dict[str, Optional[Dict[str, Any]]] = {}  # Geri alma için değişmeden önceki kayıtlar
+        self._by_chat: Dict[int, Dict[int, Dict[str, Any]]] = {}  # chat_id -> user_id -> kayıt (aynı nesneler)
+        self._fragments: Dict[str, str] = {}  # Kullanıcı başına hazır prompt metni
+        self._chat_blocks: Dict[int, str] = {}  # Grup başına hazır "kim neyi tercih ediyor" metni
         self._load_preferences()
 
     def _load_preferences(self):
-        """Kullanıcı tercihlerini dosyadan yükler."""
-        if os.path.exists(USER_PREFERENCES_FILE):
-            try:
-                with open(USER_PREFERENCES_FILE, 'r', encoding='utf-8') as f:
-                    self.user_preferences = json.load(f)
-            except json.JSONDecodeError:
-                self.user_preferences = {}
-                print(f"Warning: Could not decode {USER_PREFERENCES_FILE}. Starting with empty preferences.")
-        else:
-            self.user_preferences = {}
+        """Kullanıcı tercihlerini dosyadan yükler (bozuksa son iyi anlık görüntüden)."""
+        self.user_preferences = read_store(self.preferences_file, self.serializer, PREFERENCES)
+        self._rebuild_index()
+
+    def _rebuild_index(self):
+        """Sohbet indeksini baştan kurar ve hazır prompt metinlerini siler."""
+        self._by_chat = {}
+        for user_data in self.user_preferences.values():
+            self._by_chat.setdefault(user_data["chat_id"], {})[user_data["user_id"]] = user_data
+        self._fragments.clear()
+        self._chat_blocks.clear()
 
     def _save_preferences(self):
-        """Kullanıcı tercihlerini dosyaya kaydeder."""
-        with open(USER_PREFERENCES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(self.user_preferences, f, ensure_ascii=False, indent=4)
+        """Kullanıcı tercihlerini dosyaya kaydeder (transaction içindeyse sona erteler)."""
+        if self._transaction_depth:
+            self._dirty = True
+            return
+        with metrics.timer("persistence"):
+            write_store(self.preferences_file, self.serializer, PREFERENCES, self.user_preferences)
 
     def _get_key(self, chat_id: int, user_id: int) -> str:
         """Chat ve user ID'sine göre benzersiz anahtar oluşturur."""
         return f"{chat_id}_{user_id}"
 
+    def _invalidate(self, chat_id: int, user_id: int):
+        """Kaydı değişen kullanıcının ve grubunun hazır prompt metinlerini siler."""
+        self._fragments.pop(self._get_key(chat_id, user_id), None)
+        self._chat_blocks.pop(chat_id, None)
+
+    def _put(self, key: str, user_data: Dict[str, Any]):
+        """Kaydı hem ana sözlüğe hem sohbet indeksine ekler."""
+        self.user_preferences[key] = user_data
+        self._by_chat.setdefault(user_data["chat_id"], {})[user_data["user_id"]] = user_data
+        self._invalidate(user_data["chat_id"], user_data["user_id"])
+
+    def _drop(self, key: str):
+        """Kaydı hem ana sözlükten hem sohbet indeksinden siler."""
+        user_data = self.user_preferences.pop(key, None)
+        if user_data is None:
+            return
+        chat_users = self._by_chat.get(user_data["chat_id"])
+        if chat_users is not None:
+            chat_users.pop(user_data["user_id"], None)
+            if not chat_users:
+                del self._by_chat[user_data["chat_id"]]
+        self._invalidate(user_data["chat_id"], user_data["user_id"])
+
+    def _remember(self, key: str):
+        """Transaction içindeyse kaydın ilk halini geri alma için saklar."""
+        if self._transaction_depth and key not in self._journal:
+            self._journal[key] = copy.deepcopy(self.user_preferences.get(key))
+
+    @contextmanager
+    def transaction(self):
+        """İçindeki tüm değişiklikleri tek seferde dosyaya yazar.
+
+        İç içe kullanılabilir; kayıt en dıştaki blok bitince yapılır. Blok
+        içinde hata oluşursa değişiklikler geri alınır ve hiçbir şey yazılmaz.
+        """
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            if self._transaction_depth == 1:
+                self._rollback()
+            raise
+        finally:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self._journal.clear()
+                if self._dirty:
+                    self._dirty = False
+                    self._save_preferences()
+
+    def _rollback(self):
+        """Transaction başından beri değişen kayıtları eski hallerine döndürür."""
+        for key, record in self._journal.items():
+            if record is None:
+                self._drop(key)
+            else:
+                self._put(key, record)
+        self._journal.clear()
+        self._dirty = False
+
+    def apply_batch(self, chat_id: int, user_id: int, username: str, operations: List[Tuple[str, ...]], require_consent: bool = True, requesting_user_id: int = None) -> List[Dict[str, Any]]:
+        """Bir kullanıcının birden çok tercih değişikliğini tek doğrulama ve tek kayıtla uygular.
+
+        `operations` elemanları ("set", tür, değer) veya ("remove", tür)
+        biçimindedir. Her işlem için action, type, value, success ve message
+        alanlarını içeren bir sonuç döndürülür.
+        """
+        key = self._get_key(chat_id, user_id)
+        user_data = self.user_preferences.get(key)
+
+        # Kimlik ve onay kontrolleri tüm işlemler için bir kez yapılır
+        denied = None
+        if requesting_user_id is not None and requesting_user_id != user_id:
+            denied = "❌ Başkasının adına tercih kaydedemezsiniz! Herkes sadece kendi tercihlerini belirleyebilir."
+        elif user_data and "created_by" in user_data and user_data["created_by"] != user_id:
+            denied = "❌ Bu kullanıcının tercihlerini değiştirme yetkiniz yok!"
+        needs_consent = require_consent and not (user_data and user_data.get("consent_given", False))
+
+        results = []
+        for operation in operations:
+            action, preference_type = operation[0], operation[1]
+            value = operation[2] if len(operation) > 2 else None
+            result = {"action": action, "type": preference_type, "value": value, "success": False, "message": ""}
+            if denied:
+                result["message"] = denied
+            elif action == "set" and needs_consent:
+                result["message"] = "Bu tercihi kaydetmek için önce onay vermeniz gerekiyor. 'tercih onayla' komutunu kullanın."
+            elif action == "set":
+                result["success"], result["message"] = self.validate_preference(preference_type, value)
+            elif action == "remove":
+                result["success"] = True
+            else:
+                result["message"] = f"Bilinmeyen işlem: {action}"
+            results.append(result)
+
+        accepted = [result for result in results if result["success"]]
+        if not accepted:
+            return results
+        if key not in self.user_preferences and not any(result["action"] == "set" for result in accepted):
+            # Kaydı olmayan kullanıcıda silinecek tercih yok; boş kayıt oluşturulmaz
+            for result in accepted:
+                result["message"] = "Tercih silindi."
+            return results
+
+        with self.transaction():
+            self._remember(key)
+            if key not in self.user_preferences:
+                self._put(key, {
+                    "chat_id": chat_id,
+                    "user_id": user_id,
+                    "username": username,
+                    "preferences": {},
+                    "consent_given": not require_consent,
+                    "last_updated": time.time(),
+                    "created_by": user_id
+                })
+            user_data = self.user_preferences[key]
+            self._invalidate(chat_id, user_id)
+            user_data["username"] = username
+            for result in accepted:
+                if result["action"] == "set":
+                    user_data["preferences"][result["type"]] = result["value"]
+                    result["message"] = "Tercih başarıyla kaydedildi."
+                else:
+                    user_data["preferences"].pop(result["type"], None)
+                    result["message"] = "Tercih silindi."
+            user_data["last_updated"] = time.time()
+            self._save_preferences()
+        return results
+
     def add_preference(self, chat_id: int, user_id: int, username: str, preference_type: str, preference_value: str, require_consent: bool = True, requesting_user_id: int = None):
         """Kullanıcının tercihini kaydeder."""
         # Güvenlik kontrolü: Sadece kendi tercihlerini kaydedebilir
@@ -38,8 +193,9 @@ class UserPreferences:
             return False, "❌ Başkasının adına tercih kaydedemezsiniz! Herkes sadece kendi tercihlerini belirleyebilir."
         
         key = self._get_key(chat_id, user_id)
+        self._remember(key)
         if key not in self.user_preferences:
-            self.user_preferences[key] = {
+            self._put(key, {
                 "chat_id": chat_id,
                 "user_id": user_id,
                 "username": username,
@@ -47,7 +203,7 @@ class UserPreferences:
                 "consent_given": False,
                 "last_updated": time.time(),
                 "created_by": user_id  # Kim oluşturdu
-            }
+            })
 
         user_data = self.user_preferences[key]
         
@@ -56,6 +212,7 @@ class UserPreferences:
             return False, "❌ Bu kullanıcının tercihlerini değiştirme yetkiniz yok!"
         
         user_data["username"] = username  # Kullanıcı adı güncellenebilir
+        self._invalidate(chat_id, user_id)
         
         # Eğer onay gerekiyorsa ve henüz verilmemişse, tercihi kaydetme
         if require_consent and not user_data.get("consent_given", False):
@@ -74,16 +231,49 @@ class UserPreferences:
 
     def get_chat_users_preferences(self, chat_id: int) -> List[Dict[str, Any]]:
         """Belirli bir chat'teki tüm kullanıcıların tercihlerini döndürür."""
-        users_preferences = []
-        for key, user_data in self.user_preferences.items():
-            if user_data["chat_id"] == chat_id:
-                users_preferences.append({
-                    "user_id": user_data["user_id"],
-                    "username": user_data["username"],
-                    "preferences": user_data["preferences"],
-                    "last_updated": user_data["last_updated"]
-                })
-        return users_preferences
+        return [
+            {
+                "user_id": user_data["user_id"],
+                "username": user_data["username"],
+                "preferences": user_data["preferences"],
+                "last_updated": user_data["last_updated"]
+            }
+            for user_data in self._by_chat.get(chat_id, {}).values()
+        ]
+
+    def get_prompt_fragment(self, chat_id: int, user_id: int) -> str:
+        """Kullanıcının tercihlerini prompt'a eklenecek hazır metin olarak döndürür (önbellekli)."""
+        key = self._get_key(chat_id, user_id)
+        fragment = self._fragments.get(key)
+        if fragment is None:
+            user_data = self.user_preferences.get(key)
+            if user_data is None:
+                return ""
+            fragment = ""
+            if user_data["preferences"]:
+                fragment = "\n\nBu kullanıcının tercihleri:\n"
+                for pref_type, pref_value in user_data["preferences"].items():
+                    fragment += f"- {pref_type}: {pref_value}\n"
+            self._fragments[key] = fragment
+        return fragment
+
+    def get_chat_prompt_block(self, chat_id: int) -> str:
+        """Gruptaki kullanıcıların tercihlerini tek prompt bloğu olarak döndürür (önbellekli).
+
+        En son güncellenen GROUP_PREFERENCES_PROMPT_USERS kullanıcı gösterilir.
+        """
+        block = self._chat_blocks.get(chat_id)
+        if block is None:
+            users = [user_data for user_data in self._by_chat.get(chat_id, {}).values() if user_data["preferences"]]
+            users.sort(key=lambda user_data: user_data["last_updated"], reverse=True)
+            block = ""
+            if users:
+                block = "\n\nGrup üyelerinin tercihleri:\n"
+                for user_data in users[:GROUP_PREFERENCES_PROMPT_USERS]:
+                    prefs = ", ".join(f"{pref_type}: {pref_value}" for pref_type, pref_value in user_data["preferences"].items())
+                    block += f"- {user_data['username']}: {prefs}\n"
+            self._chat_blocks[chat_id] = block
+        return block
 
     def update_preference(self, chat_id: int, user_id: int, username: str, preference_type: str, preference_value: str):
         """Mevcut tercihi günceller."""
@@ -93,23 +283,43 @@ class UserPreferences:
         """Belirli bir tercihi siler."""
         key = self._get_key(chat_id, user_id)
         if key in self.user_preferences and preference_type in self.user_preferences[key]["preferences"]:
+            self._remember(key)
             del self.user_preferences[key]["preferences"][preference_type]
             self.user_preferences[key]["last_updated"] = time.time()
+            self._invalidate(chat_id, user_id)
             self._save_preferences()
 
     def clear_user_preferences(self, chat_id: int, user_id: int):
         """Belirli bir kullanıcının tüm tercihlerini siler."""
         key = self._get_key(chat_id, user_id)
         if key in self.user_preferences:
-            del self.user_preferences[key]
+            self._remember(key)
+            self._drop(key)
             self._save_preferences()
 
     def clear_chat_preferences(self, chat_id: int):
         """Belirli bir chat'teki tüm kullanıcı tercihlerini siler."""
-        keys_to_delete = [key for key, user_data in self.user_preferences.items() if user_data["chat_id"] == chat_id]
+        keys_to_delete = [self._get_key(chat_id, user_id) for user_id in self._by_chat.get(chat_id, {})]
         for key in keys_to_delete:
-            del self.user_preferences[key]
-        self._save_preferences()
+            self._remember(key)
+            self._drop(key)
+        if keys_to_delete:
+            self._save_preferences()
+
+    def export_records(self, chat_id: int) -> List[Dict[str, Any]]:
+        """Sohbetteki tüm tercih kayıtlarının (dışa aktarım için) kopyaları."""
+        return [copy.deepcopy(user_data) for user_data in self._by_chat.get(chat_id, {}).values()]
+
+    def import_records(self, records: List[Dict[str, Any]]) -> int:
+        """Dışa aktarılmış tercih kayıtlarını tek kayıtla yükler; aynı kullanıcının kaydı değiştirilir."""
+        with self.transaction():
+            for user_data in records:
+                key = self._get_key(user_data["chat_id"], user_data["user_id"])
+                self._remember(key)
+                self._put(key, copy.deepcopy(user_data))
+            if records:
+                self._save_preferences()
+        return len(records)
 
     def give_consent(self, chat_id: int, user_id: int, username: str, requesting_user_id: int = None):
         """Kullanıcının tercih kaydetme onayını verir."""
@@ -118,8 +328,9 @@ class UserPreferences:
             return False, "❌ Başkasının adına onay veremezsiniz! Herkes sadece kendi onayını verebilir."
         
         key = self._get_key(chat_id, user_id)
+        self._remember(key)
         if key not in self.user_preferences:
-            self.user_preferences[key] = {
+            self._put(key, {
                 "chat_id": chat_id,
                 "user_id": user_id,
                 "username": username,
@@ -127,7 +338,7 @@ class UserPreferences:
                 "consent_given": True,
                 "last_updated": time.time(),
                 "created_by": user_id
-            }
+            })
         else:
             # Güvenlik kontrolü: Sadece tercih sahibi onay verebilir
             if "created_by" in self.user_preferences[key] and self.user_preferences[key]["created_by"] != user_id:
@@ -136,6 +347,7 @@ class UserPreferences:
             self.user_preferences[key]["consent_given"] = True
             self.user_preferences[key]["username"] = username
             self.user_preferences[key]["last_updated"] = time.time()
+            self._invalidate(chat_id, user_id)
         
         self._save_preferences()
         return True, "Onay başarıyla verildi."
@@ -152,9 +364,11 @@ class UserPreferences:
             if "created_by" in self.user_preferences[key] and self.user_preferences[key]["created_by"] != user_id:
                 return False, "❌ Bu kullanıcının adına onay geri alma yetkiniz yok!"
             
+            self._remember(key)
             self.user_preferences[key]["consent_given"] = False
             self.user_preferences[key]["preferences"] = {}
             self.user_preferences[key]["last_updated"] = time.time()
+            self._invalidate(chat_id, user_id)
             self._save_preferences()
         return True, "Onay başarıyla geri alındı."
 
@@ -167,25 +381,11 @@ class UserPreferences:
 
     def validate_preference(self, preference_type: str, preference_value: str) -> tuple[bool, str]:
         """Tercih değerinin geçerli olup olmadığını kontrol eder."""
-        # Güvenli tercih türleri
-        safe_types = ["hitap", "dil", "ton", "kişilik", "ilgi", "şair"]
-        
-        if preference_type not in safe_types:
+        if preference_type not in SAFE_PREFERENCE_VALUES:
             return False, f"'{preference_type}' güvenli bir tercih türü değil."
         
-        # Güvenli değerler
-        safe_values = {
-            "hitap": ["sen", "siz", "efendim", "kanka", "dost"],
-            "dil": ["eski türkçe", "modern türkçe", "arapça", "farsça"],
-            "ton": ["şakacı", "ciddi", "romantik", "nazik"],
-            "kişilik": ["gururlu", "itaatkar", "şakacı", "saygılı"],
-            "ilgi": ["şiir", "müzik", "kitap", "sanat", "edebiyat"],
-            "şair": ["nazım hikmet", "yahya kemal", "orhan veli", "cemal süreya", "attila ilhan"]
-        }
-        
-        if preference_type in safe_values:
-            if preference_value.lower() not in safe_values[preference_type]:
-                return False, f"'{preference_value}' geçerli bir {preference_type} değeri değil."
+        if preference_value.lower() not in SAFE_PREFERENCE_VALUES[preference_type]:
+            return False, f"'{preference_value}' geçerli bir {preference_type} değeri değil."
         
         return True, "Geçerli tercih değeri."
 